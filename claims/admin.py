@@ -1,7 +1,6 @@
 from django.contrib import admin
-from .models import Claim, Note
-from django.http import HttpResponse
-import csv
+from .models import Claim, ImportJob, Note
+from .exports import export_response
 from django.contrib.admin.sites import NotRegistered
 from .models import Note
 
@@ -16,6 +15,10 @@ class NoteInline(admin.TabularInline):
     readonly_fields = ("created_at", "created_by")
     fields = ("kind", "body", "created_by", "created_at")
 
+    def get_queryset(self, request):
+        # created_by is shown read-only on every row
+        return super().get_queryset(request).select_related("created_by")
+
 
 @admin.register(Claim)
 class ClaimAdmin(admin.ModelAdmin):
@@ -37,30 +40,34 @@ class ClaimAdmin(admin.ModelAdmin):
         ("Meta", {"fields": ("created_at",)}),
     )
 
-    # Bulk export selected claims to CSV
-    actions = ["export_selected"]
+    # Bulk export selected claims to CSV (streamed, see claims.exports)
+    actions = ["export_selected", "export_selected_gzip"]
 
     def export_selected(self, request, queryset):
-        resp = HttpResponse(content_type="text/csv")
-        resp["Content-Disposition"] = "attachment; filename=claims_export.csv"
-        w = csv.writer(resp)
-        w.writerow(["claim_id","patient_name","insurer","status","billed","paid","discharge","cpt_codes","denial"])
-        for c in queryset:
-            w.writerow([
-                c.claim_id, c.patient_name, c.insurer, c.get_status_display(),
-                c.billed_amount, c.paid_amount, c.discharge_date, c.cpt_codes, c.denial_reason
-            ])
-        return resp
+        return export_response(queryset)
     export_selected.short_description = "Export selected claims to CSV"
 
+    def export_selected_gzip(self, request, queryset):
+        return export_response(queryset, compress=True)
+    export_selected_gzip.short_description = "Export selected claims to CSV (gzip)"
+
 
 @admin.register(Note)
 class NoteAdmin(admin.ModelAdmin):
     list_display = ("claim", "kind", "created_by", "created_at")
+    list_select_related = ("claim", "created_by")
     list_filter = ("kind",)
     search_fields = ("claim__claim_id", "claim__patient_name", "body")
 
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "mode", "status", "rows_processed", "created_count", "updated_count", "created_by", "created_at")
+    list_filter = ("status", "mode")
+    list_select_related = ("created_by",)
+    readonly_fields = ("rows_processed", "created_count", "updated_count", "error", "created_at", "started_at", "finished_at")
+
+
 admin.site.site_header = "Claims Admin"
 admin.site.site_title = "Claims Admin"
 admin.site.index_title = "Administration"
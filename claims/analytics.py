@@ -0,0 +1,101 @@
+"""
+Underpayment / denial-rate / paid-ratio breakdowns by insurer, discharge
+month and CPT code over the full claim history.
+
+The full-history breakdown is read straight from the materialized ClaimStat
+rows (O(keys), independent of table size). Filtered breakdowns run one SQL
+GROUP BY over the matching claims (see stats.grouped_totals). Results are
+cached per (dimension, filters) for CLAIMS_ANALYTICS_TTL seconds, keyed on
+fragments.generation() so any claim write (which retires the fragment
+cache) also retires them, and the chart agrees with the ClaimStat counters.
+"""
+import hashlib
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import fragments, stats
+from .models import Claim, ClaimStat
+
+DIMENSIONS = ("insurer", "month", "cpt")
+FILTERS = ("status", "insurer", "date_from", "date_to")
+DEFAULT_TTL = 300
+
+
+def clean_filters(params):
+    """Keep only known, non-empty filters; bad dates are dropped rather than erroring."""
+    out = {}
+    for name in FILTERS:
+        value = (params.get(name) or "").strip()
+        if not value:
+            continue
+        if name.startswith("date_"):
+            try:
+                value = date.fromisoformat(value).isoformat()
+            except ValueError:
+                continue
+        out[name] = value
+    return out
+
+
+def filtered_claims(filters):
+    qs = Claim.objects.order_by()
+    if "status" in filters:
+        qs = qs.filter(status=filters["status"])
+    if "insurer" in filters:
+        qs = qs.filter(insurer=filters["insurer"])
+    if "date_from" in filters:
+        qs = qs.filter(discharge_date__gte=filters["date_from"])
+    if "date_to" in filters:
+        qs = qs.filter(discharge_date__lte=filters["date_to"])
+    return qs
+
+
+def _row(key, claims, denied, billed, paid, underpaid_claims, underpaid):
+    return {
+        "key": key,
+        "claims": claims,
+        "denied": denied,
+        "billed": billed,
+        "paid": paid,
+        "underpaid": underpaid,
+        "denial_rate": round(denied / claims, 4) if claims else 0.0,
+        "paid_ratio": round(float(paid / billed), 4) if billed else 0.0,
+    }
+
+
+def _materialized(dimension):
+    """Unfiltered breakdowns are exactly the pre-aggregated ClaimStat rows."""
+    rows = ClaimStat.objects.filter(dimension=dimension, claims__gt=0).values_list("key", *stats.COUNTERS)
+    return [_row(*r) for r in rows]
+
+
+def _aggregated(dimension, filters):
+    totals = stats.grouped_totals(filtered_claims(filters), dimension)
+    return [_row(key, *t) for key, t in totals.items()]
+
+
+def breakdown(dimension, filters=None):
+    """Rows for one dimension, largest underpayment first; cached per filter set."""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension: {dimension!r}")
+    filters = filters or {}
+    key = f"claims:analytics:{fragments.generation()}:" + hashlib.sha1(
+        json.dumps([dimension, sorted(filters.items())]).encode()
+    ).hexdigest()
+    rows = cache.get(key)
+    if rows is None:
+        rows = _aggregated(dimension, filters) if filters else _materialized(dimension)
+        rows.sort(key=lambda r: (-r["underpaid"], r["key"]))
+        cache.set(key, rows, getattr(settings, "CLAIMS_ANALYTICS_TTL", DEFAULT_TTL))
+    return rows
+
+
+def chart_rows(rows, limit=15):
+    """Top rows with a 0-100 bar width relative to the largest underpayment."""
+    rows = rows[:limit]
+    top = max((r["underpaid"] for r in rows), default=Decimal(0)) or Decimal(1)
+    return [dict(r, bar=int(r["underpaid"] * 100 / top)) for r in rows]
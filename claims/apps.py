@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from . import search
+    search.ensure_installed(connections[using])
+
+
+def check_numpy(app_configs, **kwargs):
+    # columnar.enabled() quietly stays on the database without NumPy
+    from django.conf import settings
+    from . import columnar
+    if getattr(settings, "CLAIMS_COLUMNAR", False) and columnar.np is None:
+        return [checks.Warning(
+            "CLAIMS_COLUMNAR is on but NumPy isn't installed, so list/search filters use the database",
+            hint="pip install -r requirements.txt", id="claims.W001",
+        )]
+    return []
 
 
 class ClaimsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'claims'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
+        checks.register(check_numpy)
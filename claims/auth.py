@@ -0,0 +1,37 @@
+"""
+request.user for the async views.
+
+AuthenticationMiddleware leaves request.user as a lazy object that loads the
+session and the user through the sync ORM the first time it's touched, which
+raises SynchronousOnlyOperation on the event loop (Django 4.2 has no
+request.auser() yet). aget_user() runs Django's own get_user() in a thread
+and pins the result on the request, so the auth / messages context
+processors see an already loaded user.
+
+alogin_required is login_required for async views; Django 4.2's decorators
+only wrap sync functions.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import auth
+from django.contrib.auth.views import redirect_to_login
+
+
+async def aget_user(request):
+    """The request's user (AnonymousUser if not signed in), loaded without blocking the loop."""
+    if not hasattr(request, "_cached_user"):
+        # same attribute AuthenticationMiddleware's lazy request.user caches into
+        request._cached_user = await sync_to_async(auth.get_user)(request)
+    request.user = request._cached_user
+    return request.user
+
+
+def alogin_required(view):
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapped
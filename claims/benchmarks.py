@@ -0,0 +1,162 @@
+"""
+Benchmark harness behind `manage.py benchmark_claims`.
+
+run_benchmarks() loads a synthetic dataset (claims.synthetic) through
+import_claims and times the hot paths through the test client: claim_search
+(uncached and cached), admin_dashboard, claim_detail and the CSV exports.
+parser_benchmark() is the database-free per-row cost of list parsing, the
+original list_records/coerce stages against the compiled ListParser.
+Results are plain JSON so a run can be stored as a baseline and later runs
+compared against it with compare().
+"""
+import platform
+import statistics
+import tempfile
+import time
+from io import StringIO
+from itertools import cycle
+from pathlib import Path
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .importer import coerce, list_records, parse_list, read_rows
+from .models import Claim
+from .pagination import ORDERING, encode_cursor
+from .synthetic import LIST_HEADER, generate, write_files
+
+DEFAULT_TOLERANCE = 0.25  # 25% slower than baseline counts as a regression
+
+# plain HTTP, no collectstatic manifest needed
+bench_settings = override_settings(
+    SECURE_SSL_REDIRECT=False,
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage",
+)
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return {"median": statistics.median(runs), "min": min(runs), "max": max(runs), "runs": repeat}
+
+
+def _get(client, url, params=None):
+    response = client.get(url, params or {})
+    assert response.status_code == 200, (url, response.status_code)
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _search_cases(rows):
+    middle = Claim.objects.order_by(*ORDERING)[rows // 2]
+    return {
+        "q": {"q": "rhodes"},
+        "status": {"status": "denied"},
+        "insurer": {"insurer": "Aetna"},
+        "cpt": {"cpt": "99204"},
+        "deep_page": {"cursor": encode_cursor(middle)},
+    }
+
+
+def _us_layout(line):
+    # same row with US dates and "$1,234.56" amounts: the slow paths of both parsers
+    claim_id, name, billed, paid, status, insurer, day = line.split("|")
+    money = lambda v: f"${float(v):,.2f}"
+    return "|".join((claim_id, name, money(billed), money(paid), status, insurer, f"{day[5:7]}/{day[8:]}/{day[:4]}"))
+
+
+def parser_benchmark(rows, seed=0, repeat=5):
+    """{name: timing} for parsing `rows` synthetic list lines, with microseconds per row."""
+    iso = [LIST_HEADER + "\n"] + [f"{line}\n" for line, _ in generate(rows, seed)]
+    layouts = {"iso": iso, "us": iso[:1] + [_us_layout(line.rstrip("\n")) + "\n" for line in iso[1:]]}
+    parsers = {
+        "before": lambda lines: coerce(list_records(read_rows(lines))),
+        "after": parse_list,
+    }
+    results = {}
+    for layout, lines in layouts.items():
+        expected = list(parsers["before"](lines))
+        assert list(parsers["after"](lines)) == expected, layout
+        for name, parse in parsers.items():
+            timing = timed(lambda: sum(1 for _ in parse(lines)), repeat)
+            timing["us_per_row"] = timing["median"] / rows * 1e6
+            results[f"parse_rows[{layout},{name}]"] = timing
+    return results
+
+
+def run_benchmarks(rows, seed=0, repeat=5, progress=None):
+    """Time everything against the current (empty) database; returns the results dict."""
+    say = progress or (lambda msg: None)
+    results = {}
+    fragments = caches["fragments"]
+
+    say("parse_rows")
+    results.update(parser_benchmark(rows, seed, repeat))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        list_path, detail_path = Path(tmp) / "list.csv", Path(tmp) / "detail.csv"
+        say(f"generating {rows:,} claims")
+        write_files(list_path, detail_path, rows, seed=seed)
+        args = ("import_claims", "--list", str(list_path), "--detail", str(detail_path))
+        for name in ("import_claims", "import_claims_update"):  # second pass updates every row
+            say(name)
+            results[name] = timed(lambda: call_command(*args, stdout=StringIO()), 1)
+            results[name]["rows_per_sec"] = rows / results[name]["median"]
+
+    user = get_user_model().objects.create_superuser("benchmark", password="benchmark")
+    client = Client()
+    client.force_login(user)
+
+    with bench_settings:
+        for case, params in _search_cases(rows).items():
+            say(f"claim_search[{case}]")
+
+            def uncached():
+                fragments.clear()
+                _get(client, reverse("claims:search"), params)
+            results[f"claim_search[{case}]"] = timed(uncached, repeat)
+
+        _get(client, reverse("claims:search"), {"q": "rhodes"})
+        results["claim_search[cached]"] = timed(lambda: _get(client, reverse("claims:search"), {"q": "rhodes"}), repeat)
+
+        say("admin_dashboard")
+        results["admin_dashboard"] = timed(lambda: _get(client, reverse("claims:admin_dashboard")), repeat)
+
+        say("claim_detail")
+        pks = cycle(Claim.objects.order_by("claim_id").values_list("pk", flat=True)[::max(1, rows // repeat)])
+        results["claim_detail"] = timed(lambda: _get(client, reverse("claims:detail", args=[next(pks)])), repeat)
+
+        for name, params in (("export_csv", {}), ("export_csv_gzip", {"gzip": "1"})):
+            say(name)
+            results[name] = timed(lambda: _get(client, reverse("claims:export"), params), min(repeat, 3))
+
+    return {
+        "meta": {
+            "rows": rows, "seed": seed, "repeat": repeat,
+            "database": connection.vendor, "python": platform.python_version(),
+            "django": django.get_version(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "timings": results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """[(name, baseline_s, current_s, ratio, regressed)] for timings present in both runs."""
+    out = []
+    base = baseline.get("timings", {})
+    for name, timing in current["timings"].items():
+        if name not in base:
+            continue
+        before, now = base[name]["median"], timing["median"]
+        ratio = now / before if before else 1.0
+        out.append((name, before, now, ratio, ratio > 1 + tolerance))
+    return out
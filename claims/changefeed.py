@@ -0,0 +1,76 @@
+"""
+The incremental sync feed behind /claims/changes/.
+
+page(since) returns the ChangeLog entries after `since` in seq order, each
+with the row as it is now (None once it's been deleted), plus the seq to ask
+from next time. A consumer keeps that seq and polls; a "reset" entry means
+its copy may be stale wholesale and it should re-export (or re-read the feed
+from 0 after a compaction).
+
+On Postgres seqs are handed out before commit, so a lower seq can become
+visible after a higher one. A page stops before a hole in seq until the
+entry after it is GAP_WAIT old; by then the hole is a rolled-back
+transaction (or a compacted entry), not one still committing.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import ChangeLog, Claim, Note
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+GAP_WAIT = timedelta(seconds=60)
+
+CLAIM_FIELDS = ("id", "claim_id", "patient_name", "billed_amount", "paid_amount", "status", "insurer",
+                "discharge_date", "cpt_codes", "denial_reason", "underpayment", "created_at")
+
+
+def _claims(pks):
+    return {row["id"]: row for row in Claim.objects.filter(pk__in=pks).values(*CLAIM_FIELDS)}
+
+
+def _notes(pks):
+    rows = Note.objects.filter(pk__in=pks).values_list(
+        "id", "claim_id", "kind", "body", "created_by__username", "created_at")
+    return {
+        pk: {"id": pk, "claim": claim, "kind": kind, "body": body, "created_by": user, "created_at": at}
+        for pk, claim, kind, body, user, at in rows
+    }
+
+
+def _settled(entries, since):
+    """The entries before the first hole in seq that a transaction may still fill."""
+    cutoff = timezone.now() - GAP_WAIT
+    last = since
+    for i, (seq, _, _, _, at) in enumerate(entries):
+        if seq != last + 1 and at > cutoff:
+            return entries[:i]
+        last = seq
+    return entries
+
+
+def page(since=0, limit=DEFAULT_LIMIT):
+    """{"changes": [...], "next": seq, "more": bool}; two or three queries whatever the page size."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    entries = list(
+        ChangeLog.objects.filter(seq__gt=since).order_by("seq")
+        .values_list("seq", "action", "kind", "object_id", "created_at")[:limit + 1]
+    )
+    settled = _settled(entries[:limit], since)
+    more = len(entries) > limit and len(settled) == limit  # held back at a hole: poll again later
+    entries = settled
+    wanted = {ChangeLog.Kind.CLAIM: set(), ChangeLog.Kind.NOTE: set()}
+    for _, action, kind, pk, _ in entries:
+        if action == ChangeLog.Action.SAVE:
+            wanted[kind].add(pk)
+    current = {
+        ChangeLog.Kind.CLAIM: _claims(wanted[ChangeLog.Kind.CLAIM]) if wanted[ChangeLog.Kind.CLAIM] else {},
+        ChangeLog.Kind.NOTE: _notes(wanted[ChangeLog.Kind.NOTE]) if wanted[ChangeLog.Kind.NOTE] else {},
+    }
+    changes = [
+        {"seq": seq, "action": action, "kind": kind, "id": pk, "at": at,
+         "data": current[kind].get(pk) if action == ChangeLog.Action.SAVE else None}
+        for seq, action, kind, pk, at in entries
+    ]
+    return {"changes": changes, "next": changes[-1]["seq"] if changes else since, "more": more}
@@ -0,0 +1,282 @@
+"""
+Optional in-memory column store for the claim list / search hot path.
+
+With settings.CLAIMS_COLUMNAR on and NumPy installed, each process keeps one
+array per column (pk, claim_id, status code, insurer id, discharge date
+ordinal, billed / paid / underpayment in cents) and answers claim_search
+style filters and the top underpayments with vectorized masks. Only the rows
+of the page actually shown are then read from the database.
+
+The arrays follow the ChangeLog: every lookup first applies the entries
+written since the last seq it saw (changed claims are re-read by pk, deleted
+ones masked out). A RESET entry or a long backlog reloads everything.
+
+What the arrays can't answer (free-text q on patient names, cpt) comes back
+as None and the caller queries the database as before.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import ChangeLog, Claim
+from .pagination import PAGE_SIZE, decode_cursor, encode_cursor
+from .search import claim_id_ranges
+
+try:
+    import numpy as np
+except ImportError:  # optional; without it everything stays on the database
+    np = None
+
+COLUMNS = ("pk", "claim_id", "status", "insurer", "discharge_date", "billed_amount", "paid_amount", "underpayment")
+STATUSES = [value for value, _ in Claim.Status.choices]
+LOAD_CHUNK = 20000
+MAX_BACKLOG = 20000   # more changes than this since the last look: reload instead
+GAP_TIMEOUT = 60      # seconds a missing seq is re-checked for (a transaction still committing)
+MAX_GAPS = 1000
+
+
+def enabled():
+    return np is not None and getattr(settings, "CLAIMS_COLUMNAR", False)
+
+
+def _cents(amount):
+    return int(amount.scaleb(2))
+
+
+class ClaimColumns:
+    """The arrays, sorted by pk. Reads and refreshes share one lock."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.seq = None  # ChangeLog position the arrays reflect; None = not loaded
+        self.gaps = {}   # skipped seq -> when first noticed
+
+    # ---------- building ----------
+    def _columns(self, rows):
+        """Arrays for a list of COLUMNS tuples; new insurers get ids on the way."""
+        ids = self.insurer_ids
+        for row in rows:
+            if row[3] not in ids:
+                ids[row[3]] = len(self.insurers)
+                self.insurers.append(row[3])
+        codes = {s: i for i, s in enumerate(STATUSES)}
+        n = len(rows)
+        return {
+            "pk": np.fromiter((r[0] for r in rows), np.int64, n),
+            "claim_id": np.fromiter((r[1] for r in rows), np.int64, n),
+            "status": np.fromiter((codes.get(r[2], -1) for r in rows), np.int8, n),
+            "insurer": np.fromiter((ids[r[3]] for r in rows), np.int32, n),
+            "day": np.fromiter((r[4].toordinal() for r in rows), np.int32, n),
+            "billed": np.fromiter((_cents(r[5]) for r in rows), np.int64, n),
+            "paid": np.fromiter((_cents(r[6]) for r in rows), np.int64, n),
+            "under": np.fromiter((_cents(r[7]) for r in rows), np.int64, n),
+        }
+
+    def _set(self, cols):
+        self.cols = cols
+        self.alive = np.ones(len(cols["pk"]), bool)
+        # keyset order (discharge_date desc, id desc) as one sortable number
+        self.order = (cols["day"].astype(np.int64) << 32) | cols["pk"]
+        self.perm = None
+
+    def load(self):
+        with self.lock:
+            # read the position first: anything written meanwhile is applied again, harmlessly
+            seq = ChangeLog.last_seq()
+            self.insurers, self.insurer_ids = [], {}
+            chunks = []
+            rows = Claim.objects.order_by("pk").values_list(*COLUMNS).iterator(chunk_size=LOAD_CHUNK)
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == LOAD_CHUNK:
+                    chunks.append(self._columns(batch))
+                    batch = []
+            chunks.append(self._columns(batch))
+            self._set({name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]})
+            self.seq, self.gaps = seq, {}
+
+    # ---------- following the change log ----------
+    def refresh(self):
+        with self.lock:
+            if self.seq is None:
+                return self.load()
+            log = ChangeLog.objects.filter(seq__gt=self.seq)
+            if self.gaps:
+                log = log | ChangeLog.objects.filter(seq__in=list(self.gaps))
+            # note entries are read too, only to move seq past them
+            changes = list(log.order_by("seq").values_list("seq", "action", "kind", "object_id")[:MAX_BACKLOG + 1])
+            if not changes:
+                self._expire_gaps()
+                return
+            if len(changes) > MAX_BACKLOG or any(a == ChangeLog.Action.RESET for _, a, _, _ in changes):
+                return self.load()
+            pks = {pk for _, _, kind, pk in changes if kind == ChangeLog.Kind.CLAIM}
+            if pks:
+                self._apply(pks)
+            self._track_gaps([seq for seq, _, _, _ in changes])
+
+    def _track_gaps(self, seqs):
+        # on Postgres a lower seq can commit after a higher one: remember the
+        # holes and look for them again until they show up or time out
+        now = time.monotonic()
+        for seq in seqs:
+            self.gaps.pop(seq, None)
+        last = self.seq
+        for seq in seqs:
+            if seq > last:
+                for missing in range(last + 1, min(seq, last + 1 + MAX_GAPS)):
+                    self.gaps.setdefault(missing, now)
+                last = seq
+        self.seq = last
+        self._expire_gaps()
+
+    def _expire_gaps(self):
+        cutoff = time.monotonic() - GAP_TIMEOUT
+        self.gaps = dict(sorted((s, t) for s, t in self.gaps.items() if t > cutoff)[-MAX_GAPS:])
+
+    def _apply(self, pks):
+        pks = sorted(pks)
+        rows = []
+        for i in range(0, len(pks), LOAD_CHUNK):
+            rows += Claim.objects.filter(pk__in=pks[i:i + LOAD_CHUNK]).order_by("pk").values_list(*COLUMNS)
+        cols = self.cols
+        gone = np.array(pks, np.int64)
+        pos = np.searchsorted(cols["pk"], gone)
+        known = pos < len(cols["pk"])
+        known[known] = cols["pk"][pos[known]] == gone[known]
+        self.alive[pos[known]] = False  # deleted, unless the row is read back below
+
+        if not rows:
+            return
+        new = self._columns(rows)
+        pos = np.searchsorted(cols["pk"], new["pk"])
+        inside = pos < len(cols["pk"])
+        inside[inside] = cols["pk"][pos[inside]] == new["pk"][inside]
+        for name, values in new.items():
+            cols[name][pos[inside]] = values[inside]
+        self.alive[pos[inside]] = True
+        order = (new["day"][inside].astype(np.int64) << 32) | new["pk"][inside]
+        if (self.order[pos[inside]] != order).any():
+            self.order[pos[inside]] = order
+            self.perm = None  # a discharge date moved; status / amount edits keep the sort
+
+        added = ~inside
+        if added.any():
+            alive = np.concatenate([self.alive, np.ones(int(added.sum()), bool)])
+            merged = {name: np.concatenate([cols[name], new[name][added]]) for name in cols}
+            if len(cols["pk"]) and new["pk"][added][0] < cols["pk"][-1]:
+                # new pks normally come after every existing one; re-sort if not
+                by_pk = np.argsort(merged["pk"], kind="stable")
+                merged, alive = {name: values[by_pk] for name, values in merged.items()}, alive[by_pk]
+            self._set(merged)
+            self.alive = alive
+        if (~self.alive).sum() > len(self.alive) // 10:  # drop the dead rows now and then
+            self._set({name: values[self.alive] for name, values in self.cols.items()})
+
+    # ---------- queries ----------
+    def _keyset(self):
+        """Row positions in keyset order, and their negated order keys (ascending, for searchsorted)."""
+        if self.perm is None:
+            self.perm = np.argsort(-self.order, kind="stable")
+            self.neg_order = -self.order[self.perm]
+        return self.perm, self.neg_order
+
+    def _matching(self, idx, status, insurers, claim_ids):
+        cols = self.cols
+        keep = self.alive[idx]
+        if status is not None:
+            keep &= cols["status"][idx] == status
+        if insurers is not None:
+            keep &= np.isin(cols["insurer"][idx], insurers)
+        if claim_ids is not None:
+            ids = cols["claim_id"][idx]
+            in_range = np.zeros(len(idx), bool)
+            for low, high in claim_ids:
+                in_range |= (ids >= low) & (ids <= high)
+            keep &= in_range
+        return idx[keep]
+
+    def page_pks(self, status="", insurer="", claim_ids=None, cursor=None, size=PAGE_SIZE):
+        """Up to size + 1 pks in keyset order after `cursor`; claim_ids are search.claim_id_ranges()."""
+        with self.lock:
+            code = (STATUSES.index(status) if status in STATUSES else -2) if status else None
+            needle = insurer.lower()
+            insurers = [i for i, name in enumerate(self.insurers) if needle in name.lower()] if insurer else None
+            perm, neg_order = self._keyset()
+            start = 0
+            key = decode_cursor(cursor)
+            if key:
+                day, pk = key
+                pk = min(pk, (1 << 32) - 1)  # the low 32 bits of an order key
+                start = int(np.searchsorted(neg_order, -((day.toordinal() << 32) | pk), side="right"))
+            # walk the sorted positions in growing blocks until the page is full,
+            # so a first page looks at a few hundred rows, not all of them
+            want = size + 1
+            block = len(perm) if claim_ids is not None else want * 4
+            found, count = [], 0
+            while start < len(perm) and count < want:
+                hits = self._matching(perm[start:start + block], code, insurers, claim_ids)
+                found.append(hits)
+                count += len(hits)
+                start += block
+                block *= 4
+            idx = np.concatenate(found)[:want] if found else np.empty(0, np.int64)
+            return self.cols["pk"][idx].tolist()
+
+    def top_underpaid_pks(self, n):
+        with self.lock:
+            idx = np.flatnonzero(self.alive & (self.cols["under"] > 0))
+            under = self.cols["under"][idx]
+            if len(idx) > n:
+                top = np.argpartition(-under, n - 1)[:n]
+                idx, under = idx[top], under[top]
+            return self.cols["pk"][idx[np.lexsort((-self.cols["pk"][idx], -under))]].tolist()  # ties: newest first
+
+
+_columns = ClaimColumns()
+
+
+def columns():
+    """This process's arrays, caught up with the change log."""
+    _columns.refresh()
+    return _columns
+
+
+def _fetch(pks):
+    rows = Claim.objects.in_bulk(pks)
+    return [rows[pk] for pk in pks if pk in rows]  # a row deleted since the refresh just drops out
+
+
+def claims_page(params, size=PAGE_SIZE):
+    """
+    keyset_page() for claim_search / claim_list params, answered from the
+    arrays: (claims, next_cursor), or None when the database has to do it.
+    """
+    if not enabled():
+        return None
+    term = params.get("q", "").strip()
+    claim_ids = claim_id_ranges(term) if term else None
+    if params.get("cpt", "").strip() or (term and claim_ids is None):
+        return None
+    if claim_ids == []:
+        return [], None
+    pks = columns().page_pks(params.get("status", ""), params.get("insurer", ""), claim_ids,
+                             params.get("cursor"), size)
+    claims = _fetch(pks[:size])
+    return claims, (encode_cursor(claims[-1]) if len(pks) > size and claims else None)
+
+
+async def aclaims_page(params, size=PAGE_SIZE):
+    if not enabled():
+        return None
+    return await sync_to_async(claims_page)(params, size)
+
+
+def top_underpaid(n=10):
+    """The n largest underpayments (Claim objects), or None when disabled."""
+    if not enabled():
+        return None
+    return _fetch(columns().top_underpaid_pks(n))
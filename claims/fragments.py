@@ -0,0 +1,113 @@
+"""
+Rendered claim_search row fragments, cached per normalized
+(q, status, insurer, cpt, cursor) in the "fragments" cache (LRU LocMem by
+default, see settings.CACHES).
+
+Every key embeds a generation number: the last ChangeLog seq. Every claim
+write (save/delete signals, flag_for_review, import batches, overwrite and
+restore RESETs) adds a change-log row in its transaction, so the generation
+moves on commit, in the database every process reads, and every cached page
+is orphaned at once; the old entries just age out of the LRU. A search
+racing the write reads the old seq and so can only re-cache the old rows
+under the old generation. (On Postgres a lower seq can commit after a
+higher one; pages cached in between last until the cache TIMEOUT.)
+
+aget_or_render() is the async view flavour. It still uses the sync cache API:
+LocMem is an in-process dict and the file backend a small local read, both
+fine to do on the event loop, whereas BaseCache's aget()/aset() would push
+each call onto a thread.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import ChangeLog
+
+PARAMS = ("q", "status", "insurer", "cpt", "cursor")
+CASE_INSENSITIVE = ("q", "insurer")  # search and insurer filters ignore case
+HITS_KEY = "claims:rows:hits"
+MISSES_KEY = "claims:rows:misses"
+
+
+def _cache():
+    return caches[getattr(settings, "CLAIMS_FRAGMENT_CACHE", "fragments")]
+
+
+def _incr(cache, key):
+    try:
+        return cache.incr(key)
+    except ValueError:  # first use, or evicted
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def generation():
+    return ChangeLog.last_seq()
+
+
+async def ageneration():
+    return await ChangeLog.alast_seq()
+
+
+def normalize(params):
+    out = {}
+    for name in PARAMS:
+        value = " ".join((params.get(name) or "").split())
+        if name in CASE_INSENSITIVE:
+            value = value.lower()
+        if value:
+            out[name] = value
+    return out
+
+
+def cache_key(params, gen):
+    digest = hashlib.sha1(json.dumps(normalize(params), sort_keys=True).encode()).hexdigest()
+    return f"claims:rows:{gen}:{digest}"
+
+
+def _lookup(params, gen):
+    cache = _cache()
+    key = cache_key(params, gen)
+    html = cache.get(key)
+    if html is not None:
+        _incr(cache, HITS_KEY)
+    return cache, key, html
+
+
+def _store(cache, key, html):
+    cache.set(key, html)
+    _incr(cache, MISSES_KEY)
+
+
+def get_or_render(params, render):
+    """(html, hit): the cached fragment for these params, or render() and store it."""
+    cache, key, html = _lookup(params, generation())
+    if html is not None:
+        return html, True
+    html = render()
+    _store(cache, key, html)
+    return html, False
+
+
+async def aget_or_render(params, render):
+    """get_or_render() for async views; `render` is a coroutine function."""
+    cache, key, html = _lookup(params, await ageneration())
+    if html is not None:
+        return html, True
+    html = await render()
+    _store(cache, key, html)
+    return html, False
+
+
+def counters():
+    cache = _cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "generation": generation(),
+    }
@@ -0,0 +1,633 @@
+"""
+Streaming claim import pipeline shared by the import_claims command and the
+csv_upload view.
+
+Every stage is a generator, so only the current row (plus one write batch)
+is held in memory:
+
+    read_rows -> list_records -> coerce -> join_details -> BulkClaimWriter
+
+The detail file is the one input that has to be indexed before joining; small
+files go into a dict, large ones into a temporary SQLite file (see detail_index).
+"""
+import csv
+import sqlite3
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import stats
+from .models import CONTENT_FIELDS, ChangeLog, Claim, ClaimCPT, content_hash
+
+# Fields written by the importers (everything except claim_id / created_at)
+CLAIM_FIELDS = CONTENT_FIELDS
+
+# ... plus the columns derived from them on every write
+WRITE_FIELDS = CLAIM_FIELDS + ("underpayment", "content_hash")
+
+DEFAULT_BATCH_SIZE = 1000
+JOIN_CHUNK_SIZE = 1000
+RECONCILE_CHUNK = 1000  # claims deleted per transaction by delete_missing
+# detail files above this many bytes are joined through a temporary on-disk index
+DETAIL_MEMORY_LIMIT = 32 * 1024 * 1024
+
+STATUS_MAP = {
+    'denied': 'denied', 'deny': 'denied',
+    'paid': 'paid',
+    'under review': 'review', 'review': 'review', 'in review': 'review'
+}
+
+# Accepted header aliases per field (headers are compared lower-cased)
+LIST_ALIASES = {
+    "claim_id": ("claim_id", "claim id", "claimid", "claim_no", "id"),
+    "patient_name": ("patient_name", "patient", "patient name", "name"),
+    "billed_amount": ("billed_amount", "billed", "billed amount"),
+    "paid_amount": ("paid_amount", "paid"),
+    "status": ("status",),
+    "insurer": ("insurer", "insurer_name", "payer", "insurance", "insurer name"),
+    "discharge_date": ("discharge_date", "discharge date", "date", "service date"),
+    # optional: a list file may carry its own clinical columns
+    "cpt_codes": ("cpt_codes", "cpt codes", "cpt"),
+    "denial_reason": ("denial_reason", "denial reason", "denial"),
+}
+
+
+# ---------- helpers ----------
+def to_decimal(v, default="0"):
+    s = "" if v is None else str(v)
+    s = s.replace("$", "").replace(",", "").strip()
+    if s == "":
+        s = default
+    try:
+        return Decimal(s)
+    except InvalidOperation:
+        return Decimal(default)
+
+def to_date(v):
+    s = (v or "").strip()
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(s).date()  # e.g. a timestamp, as the old upload view took
+    except ValueError:
+        raise ValueError(f"Unrecognized date: {v!r}") from None
+
+def normalize_headers(headers):
+    return [h.strip().lower() for h in headers]
+
+def get_first(row_dict, *keys):
+    for k in keys:
+        if k in row_dict and row_dict[k] not in (None, ""):
+            return row_dict[k]
+    return None
+
+def open_lines(path):
+    """Lines of a file on disk, decoded lazily."""
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from f
+
+
+# ---------- pipeline stages ----------
+def read_rows(lines, delimiter="|"):
+    """
+    Stage 1: split lines into (headers, row) pairs.
+    Always use csv.reader to tolerate a header squeezed into one cell.
+    """
+    r = csv.reader(lines, delimiter=delimiter)
+    headers_norm = normalize_headers(next(r, []))
+    for row in r:
+        if not row:
+            continue
+        # pad short rows; extra cells are kept (details join them as CPT codes)
+        if len(row) < len(headers_norm):
+            row = row + [""] * (len(headers_norm) - len(row))
+        yield headers_norm, row
+
+def list_records(rows, aliases=LIST_ALIASES):
+    """Stage 2: map aliased headers onto field names; drop rows without an integer claim_id."""
+    for headers_norm, row in rows:
+        row_dict = dict(zip(headers_norm, row))
+        claim_id_val = get_first(row_dict, *aliases["claim_id"])
+        if not claim_id_val:
+            continue
+        try:
+            claim_id = int(str(claim_id_val).strip())
+        except ValueError:
+            continue
+        rec = {field: get_first(row_dict, *keys) for field, keys in aliases.items() if field != "claim_id"}
+        rec["claim_id"] = claim_id
+        yield rec
+
+def coerce(records):
+    """Stage 3: typed (claim_id, defaults) pairs ready for the writer."""
+    for rd in records:
+        status_raw = (rd.get("status") or "review").strip().lower()
+        yield rd["claim_id"], {
+            "patient_name": rd.get("patient_name") or "",
+            "billed_amount": to_decimal(rd.get("billed_amount")),
+            "paid_amount": to_decimal(rd.get("paid_amount")),
+            "status": STATUS_MAP.get(status_raw, "review"),
+            "insurer": rd.get("insurer") or "",
+            "discharge_date": to_date(rd.get("discharge_date")),
+            "cpt_codes": rd.get("cpt_codes") or "",
+            "denial_reason": rd.get("denial_reason") or "",
+        }
+
+def detail_records(lines):
+    """
+    detail format (| delimited):
+    id | claim_id | denial_reason | cpt_codes | [extra CPT columns...]
+    Join columns 4..N as comma-separated CPT codes.
+    """
+    for _headers, row in read_rows(lines):
+        if len(row) < 2:
+            continue
+        try:
+            claim_id = int(row[1].strip())
+        except ValueError:
+            continue
+        denial = row[2].strip() if len(row) > 2 else ""
+        cpts = [x.strip() for x in row[3:] if x and x.strip()]
+        yield claim_id, denial, ",".join(cpts)
+
+# ---------- compiled stages 2-3 ----------
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%d-%m-%Y")
+SAMPLE_ROWS = 200
+
+
+# zero-padded layouts of DATE_FORMATS: (year, month, day) slices and the separator positions
+DATE_LAYOUTS = {
+    "%Y-%m-%d": (slice(0, 4), slice(5, 7), slice(8, 10), "-", 4, 7),
+    "%m/%d/%Y": (slice(6, 10), slice(0, 2), slice(3, 5), "/", 2, 5),
+    "%d/%m/%Y": (slice(6, 10), slice(3, 5), slice(0, 2), "/", 2, 5),
+    "%d-%m-%Y": (slice(6, 10), slice(3, 5), slice(0, 2), "-", 2, 5),
+}
+
+
+def _fixed_date(fmt):
+    """date parser for one 10-character layout; None when a value doesn't fit it (no exceptions)."""
+    y, m, d, sep, a, b = DATE_LAYOUTS[fmt]
+
+    def parse(s):
+        if len(s) != 10 or s[a] != sep or s[b] != sep:
+            return None
+        digits = s[y] + s[m] + s[d]
+        if not (digits.isascii() and digits.isdigit()):
+            return None
+        try:
+            return date(int(s[y]), int(s[m]), int(s[d]))
+        except ValueError:  # e.g. 02/30
+            return None
+    return parse
+
+
+def detect_date_format(values):
+    """The DATE_FORMATS entry most of the sample values parse with (earlier formats win ties)."""
+    best, best_hits = DATE_FORMATS[0], 0
+    for fmt in DATE_FORMATS:
+        parse = _fixed_date(fmt)
+        hits = sum(parse(v.strip()) is not None for v in values if v)
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+    return best
+
+
+def parse_decimal(v):
+    """to_decimal() for the common case: plain numbers skip the $ / , clean-up."""
+    if v:
+        try:
+            return Decimal(v)
+        except InvalidOperation:
+            pass
+    return to_decimal(v)
+
+
+class ListParser:
+    """
+    list_records() + coerce() for one file, compiled from its header row and
+    a sample of data rows: each field's candidate columns are looked up once,
+    and discharge dates are read in the file's own layout (detected from the
+    sample) by slicing, with to_date() only for values that don't fit it.
+    Plain data, so it can be pickled to parallel_import's workers.
+    """
+
+    def __init__(self, headers, sample=(), aliases=LIST_ALIASES):
+        headers = normalize_headers(headers)
+        position = {h: i for i, h in enumerate(headers)}  # repeated header: last column wins, like dict(zip())
+        self.width = len(headers)
+        self.columns = {field: tuple(position[k] for k in keys if k in position) for field, keys in aliases.items()}
+        self.date_format = detect_date_format([self._get(self._pad(row), "discharge_date") or "" for row in sample])
+
+    def _pad(self, row):
+        return row + [""] * (self.width - len(row)) if len(row) < self.width else row
+
+    def _get(self, row, field):
+        # get_first(): the first candidate column with a value
+        for i in self.columns[field]:
+            if row[i]:
+                return row[i]
+        return None
+
+    def parse(self, rows):
+        """(claim_id, defaults) for raw csv rows; same results as coerce(list_records(...))."""
+        get, pad = self._get, self._pad
+        parse_date = _fixed_date(self.date_format)
+        statuses = {}
+        for row in rows:
+            if not row:
+                continue
+            row = pad(row)
+            claim_id = get(row, "claim_id")
+            if not claim_id:
+                continue
+            try:
+                claim_id = int(claim_id)
+            except ValueError:
+                continue
+            status_raw = get(row, "status")
+            status = statuses.get(status_raw)
+            if status is None:
+                status = statuses[status_raw] = STATUS_MAP.get((status_raw or "review").strip().lower(), "review")
+            discharge = get(row, "discharge_date")
+            yield claim_id, {
+                "patient_name": get(row, "patient_name") or "",
+                "billed_amount": parse_decimal(get(row, "billed_amount")),
+                "paid_amount": parse_decimal(get(row, "paid_amount")),
+                "status": status,
+                "insurer": get(row, "insurer") or "",
+                "discharge_date": (discharge and parse_date(discharge.strip())) or to_date(discharge),
+                "cpt_codes": get(row, "cpt_codes") or "",
+                "denial_reason": get(row, "denial_reason") or "",
+            }
+
+    @classmethod
+    def sampled(cls, rows, sample_rows=SAMPLE_ROWS):
+        """(parser, rows) from a csv row iterator whose first row is the header; the sample is put back."""
+        rows = iter(rows)
+        headers = next(rows, [])
+        sample = list(islice(rows, sample_rows))
+        return cls(headers, sample), chain(sample, rows)
+
+
+def parse_list(lines, delimiter="|", parser=None):
+    """Typed (claim_id, defaults) pairs from list-file lines (header included); reads nothing until iterated."""
+    rows = csv.reader(lines, delimiter=delimiter)
+    if parser is None:
+        parser, rows = ListParser.sampled(rows)
+    else:
+        next(rows, None)
+    yield from parser.parse(rows)
+
+
+# ---------- detail join strategies ----------
+class MemoryDetailIndex:
+    """claim_id -> (denial_reason, cpt_codes) in a dict; later rows win like the old loader."""
+    join_chunk = 1  # dict lookups gain nothing from batching, so the join stays row by row (lazy)
+
+    def __init__(self, records):
+        self.data = {claim_id: (denial, cpts) for claim_id, denial, cpts in records}
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_many(self, claim_ids):
+        data = self.data
+        return {cid: data[cid] for cid in claim_ids if cid in data}
+
+    def close(self):
+        self.data = {}
+
+
+class DiskDetailIndex:
+    """
+    Same interface, backed by a private temporary SQLite file so detail files
+    larger than RAM can be joined. SQLite deletes the file when closed.
+    """
+    LOOKUP_CHUNK = 500  # stay under SQLITE_MAX_VARIABLE_NUMBER on old builds
+    join_chunk = JOIN_CHUNK_SIZE
+
+    def __init__(self, records, batch_size=10000):
+        self.db = sqlite3.connect("")  # "" = anonymous on-disk temp database
+        self.db.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            PRAGMA cache_size = -16000;
+            CREATE TABLE details (claim_id INTEGER PRIMARY KEY, denial TEXT, cpts TEXT);
+        """)
+        batch = []
+        for rec in records:
+            batch.append(rec)
+            if len(batch) >= batch_size:
+                self._insert(batch)
+                batch = []
+        self._insert(batch)
+        self.db.commit()
+
+    def _insert(self, batch):
+        self.db.executemany("INSERT OR REPLACE INTO details VALUES (?, ?, ?)", batch)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM details").fetchone()[0]
+
+    def get_many(self, claim_ids):
+        ids = list(claim_ids)
+        out = {}
+        for i in range(0, len(ids), self.LOOKUP_CHUNK):
+            chunk = ids[i:i + self.LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for cid, denial, cpts in self.db.execute(
+                f"SELECT claim_id, denial, cpts FROM details WHERE claim_id IN ({marks})", chunk
+            ):
+                out[cid] = (denial, cpts)
+        return out
+
+    def close(self):
+        self.db.close()
+
+
+def detail_index(lines, size=None, strategy="auto"):
+    """
+    Pick a join strategy for a detail file.
+    auto: dict for files up to CLAIMS_DETAIL_MEMORY_LIMIT bytes (or of unknown size),
+    temporary SQLite index above that.
+    """
+    return index_details(detail_records(lines), size, strategy)
+
+def index_details(records, size=None, strategy="auto"):
+    """detail_index() for already parsed (claim_id, denial, cpts) records."""
+    if strategy == "auto":
+        limit = getattr(settings, "CLAIMS_DETAIL_MEMORY_LIMIT", DETAIL_MEMORY_LIMIT)
+        strategy = "disk" if size is not None and size > limit else "memory"
+    if strategy == "disk":
+        return DiskDetailIndex(records)
+    return MemoryDetailIndex(records)
+
+def join_details(pairs, details=None, chunk_size=None):
+    """Stage 4: overlay detail columns onto list rows, looking ids up details.join_chunk at a time."""
+    if details is None:
+        yield from pairs
+        return
+    chunk_size = chunk_size or details.join_chunk
+    pairs = iter(pairs)
+    while True:
+        chunk = list(islice(pairs, chunk_size))
+        if not chunk:
+            return
+        found = details.get_many(claim_id for claim_id, _ in chunk)
+        for claim_id, defaults in chunk:
+            d = found.get(claim_id)
+            if d is not None:
+                defaults["denial_reason"], defaults["cpt_codes"] = d
+            yield claim_id, defaults
+
+def claim_rows(list_lines, details=None):
+    """Stages 1-4 chained: read -> normalize headers -> coerce -> join (stages 2-3 compiled, see ListParser)."""
+    return join_details(parse_list(list_lines), details)
+
+def run_import(list_lines, detail_lines=None, batch_size=DEFAULT_BATCH_SIZE,
+               detail_size=None, join="auto", writer=None):
+    """
+    Stage 5: stream every row into a writer (a BulkClaimWriter unless one is
+    passed in); returns the closed writer for its counts.
+    """
+    details = detail_index(detail_lines, detail_size, join) if detail_lines is not None else None
+    return write_rows(lambda details: claim_rows(list_lines, details), details, batch_size, writer)
+
+def write_rows(rows, details=None, batch_size=DEFAULT_BATCH_SIZE, writer=None):
+    """run_import()'s writing half: `rows(details)` -> writer; closes the detail index."""
+    if writer is None:
+        writer = BulkClaimWriter(batch_size=batch_size)
+    try:
+        with writer:
+            for claim_id, defaults in rows(details):
+                writer.add(claim_id, defaults)
+    finally:
+        if details is not None:
+            details.close()
+    return writer
+
+
+class BulkClaimWriter:
+    """
+    Stage 5: set-based replacement for per-row update_or_create.
+
+    Rows are buffered and written in batches, one transaction per batch:
+    - new claim_ids go through bulk_create
+    - known claim_ids go through bulk_update
+    - where the backend has native upsert (Postgres, SQLite) both are sent as
+      a single INSERT ... ON CONFLICT statement instead
+
+    Rows whose content_hash matches the stored one aren't written at all, so
+    re-importing an unchanged file is a read-only pass. With delete_missing,
+    claims that aren't in the input are deleted once it's all been written
+    (otherwise only counted in .missing).
+
+    Usage:
+        with BulkClaimWriter(batch_size=2000) as w:
+            for claim_id, defaults in rows:
+                w.add(claim_id, defaults)
+        w.created, w.updated, w.unchanged, w.rate
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, upsert=None, on_flush=None, delete_missing=False):
+        self.batch_size = max(1, int(batch_size))
+        self.on_flush = on_flush  # called with the writer after every committed batch
+        if upsert is None:
+            # Postgres and SQLite >= 3.24 both have INSERT ... ON CONFLICT (claim_id)
+            upsert = connection.features.supports_update_conflicts_with_target
+        self.upsert = upsert
+        self.delete_missing = delete_missing
+        # claim_id -> pk for everything already in the table
+        self.existing = dict(Claim.objects.values_list("claim_id", "pk").iterator(chunk_size=10000))
+        self.seen = set()  # every claim_id in the input, for the missing / deleted counts
+        self.creates = {}
+        self.updates = {}
+        self.hashes = {}  # claim_id -> content hash of its pending row
+        self.unverified = {}  # claim_id -> hash of its first row in this batch; compared with the stored hash at flush
+        self.created = self.updated = self.unchanged = 0
+        self.missing = self.deleted = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.unchanged
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add(self, claim_id, defaults):
+        # a row is created (new id), unchanged (same content as the latest
+        # version of the claim) or updated; a repeat inside one batch is
+        # compared with the row it replaces
+        digest = content_hash([defaults[f] for f in CONTENT_FIELDS])
+        self.seen.add(claim_id)
+        pending = self.hashes.get(claim_id)
+        if pending is not None:
+            if pending == digest:
+                self.unchanged += 1
+                return
+            self.updated += 1
+            (self.creates if claim_id in self.creates else self.updates)[claim_id] = defaults
+        elif claim_id in self.existing:
+            self.updates[claim_id] = defaults
+            self.unverified[claim_id] = digest
+        else:
+            self.creates[claim_id] = defaults
+            self.created += 1
+        self.hashes[claim_id] = digest
+        if len(self.creates) + len(self.updates) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not (self.creates or self.updates):
+            return
+        with transaction.atomic():
+            old, stored = self._old_values()
+            self._skip_unchanged(old, stored)
+            delta = self._stat_delta(old)
+            if self.upsert:
+                self._upsert({**self.creates, **self.updates})
+            else:
+                self._create(self.creates)
+                self._update(self.updates)
+            stats.record_delta(delta)
+            self._sync_cpts(old)
+            self._log_changes()
+        for claim_id in self.creates:
+            self.existing.setdefault(claim_id, None)
+        self.creates, self.updates, self.hashes = {}, {}, {}
+        self.elapsed = time.perf_counter() - self.started
+        if self.on_flush:
+            self.on_flush(self)
+
+    def close(self):
+        self.flush()
+        self._reconcile()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _old_values(self):
+        """
+        ({claim_id: STAT_FIELDS values}, {claim_id: content_hash}) of the rows
+        this batch updates (one query).
+        """
+        if not self.updates:
+            return {}, {}
+        rows = Claim.objects.filter(claim_id__in=list(self.updates)).values_list("claim_id", "content_hash", *stats.STAT_FIELDS)
+        old, stored = {}, {}
+        for claim_id, digest, *values in rows:
+            old[claim_id], stored[claim_id] = tuple(values), digest
+        return old, stored
+
+    def _skip_unchanged(self, old, stored):
+        """Count the first rows of known claims against the stored hashes; drop updates that change nothing."""
+        for claim_id, digest in self.unverified.items():
+            if stored.get(claim_id) == digest:
+                self.unchanged += 1
+            else:
+                self.updated += 1
+        self.unverified = {}
+        for claim_id in [cid for cid in self.updates if stored.get(cid) == self.hashes[cid]]:
+            del self.updates[claim_id]
+            old.pop(claim_id, None)
+
+    def _reconcile(self):
+        """Count (and with delete_missing, delete) claims the input didn't mention."""
+        gone = [cid for cid in self.existing if cid not in self.seen]
+        self.missing = len(gone)
+        if not (self.delete_missing and self.seen):  # an empty file never wipes the table
+            return
+        for i in range(0, len(gone), RECONCILE_CHUNK):
+            with transaction.atomic():
+                # per-row delete: stats, ClaimCPT / notes and the change log follow through the signals
+                _, by_model = Claim.objects.filter(claim_id__in=gone[i:i + RECONCILE_CHUNK]).delete()
+            self.deleted += by_model.get(Claim._meta.label, 0)
+
+    def _stat_delta(self, old):
+        """ClaimStat changes for the pending batch."""
+        delta = stats.StatDelta()
+        for values in old.values():
+            delta.add(values, -1)
+        for rows in (self.creates, self.updates):
+            for d in rows.values():
+                delta.add(tuple(d[f] for f in stats.STAT_FIELDS))
+        return delta
+
+    def _sync_cpts(self, old):
+        """Rewrite ClaimCPT rows for claims that are new or whose cpt_codes changed."""
+        slot = stats.STAT_FIELDS.index("cpt_codes")
+        changed = {
+            cid: d["cpt_codes"]
+            for rows in (self.creates, self.updates)
+            for cid, d in rows.items()
+            if cid not in old or old[cid][slot] != d["cpt_codes"]
+        }
+        if not changed:
+            return
+        self._load_pks(changed)
+        ClaimCPT.replace({self.existing[cid]: codes for cid, codes in changed.items()})
+
+    def _log_changes(self):
+        claim_ids = [*self.creates, *self.updates]
+        if not claim_ids:
+            return
+        self._load_pks(claim_ids)
+        ChangeLog.log(ChangeLog.Action.SAVE, [self.existing[cid] for cid in claim_ids])
+
+    def _load_pks(self, claim_ids):
+        # pks of rows created by upsert / on backends without RETURNING aren't known yet
+        missing = [cid for cid in claim_ids if self.existing.get(cid) is None]
+        if missing:
+            self.existing.update(Claim.objects.filter(claim_id__in=missing).values_list("claim_id", "pk"))
+
+    # -------- writers --------
+    def _build(self, claim_id, defaults):
+        obj = Claim(claim_id=claim_id, **defaults)
+        obj.underpayment = obj.compute_underpayment()
+        obj.content_hash = self.hashes[claim_id]
+        return obj
+
+    def _create(self, rows):
+        if not rows:
+            return
+        objs = Claim.objects.bulk_create(
+            [self._build(cid, defaults) for cid, defaults in rows.items()],
+            batch_size=self.batch_size,
+        )
+        for obj in objs:
+            self.existing[obj.claim_id] = obj.pk
+
+    def _update(self, rows):
+        if not rows:
+            return
+        self._load_pks(rows)
+        objs = []
+        for cid, defaults in rows.items():
+            obj = self._build(cid, defaults)
+            obj.pk = self.existing[cid]
+            objs.append(obj)
+        Claim.objects.bulk_update(objs, WRITE_FIELDS, batch_size=self.batch_size)
+
+    def _upsert(self, rows):
+        Claim.objects.bulk_create(
+            [self._build(cid, defaults) for cid, defaults in rows.items()],
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=["claim_id"],
+            update_fields=list(WRITE_FIELDS),
+        )
@@ -0,0 +1,213 @@
+"""
+DB-backed import queue. The upload view only saves files and enqueues an
+ImportJob; `manage.py run_import_worker` claims queued jobs and runs them
+through the streaming import pipeline.
+
+A running job's worker touches heartbeat_at every CLAIMS_IMPORT_HEARTBEAT
+seconds. If it dies mid-job the heartbeat goes stale and the next
+claim_next_job() puts the job back in the queue (or fails it after
+CLAIMS_IMPORT_MAX_ATTEMPTS starts).
+"""
+import logging
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import parallel_import, stats
+from .importer import DEFAULT_BATCH_SIZE, BulkClaimWriter, open_lines, run_import
+from .models import ChangeLog, ImportJob, StagedClaim
+from .snapshot import clear_tables
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_import(list_file, detail_file=None, mode=ImportJob.Mode.APPEND, user=None):
+    return ImportJob.objects.create(
+        list_file=list_file,
+        detail_file=detail_file or "",
+        mode=mode,
+        created_by=user if user and user.is_authenticated else None,
+    )
+
+
+def requeue_stale_jobs():
+    """Queue RUNNING jobs whose worker stopped beating again; fail those already started too often."""
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, "CLAIMS_IMPORT_STALE_AFTER", 300))
+    max_attempts = getattr(settings, "CLAIMS_IMPORT_MAX_ATTEMPTS", 3)
+    stale = ImportJob.objects.filter(status=ImportJob.Status.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=ImportJob.Status.FAILED, finished_at=now,
+        error=f"The import worker stopped responding ({max_attempts} attempts)",
+    )
+    requeued = stale.update(status=ImportJob.Status.QUEUED, heartbeat_at=None)
+    if failed or requeued:
+        logger.warning("Import jobs with a stale heartbeat: %d requeued, %d failed", requeued, failed)
+    return requeued, failed
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to RUNNING; safe with several workers."""
+    requeue_stale_jobs()
+    for pk in ImportJob.objects.filter(status=ImportJob.Status.QUEUED).order_by("created_at").values_list("pk", flat=True)[:10]:
+        claimed = ImportJob.objects.filter(pk=pk, status=ImportJob.Status.QUEUED).update(
+            status=ImportJob.Status.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return ImportJob.objects.get(pk=pk)
+    return None
+
+
+def _owned(job):
+    """The job's row while this run still holds it; a requeue or a later claim changes status or attempts."""
+    return ImportJob.objects.filter(pk=job.pk, status=ImportJob.Status.RUNNING, attempts=job.attempts)
+
+
+def _report_progress(job):
+    def on_flush(writer):
+        _owned(job).update(
+            rows_processed=writer.rows,
+            created_count=getattr(writer, "created", 0),
+            updated_count=getattr(writer, "updated", 0),
+            unchanged_count=getattr(writer, "unchanged", 0),
+            heartbeat_at=timezone.now(),
+        )
+    return on_flush
+
+
+class _Heartbeat(threading.Thread):
+    """Touches the job's heartbeat_at every CLAIMS_IMPORT_HEARTBEAT seconds while run_job works."""
+
+    def __init__(self, job):
+        super().__init__(name=f"import-job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.interval = getattr(settings, "CLAIMS_IMPORT_HEARTBEAT", 30)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    _owned(self.job).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    pass  # e.g. SQLite locked by the job's own swap transaction; the next beat retries
+        finally:
+            connections.close_all()  # this thread's connections
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.join()
+
+
+class StagingWriter:
+    """Writer-compatible sink that parks rows in StagedClaim instead of Claim."""
+
+    def __init__(self, job, batch_size=DEFAULT_BATCH_SIZE, on_flush=None):
+        self.job = job
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.pending = []
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, claim_id, defaults):
+        self.pending.append(StagedClaim(job=self.job, claim_id=claim_id, data=defaults))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        StagedClaim.objects.bulk_create(self.pending)
+        self.rows += len(self.pending)
+        self.pending = []
+        if self.on_flush:
+            self.on_flush(self)
+
+
+def _staged_rows(job):
+    for claim_id, data in StagedClaim.objects.filter(job=job).order_by("pk").values_list("claim_id", "data").iterator(chunk_size=DEFAULT_BATCH_SIZE):
+        data["billed_amount"] = Decimal(data["billed_amount"])
+        data["paid_amount"] = Decimal(data["paid_amount"])
+        data["discharge_date"] = date.fromisoformat(data["discharge_date"])
+        yield claim_id, data
+
+
+def _swap_in(job):
+    """Replace the whole Claim table with the staged rows in one transaction."""
+    with transaction.atomic():
+        # plain DELETEs: the collector would load every claim and note and fire a signal per row
+        clear_tables()
+        stats.rebuild()  # zeroes the stats; the writer's deltas then count only the new rows
+        ChangeLog.log(ChangeLog.Action.RESET)
+        # progress written in here would only show up at commit, so don't report it
+        with stats.deferred(), BulkClaimWriter() as writer:
+            for claim_id, defaults in _staged_rows(job):
+                writer.add(claim_id, defaults)
+        # on SQLite the swap holds the write lock, so no heartbeat lands until it commits and a
+        # long swap can look stale to another worker: only commit if the job is still ours
+        if not _owned(job).update(heartbeat_at=timezone.now()):
+            raise RuntimeError("The job was requeued before the swap committed; the swap was rolled back")
+    return writer
+
+
+def _import(job, writer, workers):
+    detail = job.detail_file
+    if workers > 1:
+        return parallel_import.run_import(job.list_file.path, detail.path if detail else None,
+                                          workers=workers, writer=writer)
+    return run_import(open_lines(job.list_file.path), open_lines(detail.path) if detail else None,
+                      detail_size=detail.size if detail else None, writer=writer)
+
+
+def run_job(job, workers=1):
+    """Run a job claimed by claim_next_job(); its row is only updated while the claim still holds."""
+    progress = _report_progress(job)
+    try:
+        with _Heartbeat(job):
+            if job.mode == ImportJob.Mode.OVERWRITE:
+                StagedClaim.objects.filter(job=job).delete()  # left over if an earlier attempt died
+                # read everything first; the live table is untouched until the swap
+                _import(job, StagingWriter(job, on_flush=progress), workers)
+                writer = _swap_in(job)
+            else:
+                writer = _import(job, BulkClaimWriter(on_flush=progress), workers)
+    except Exception as e:
+        # the page shows job.error to whoever uploaded the file; the traceback is for the logs
+        logger.exception("Import job %s failed", job.pk)
+        finished = _owned(job).update(
+            status=ImportJob.Status.FAILED,
+            error=f"{type(e).__name__}: {e}",
+            finished_at=timezone.now(),
+        )
+    else:
+        finished = _owned(job).update(
+            status=ImportJob.Status.DONE,
+            rows_processed=writer.rows,
+            created_count=writer.created,
+            updated_count=writer.updated,
+            unchanged_count=writer.unchanged,
+            finished_at=timezone.now(),
+        )
+    if finished:  # otherwise the rows belong to the run that took the job over
+        StagedClaim.objects.filter(job=job).delete()
+    job.refresh_from_db()
+    return job
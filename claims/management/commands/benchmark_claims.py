@@ -0,0 +1,71 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from claims.benchmarks import DEFAULT_TOLERANCE, compare, parser_benchmark, run_benchmarks
+from claims.management.commands.generate_claims import row_count
+
+
+class Command(BaseCommand):
+    help = ("Time import_claims, claim_search, admin_dashboard, claim_detail and the CSV exports on synthetic "
+            "data in a throwaway test database; write JSON and optionally compare against a baseline")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="100k", help="Synthetic claims to load, e.g. 100k, 1M (default %(default)s)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per view (median is reported)")
+        parser.add_argument("--output", default="benchmark.json", help="Where to write results (default %(default)s)")
+        parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+        parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                            help="Allowed slowdown vs baseline before failing, 0.25 = 25%% (default %(default)s)")
+        parser.add_argument("--on-disk", action="store_true",
+                            help="SQLite: use a temporary database file instead of an in-memory test database")
+        parser.add_argument("--parser-only", action="store_true",
+                            help="Only the list-parsing microbenchmark (per-row cost before / after the compiled parser)")
+
+    def handle(self, *args, **opts):
+        baseline = None
+        if opts["baseline"]:
+            path = Path(opts["baseline"])
+            if not path.exists():
+                raise CommandError(f"Baseline not found: {path}")
+            baseline = json.loads(path.read_text())
+
+        if opts["parser_only"]:
+            rows = row_count(opts["rows"])
+            for name, timing in parser_benchmark(rows, opts["seed"], max(1, opts["repeat"])).items():
+                self.stdout.write(f"{name:<28} {timing['us_per_row']:8.2f} us/row")
+            return
+
+        # never touch the real data: run against a fresh test database
+        old_name = connection.settings_dict["NAME"]
+        if opts["on_disk"] and connection.vendor == "sqlite":
+            connection.settings_dict["TEST"]["NAME"] = str(Path(tempfile.mkdtemp()) / "benchmark.sqlite3")
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmarks(row_count(opts["rows"]), seed=opts["seed"], repeat=max(1, opts["repeat"]),
+                                     progress=lambda msg: self.stdout.write(f"  {msg}..."))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        Path(opts["output"]).write_text(json.dumps(results, indent=2))
+        for name, timing in results["timings"].items():
+            self.stdout.write(f"{name:<28} {timing['median'] * 1000:10.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {opts['output']}"))
+
+        if baseline is None:
+            return
+        regressions = []
+        self.stdout.write(f"\n{'vs baseline':<28} {'before':>10} {'now':>10} {'ratio':>7}")
+        for name, before, now, ratio, regressed in compare(results, baseline, opts["tolerance"]):
+            line = f"{name:<28} {before * 1000:8.1f}ms {now * 1000:8.1f}ms {ratio:6.2f}x"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+            if regressed:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"Slower than baseline by more than {opts['tolerance']:.0%}: {', '.join(regressions)}")
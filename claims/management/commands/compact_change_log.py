@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from claims.models import ChangeLog
+
+BATCH = 50000  # seqs per DELETE / transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Shrink the change log: of the entries older than --keep-days keep only the latest per claim / note, "
+        "and nothing before the latest RESET. A feed consumer that is further behind still ends up with the same rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=float, default=getattr(settings, "CLAIMS_CHANGE_LOG_KEEP_DAYS", 7),
+                            help="leave entries younger than this untouched")
+        parser.add_argument("--before-seq", type=int, help="compact entries up to this seq instead")
+
+    def handle(self, *args, **opts):
+        cutoff = opts["before_seq"]
+        if cutoff is None:
+            # scans back from the end only through the entries being kept
+            old = timezone.now() - timedelta(days=opts["keep_days"])
+            cutoff = ChangeLog.objects.filter(created_at__lt=old).order_by("-seq").values_list("seq", flat=True).first()
+        if not cutoff:
+            self.stdout.write("Nothing to compact")
+            return
+
+        reset = (ChangeLog.objects.filter(seq__lte=cutoff, action=ChangeLog.Action.RESET)
+                 .order_by("-seq").values_list("seq", flat=True).first()) or 0
+        # a consumer behind the RESET reloads everything anyway
+        deleted = self._delete(ChangeLog.objects.all(), 0, reset - 1)
+        later = ChangeLog.objects.filter(kind=OuterRef("kind"), object_id=OuterRef("object_id"), seq__gt=OuterRef("seq"))
+        deleted += self._delete(ChangeLog.objects.filter(object_id__isnull=False).filter(Exists(later)), reset, cutoff)
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} change log entries up to seq {cutoff}"))
+
+    def _delete(self, qs, first, last):
+        """Delete qs's entries with first <= seq <= last, BATCH seqs per transaction."""
+        deleted = 0
+        for start in range(first, last + 1, BATCH):
+            with transaction.atomic():
+                deleted += qs.filter(seq__gte=start, seq__lte=min(start + BATCH - 1, last)).delete()[0]
+        return deleted
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from claims.synthetic import write_files
+
+
+def row_count(value):
+    """'250000', '500k' or '2M' -> int."""
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:].lower(), 1)
+    try:
+        return int(float(value[:-1] if scale > 1 else value) * scale)
+    except ValueError:
+        raise CommandError(f"Bad row count: {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Write deterministic synthetic list/detail files (pipe-delimited) for load tests and benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="1M", help="Number of claims, e.g. 250000, 500k, 2M (default %(default)s)")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed; same seed + rows = same files")
+        parser.add_argument("--list", default="synthetic_list.csv", help="Output list file (default %(default)s)")
+        parser.add_argument("--detail", default="synthetic_detail.csv", help="Output detail file (default %(default)s)")
+
+    def handle(self, *args, **opts):
+        rows = row_count(opts["rows"])
+        started = time.perf_counter()
+        write_files(opts["list"], opts["detail"], rows, seed=opts["seed"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows:,} claims to {opts['list']} / {opts['detail']} in {time.perf_counter() - started:.1f}s"
+        ))
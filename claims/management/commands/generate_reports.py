@@ -0,0 +1,64 @@
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from claims.analytics import filtered_claims
+from claims.models import ClaimCPT
+from claims.reports import CHUNK_SIZE, build_report, select_pks
+
+
+def iso_date(value):
+    """'2023-01-31' -> date."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Bad date (expected YYYY-MM-DD): {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Build one audit report (CSV or ZIP) for many claims, rendered in parallel worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", required=True, help="report.csv (one file) or report.zip (claims, notes, CPT files)")
+        parser.add_argument("--ids", help="Comma-separated claim ids")
+        parser.add_argument("--ids-file", help="File with one claim id per line")
+        parser.add_argument("--status", help="Filter: status code (denied/paid/review)")
+        parser.add_argument("--insurer", help="Filter: exact insurer name")
+        parser.add_argument("--cpt", help="Filter: claims with this CPT code")
+        parser.add_argument("--date-from", type=iso_date, help="Filter: discharge date >= YYYY-MM-DD")
+        parser.add_argument("--date-to", type=iso_date, help="Filter: discharge date <= YYYY-MM-DD")
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count; 1 = no pool)")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Claims per worker task (default %(default)s)")
+
+    def handle(self, *args, **opts):
+        filters = {k: opts[k] for k in ("status", "insurer", "date_from", "date_to") if opts[k]}
+        qs = filtered_claims(filters)
+        if opts["cpt"]:
+            qs = qs.filter(pk__in=ClaimCPT.objects.filter(code=opts["cpt"]).values("claim_id"))
+
+        ids = []
+        if opts["ids"]:
+            ids += opts["ids"].split(",")
+        if opts["ids_file"]:
+            path = Path(opts["ids_file"])
+            if not path.exists():
+                raise CommandError(f"ids file not found: {path}")
+            ids += path.read_text().split()
+        if ids:
+            try:
+                qs = qs.filter(claim_id__in=[int(i) for i in ids if i.strip()])
+            except ValueError as e:
+                raise CommandError(f"Bad claim id: {e}")
+
+        pks = select_pks(qs)
+        if not pks:
+            raise CommandError("No claims match")
+        self.stdout.write(f"Rendering {len(pks)} claims...")
+
+        def progress(done, total, elapsed):
+            rate = done / elapsed if elapsed else 0
+            self.stdout.write(f"  {done}/{total} claims ({rate:,.0f}/sec)")
+
+        written = build_report(pks, opts["output"], workers=opts["workers"],
+                               chunk_size=max(1, opts["chunk_size"]), progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} claims to {opts['output']}"))
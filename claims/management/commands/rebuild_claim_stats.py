@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from claims import stats
+from claims.models import ChangeLog, Claim
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored underpayment column and every ClaimStat row from the claims table"
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            Claim.objects.update(underpayment=F("billed_amount") - F("paid_amount"))
+            rows = stats.rebuild()
+            # a bulk UPDATE doesn't say which rows changed; also retires cached pages and analytics,
+            # so the new stat rows have to be in the same commit
+            ChangeLog.log(ChangeLog.Action.RESET)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} stat rows"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from claims import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the claim search index (SQLite FTS5 table; Postgres trigram indexes are maintained by the DB)"
+
+    def handle(self, *args, **opts):
+        if connection.vendor == "sqlite" and not search.fts_available():
+            self.stdout.write(self.style.WARNING("FTS5 trigram table not available; search falls back to icontains"))
+            return
+        with transaction.atomic():
+            rebuilt = search.rebuild()
+        if rebuilt:
+            self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
+        else:
+            self.stdout.write(self.style.NOTICE(f"Nothing to rebuild on {connection.vendor}"))
@@ -0,0 +1,33 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from claims import snapshot
+from claims.models import Claim
+
+
+class Command(BaseCommand):
+    help = "Replace every Claim and Note with the rows of a dump_snapshot file (one transaction)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Snapshot written by dump_snapshot")
+        parser.add_argument("--replace", action="store_true",
+                            help="Required when the claims table isn't empty: existing claims and notes are deleted")
+
+    def handle(self, *args, **opts):
+        if not snapshot.available():
+            raise CommandError("restore_snapshot needs NumPy, which isn't installed: pip install -r requirements.txt")
+        path = Path(opts["path"])
+        if not path.exists():
+            raise CommandError(f"Snapshot not found: {path}")
+        if not opts["replace"] and Claim.objects.exists():
+            raise CommandError("The claims table isn't empty; pass --replace to overwrite it")
+        started = time.perf_counter()
+        try:
+            counts = snapshot.restore(path, progress=lambda msg: self.stdout.write(f"  {msg}"))
+        except (ValueError, KeyError) as e:
+            raise CommandError(f"Not a usable snapshot: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {counts.get('claim', 0)} claims and {counts.get('note', 0)} notes "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
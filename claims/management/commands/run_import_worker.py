@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from claims.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Process queued CSV upload jobs (ImportJob) from the database; no external broker needed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+        parser.add_argument("--workers", type=int, default=1, help="Processes parsing each job's files (default 1 = inline)")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds between polls when idle (default %(default)s)")
+
+    def handle(self, *args, **opts):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if opts["once"]:
+                    return
+                time.sleep(opts["sleep"])
+                continue
+
+            self.stdout.write(self.style.NOTICE(f"Running {job}"))
+            job = run_job(job, workers=opts["workers"])
+            if job.status == job.Status.DONE:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{job}: Created {job.created_count}, Updated {job.updated_count} "
+                    f"({job.throughput():,.0f} rows/sec)"
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"{job}: {(job.error or job.get_status_display()).splitlines()[0]}"))
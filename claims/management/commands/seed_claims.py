@@ -0,0 +1,35 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from claims import seed
+from claims.models import Claim
+
+
+class Command(BaseCommand):
+    help = "Load a claims/notes JSON fixture with batched inserts (a much faster loaddata for claims_seed.json)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default=str(seed.DEFAULT_FIXTURE),
+                            help="Fixture file, .json or .json.gz (default: claims/fixtures/claims_seed.json)")
+        parser.add_argument("--replace", action="store_true",
+                            help="Delete existing claims and notes first (required once the table has claims)")
+        parser.add_argument("--batch-size", type=int, default=seed.BATCH)
+
+    def handle(self, *args, **opts):
+        if not opts["replace"] and Claim.objects.exists():
+            raise CommandError("The claims table isn't empty; pass --replace to overwrite it")
+        started = time.perf_counter()
+        try:
+            counts = seed.load(opts["path"], replace=opts["replace"], batch_size=max(1, opts["batch_size"]),
+                               progress=lambda msg: self.stdout.write(f"  {msg}"))
+        except FileNotFoundError:
+            raise CommandError(f"Fixture not found: {opts['path']}")
+        except (ValueError, ValidationError, IntegrityError) as e:
+            raise CommandError(f"Problem loading {opts['path']}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {counts['claims.claim']} claims and {counts['claims.note']} notes "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,217 @@
+"""
+In-process request metrics recorded by claims.middleware.PerformanceMiddleware.
+
+Per view: a latency histogram, DB query count/time, template render time,
+response bytes and how many requests looked like N+1 (the same SQL run
+CLAIMS_METRICS_N_PLUS_ONE or more times in one request).
+
+Only a CLAIMS_METRICS_SAMPLE_RATE fraction of requests is measured. Queries
+are counted by record_query, an execute wrapper installed once per
+connection, and render time by the TimedDjangoTemplates backend
+(settings.TEMPLATES); both report to whichever request is in the `current` context
+variable, which also follows async views onto their sync_to_async threads. Each
+thread writes to its own shard of counters, so recording takes no locks;
+readers (the staff page, the Prometheus endpoint) merge the shards.
+"""
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+# latency histogram upper bounds, seconds (Prometheus "le" buckets, +Inf implied)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_N_PLUS_ONE = 10
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()  # only taken the first time a thread records
+recent_n_plus_one = deque(maxlen=20)  # (view, count, sql) of the latest offenders
+
+# the sampled request being recorded in this thread / task, if any
+current = ContextVar("claims_metrics_current", default=None)
+
+
+def sample_rate():
+    return getattr(settings, "CLAIMS_METRICS_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)
+
+
+class ViewStats:
+    __slots__ = ("buckets", "count", "seconds", "queries", "query_seconds", "max_queries",
+                 "render_seconds", "bytes", "n_plus_one")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = self.queries = self.max_queries = self.bytes = self.n_plus_one = 0
+        self.seconds = self.query_seconds = self.render_seconds = 0.0
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        for name in ("count", "seconds", "queries", "query_seconds", "render_seconds", "bytes", "n_plus_one"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max_queries = max(self.max_queries, other.max_queries)
+
+    def percentile(self, q):
+        """Upper bucket bound holding the q-th quantile (None if it's past the last bound)."""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return None
+
+
+class RequestStats:
+    """Collected while one sampled request runs."""
+
+    __slots__ = ("started", "queries", "query_seconds", "render_seconds", "statements")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = self.render_seconds = 0.0
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # called by record_query
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    def repeated(self):
+        """(count, sql) of the most repeated statement."""
+        if not self.statements:
+            return 0, ""
+        sql = max(self.statements, key=self.statements.get)
+        return self.statements[sql], sql
+
+
+def record_query(execute, sql, params, many, context):
+    req = current.get()
+    if req is None:
+        return execute(sql, params, many, context)
+    return req(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Hook record_query into a connection (also a connection_created receiver)."""
+    if record_query not in connection.execute_wrappers:
+        # outermost, so `with connection.execute_wrapper(...)` blocks still pop their own
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        # only the top-level render()/render_to_string() call is timed, {% include %}s are inside it
+        req = current.get()
+        if req is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            req.render_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with templates that report their render time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def record(view, req, size):
+    elapsed = time.perf_counter() - req.started
+    stats = _shard().get(view)
+    if stats is None:
+        stats = _shard()[view] = ViewStats()
+    i = 0
+    while i < len(BUCKETS) and elapsed > BUCKETS[i]:
+        i += 1
+    stats.buckets[i] += 1
+    stats.count += 1
+    stats.seconds += elapsed
+    stats.queries += req.queries
+    stats.max_queries = max(stats.max_queries, req.queries)
+    stats.query_seconds += req.query_seconds
+    stats.render_seconds += req.render_seconds
+    stats.bytes += size
+    repeats, sql = req.repeated()
+    if repeats >= getattr(settings, "CLAIMS_METRICS_N_PLUS_ONE", DEFAULT_N_PLUS_ONE):
+        stats.n_plus_one += 1
+        recent_n_plus_one.append((view, repeats, sql))
+
+
+def snapshot():
+    """{view: ViewStats} merged over every thread's shard."""
+    with _shards_lock:
+        shards = list(_shards)
+    merged = {}
+    for shard in shards:
+        for view, stats in shard.copy().items():
+            merged.setdefault(view, ViewStats()).merge(stats)
+    return dict(sorted(merged.items()))
+
+
+def reset():
+    with _shards_lock:
+        for shard in _shards:
+            shard.clear()
+    recent_n_plus_one.clear()
+
+
+# ---------- Prometheus text exposition ----------
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus(views=None):
+    views = snapshot() if views is None else views
+    lines = [
+        "# HELP claims_metrics_sample_rate Fraction of requests measured.",
+        "# TYPE claims_metrics_sample_rate gauge",
+        f"claims_metrics_sample_rate {sample_rate()}",
+        "# HELP claims_request_duration_seconds Latency of sampled requests by view.",
+        "# TYPE claims_request_duration_seconds histogram",
+    ]
+    for view, s in views.items():
+        v = _label(view)
+        seen = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), s.buckets):
+            seen += n
+            lines.append(f'claims_request_duration_seconds_bucket{{view="{v}",le="{bound}"}} {seen}')
+        lines.append(f'claims_request_duration_seconds_sum{{view="{v}"}} {s.seconds:.6f}')
+        lines.append(f'claims_request_duration_seconds_count{{view="{v}"}} {s.count}')
+    counters = (
+        ("claims_db_queries_total", "DB queries run by sampled requests.", "queries", "d"),
+        ("claims_db_query_seconds_total", "Time spent in DB queries.", "query_seconds", ".6f"),
+        ("claims_template_render_seconds_total", "Time spent rendering templates.", "render_seconds", ".6f"),
+        ("claims_response_bytes_total", "Response body bytes (non-streaming responses).", "bytes", "d"),
+        ("claims_n_plus_one_requests_total", "Sampled requests that repeated one SQL statement too often.", "n_plus_one", "d"),
+    )
+    for name, help_text, attr, fmt in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{view="{_label(view)}"}} {getattr(s, attr):{fmt}}' for view, s in views.items()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,96 @@
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+
+class _AsyncCapable:
+    # same sync/async switch as Django's MiddlewareMixin: an all-async chain
+    # lets ASGI requests reach the async views without a thread hop here
+    sync_capable = True
+    async_capable = True
+
+    def _detect_mode(self):
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+class PerformanceMiddleware(_AsyncCapable):
+    """
+    Records per-view latency, DB queries (via a connection execute wrapper),
+    template render time (via metrics.TimedDjangoTemplates) and response size for a sample of requests; see
+    claims.metrics for where the numbers go.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._detect_mode()
+        # async views run their queries on sync_to_async threads, each with
+        # its own connections; hook those as they're opened
+        connection_created.connect(metrics.install, dispatch_uid="claims_metrics")
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= metrics.sample_rate():
+            return self.get_response(request)
+        req, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, req, response)
+
+    async def __acall__(self, request):
+        if random.random() >= metrics.sample_rate():
+            return await self.get_response(request)
+        req, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, req, response)
+
+    def _start(self):
+        for conn in connections.all():
+            metrics.install(conn)
+        req = metrics.RequestStats()
+        return req, metrics.current.set(req)
+
+    def _finish(self, request, req, response):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "<unresolved>"
+        size = 0 if response.streaming else len(response.content)
+        metrics.record(view, req, size)
+        return response
+
+
+class StaticFilesMiddleware(_AsyncCapable, WhiteNoiseMiddleware):
+    """
+    WhiteNoise, which is sync-only, made usable in an async middleware chain.
+    Finding a static file is a dict lookup (a finder scan with autorefresh in
+    DEBUG) and never touches the database, so it's fine on the event loop.
+    """
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self._detect_mode()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    from claims import search
+    search.install(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    from claims import search
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0003_import_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
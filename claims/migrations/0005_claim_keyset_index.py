@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0004_claim_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['-discharge_date', '-id'], name='claims_claim_discharge_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:11
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill(apps, schema_editor):
+    # ClaimStat rows are filled in by 0007 once all of its counters exist
+    Claim = apps.get_model('claims', 'Claim')
+    Claim.objects.update(underpayment=F('billed_amount') - F('paid_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0005_claim_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('status', 'Status'), ('insurer', 'Insurer'), ('month', 'Discharge month')], max_length=10)),
+                ('key', models.CharField(max_length=120)),
+                ('claims', models.BigIntegerField(default=0)),
+                ('billed_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('underpaid_claims', models.BigIntegerField(default=0)),
+                ('underpaid_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='underpayment',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddConstraint(
+            model_name='claimstat',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='claims_stat_dimension_key'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
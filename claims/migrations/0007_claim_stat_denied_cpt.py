@@ -0,0 +1,72 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+# frozen copy of claims.stats as of this migration
+ZERO = Decimal('0.00')
+COUNTERS = ('claims', 'denied_claims', 'billed_total', 'paid_total', 'underpaid_claims', 'underpaid_total')
+GROUP_COLUMNS = {'status': 'status', 'insurer': 'insurer', 'month': 'discharge_date', 'cpt': 'cpt_codes'}
+MONEY = DecimalField(max_digits=18, decimal_places=2)
+AGGREGATES = {
+    'claims': Count('id'),
+    'denied_claims': Count('id', filter=Q(status='denied')),
+    'billed_total': Coalesce(Sum('billed_amount'), Value(ZERO), output_field=MONEY),
+    'paid_total': Coalesce(Sum('paid_amount'), Value(ZERO), output_field=MONEY),
+    'underpaid_claims': Count('id', filter=Q(underpayment__gt=0)),
+    'underpaid_total': Coalesce(Sum('underpayment', filter=Q(underpayment__gt=0)), Value(ZERO), output_field=MONEY),
+}
+
+
+def keys(dimension, value):
+    if dimension == 'month':
+        return (f'{value.year:04d}-{value.month:02d}',)
+    if dimension == 'cpt':
+        return {c.strip() for c in value.split(',') if c.strip()}
+    return (value,)
+
+
+def rebuild_stats(apps, schema_editor):
+    Claim = apps.get_model('claims', 'Claim')
+    ClaimStat = apps.get_model('claims', 'ClaimStat')
+    rows = []
+    for dimension, column in GROUP_COLUMNS.items():
+        totals = defaultdict(lambda: [0, 0, ZERO, ZERO, 0, ZERO])
+        grouped = Claim.objects.order_by().values(column).annotate(**AGGREGATES).values_list(column, *COUNTERS)
+        for value, *sums in grouped:
+            for key in keys(dimension, value):
+                totals[key] = [t + v for t, v in zip(totals[key], sums)]
+        rows += [ClaimStat(dimension=dimension, key=key, **dict(zip(COUNTERS, values))) for key, values in totals.items()]
+    ClaimStat.objects.all().delete()
+    ClaimStat.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0006_claim_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claimstat',
+            name='denied_claims',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='claimstat',
+            name='dimension',
+            field=models.CharField(choices=[('status', 'Status'), ('insurer', 'Insurer'), ('month', 'Discharge month'), ('cpt', 'CPT code')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['insurer', 'discharge_date'], name='claims_claim_insurer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['status', 'discharge_date'], name='claims_claim_status_date_idx'),
+        ),
+        migrations.RunPython(rebuild_stats, migrations.RunPython.noop),
+    ]
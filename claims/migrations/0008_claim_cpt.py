@@ -0,0 +1,49 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def split_cpt_codes(value):
+    # frozen copy of claims.models.split_cpt_codes as of this migration
+    return list(dict.fromkeys(c.strip() for c in (value or '').split(',') if c.strip()))
+
+
+def populate(apps, schema_editor):
+    Claim = apps.get_model('claims', 'Claim')
+    ClaimCPT = apps.get_model('claims', 'ClaimCPT')
+    batch = []
+    for pk, value in Claim.objects.values_list('pk', 'cpt_codes').iterator(chunk_size=5000):
+        batch += [ClaimCPT(claim_id=pk, code=code, position=i) for i, code in enumerate(split_cpt_codes(value))]
+        if len(batch) >= 5000:
+            ClaimCPT.objects.bulk_create(batch)
+            batch = []
+    ClaimCPT.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0007_claim_stat_denied_cpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimCPT',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20)),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('claim', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cpts', to='claims.claim')),
+            ],
+            options={
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['code', 'claim'], name='claims_cpt_code_claim_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='claimcpt',
+            constraint=models.UniqueConstraint(fields=('claim', 'code'), name='claims_cpt_claim_code'),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0008_claim_cpt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['claim', '-created_at'], name='claims_note_claim_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='claim',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notes', to='claims.claim'),
+        ),
+    ]
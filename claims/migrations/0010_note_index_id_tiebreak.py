@@ -0,0 +1,21 @@
+# Generated by Django 4.2.24 on 2026-10-17 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0009_note_claim_created_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='note',
+            name='claims_note_claim_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['claim', '-created_at', '-id'], name='claims_note_claim_created_idx'),
+        ),
+    ]
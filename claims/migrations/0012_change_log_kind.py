@@ -0,0 +1,22 @@
+# Generated by Django 4.2.24 on 2026-10-17 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0011_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelog',
+            name='kind',
+            field=models.CharField(choices=[('claim', 'Claim'), ('note', 'Note')], default='claim', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['kind', 'object_id', 'seq'], name='claims_changelog_object_idx'),
+        ),
+    ]
@@ -1,5 +1,30 @@
-from django.db import models
+from decimal import Decimal
+from hashlib import blake2b
+
+from django.db import connections, models, transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from . import stats
+
+
+def split_cpt_codes(value):
+    """'99204, 82947,99204' -> ['99204', '82947'] (order kept, blanks and repeats dropped)."""
+    return list(dict.fromkeys(c.strip() for c in (value or "").split(",") if c.strip()))
+
+
+# the imported fields, in the order content_hash() reads them
+CONTENT_FIELDS = (
+    "patient_name", "billed_amount", "paid_amount", "status",
+    "insurer", "discharge_date", "cpt_codes", "denial_reason",
+)
+
+
+def content_hash(values):
+    """64-bit hash of CONTENT_FIELDS values (amounts as stored, to the cent); fits a BigIntegerField."""
+    text = "\x1f".join(format(v, ".2f") if isinstance(v, Decimal) else str(v) for v in values)
+    return int.from_bytes(blake2b(text.encode(), digest_size=8).digest(), "big", signed=True)
 
 
 class Claim(models.Model):
@@ -17,25 +42,118 @@ class Claim(models.Model):
     discharge_date = models.DateField()
     cpt_codes = models.CharField(max_length=120, help_text="Comma-separated codes, e.g. 99204,82947,99406")
     denial_reason = models.CharField(max_length=255, blank=True)
+    # billed - paid, stored so "top underpayments" is an index scan (kept current in save())
+    underpayment = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, db_index=True)
+    # content_hash() of the row, so imports can skip rows that didn't change (kept current in save())
+    content_hash = models.BigIntegerField(null=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination: ORDER BY discharge_date DESC, id DESC
+            models.Index(fields=['-discharge_date', '-id'], name='claims_claim_discharge_id_idx'),
+            # filtered analytics / lists: seek to one insurer or status, then range on date
+            models.Index(fields=['insurer', 'discharge_date'], name='claims_claim_insurer_date_idx'),
+            models.Index(fields=['status', 'discharge_date'], name='claims_claim_status_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what the stats rows currently count for this claim
+        instance._stat_snapshot = stats.snapshot(instance)
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.underpayment = self.compute_underpayment()
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = {'underpayment'} if {'billed_amount', 'paid_amount'} & set(update_fields) else set()
+            if set(CONTENT_FIELDS) & set(update_fields):
+                extra.add('content_hash')
+            kwargs['update_fields'] = {*update_fields, *extra}
+        # the stats / ClaimCPT / ChangeLog writes in claims.signals commit or roll back with the row
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+    def compute_underpayment(self):
+        get_field = self._meta.get_field
+        billed = get_field('billed_amount').to_python(self.billed_amount) or 0
+        paid = get_field('paid_amount').to_python(self.paid_amount) or 0
+        return billed - paid
+
+    def compute_content_hash(self):
+        get_field = self._meta.get_field
+        return content_hash([get_field(f).to_python(getattr(self, f)) for f in CONTENT_FIELDS])
+
     def paid_delta(self):
         return self.paid_amount - self.billed_amount
 
     def cpt_list(self):
-        return [c.strip() for c in self.cpt_codes.split(",") if c.strip()]
+        # use the ClaimCPT rows when the view prefetched them (prefetch_related('cpts'))
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        if 'cpts' in prefetched:
+            return [c.code for c in prefetched['cpts']]
+        return split_cpt_codes(self.cpt_codes)
 
     def __str__(self):
         return f"{self.claim_id} - {self.patient_name}"
 
 
+class ClaimCPT(models.Model):
+    """
+    One row per code in Claim.cpt_codes, so "claims with 99204" is an index
+    lookup instead of an icontains scan. cpt_codes stays the source of truth;
+    these rows follow it on save (claims.signals) and on import (BulkClaimWriter).
+    """
+    # no separate FK index: the (claim, code) unique constraint covers claim lookups
+    claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='cpts', db_index=False)
+    code = models.CharField(max_length=20)
+    position = models.PositiveSmallIntegerField(default=0)  # order within cpt_codes
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['claim', 'code'], name='claims_cpt_claim_code'),
+        ]
+        indexes = [
+            # cpt= filter: seek by code, claim ids come straight from the index
+            models.Index(fields=['code', 'claim'], name='claims_cpt_code_claim_idx'),
+        ]
+
+    @classmethod
+    def replace(cls, codes_by_claim):
+        """Rewrite the rows of {claim pk: cpt_codes string} in two statements."""
+        if not codes_by_claim:
+            return
+        cls.objects.filter(claim_id__in=list(codes_by_claim)).delete()
+        rows = [
+            (pk, code, i)
+            for pk, value in codes_by_claim.items()
+            for i, code in enumerate(split_cpt_codes(value))
+        ]
+        # plain executemany: imports write tens of thousands of these per batch
+        conn = connections[cls.objects.db]
+        q = conn.ops.quote_name
+        with conn.cursor() as cur:
+            cur.executemany(
+                f"INSERT INTO {q(cls._meta.db_table)} ({q('claim_id')}, {q('code')}, {q('position')}) VALUES (%s, %s, %s)",
+                rows,
+            )
+
+    def __str__(self):
+        return self.code
+
+
 class Note(models.Model):
     class Kind(models.TextChoices):
         ADMIN = "admin", "Admin Note"
         SYSTEM = "system", "System Flag"
 
-    claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='notes')
+    # indexed through claims_note_claim_created_idx below
+    claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='notes', db_index=False)
     kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.ADMIN)
     body = models.TextField()
     created_by = models.ForeignKey(  # <-- add
@@ -46,6 +164,163 @@ class Note(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # a claim's notes, newest first, straight off the index (no sort);
+            # id breaks created_at ties for keyset paging (pagination.notes_page)
+            models.Index(fields=['claim', '-created_at', '-id'], name='claims_note_claim_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):  # with its ChangeLog row
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.get_kind_display()}: {self.body[:40]}"
+
+
+class ClaimStat(models.Model):
+    """One pre-aggregated row per status, insurer, discharge month or CPT code (see claims.stats)."""
+
+    class Dimension(models.TextChoices):
+        STATUS = "status", "Status"
+        INSURER = "insurer", "Insurer"
+        MONTH = "month", "Discharge month"
+        CPT = "cpt", "CPT code"
+
+    dimension = models.CharField(max_length=10, choices=Dimension.choices)
+    key = models.CharField(max_length=120)  # status code, insurer name, YYYY-MM or CPT code
+    claims = models.BigIntegerField(default=0)
+    denied_claims = models.BigIntegerField(default=0)
+    billed_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    paid_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    underpaid_claims = models.BigIntegerField(default=0)  # claims with billed > paid
+    underpaid_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['dimension', 'key'], name='claims_stat_dimension_key')]
+
+    def __str__(self):
+        return f"{self.dimension}={self.key}: {self.claims}"
+
+
+class ChangeLog(models.Model):
+    """
+    Append-only log of Claim and Note writes, made in the writing transaction.
+    seq only grows, so a reader that remembers the last seq it saw can catch up
+    with "seq > last" (claims.columnar and the /claims/changes/ feed do). On
+    Postgres a lower seq can commit after a higher one; both readers wait
+    out such holes. RESET
+    means "everything may have changed" (overwrite imports, bulk UPDATEs):
+    reload from scratch. compact_change_log drops superseded entries.
+    """
+
+    class Action(models.TextChoices):
+        SAVE = "save", "Created / updated"
+        DELETE = "delete", "Deleted"
+        RESET = "reset", "Reset"
+
+    class Kind(models.TextChoices):
+        CLAIM = "claim", "Claim"
+        NOTE = "note", "Note"
+
+    seq = models.BigAutoField(primary_key=True)
+    action = models.CharField(max_length=10, choices=Action.choices)
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.CLAIM)  # RESETs are claim (notes go with them)
+    object_id = models.BigIntegerField(null=True, blank=True)  # Claim / Note pk; empty for RESET
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            # compaction: "is there a later entry for this object?"
+            models.Index(fields=['kind', 'object_id', 'seq'], name='claims_changelog_object_idx'),
+        ]
+
+    @classmethod
+    def log(cls, action, object_ids=(None,), kind=Kind.CLAIM):
+        """One row per id, in one executemany (imports log a whole batch at once)."""
+        conn = connections[cls.objects.db]
+        q = conn.ops.quote_name
+        now = cls._meta.get_field('created_at').get_db_prep_value(timezone.now(), conn)
+        with conn.cursor() as cur:
+            cur.executemany(
+                f"INSERT INTO {q(cls._meta.db_table)} ({q('action')}, {q('kind')}, {q('object_id')}, {q('created_at')}) "
+                "VALUES (%s, %s, %s, %s)",
+                [(action, kind, pk, now) for pk in object_ids],
+            )
+
+    @classmethod
+    def last_seq(cls):
+        return cls.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+
+    @classmethod
+    async def alast_seq(cls):
+        return await cls.objects.order_by('-seq').values_list('seq', flat=True).afirst() or 0
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} {self.kind} {self.object_id or ''}".rstrip()
+
+
+class ImportJob(models.Model):
+    """A CSV upload saved to disk and processed by the run_import_worker command."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    class Mode(models.TextChoices):
+        APPEND = "append", "Append"
+        OVERWRITE = "overwrite", "Overwrite existing data"
+
+    list_file = models.FileField(upload_to="imports/")
+    detail_file = models.FileField(upload_to="imports/", blank=True)
+    mode = models.CharField(max_length=20, choices=Mode.choices, default=Mode.APPEND)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='import_jobs'
+    )
+
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)  # rows identical to the stored claim, not rewritten
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # touched by the running worker; a stale one means the worker died (see jobs.requeue_stale_jobs)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'], name='claims_job_queue_idx')]
+
+    @property
+    def is_active(self):
+        return self.status in (self.Status.QUEUED, self.Status.RUNNING)
+
+    def throughput(self):
+        """Rows per second since the job started."""
+        if not self.started_at:
+            return 0
+        end = self.finished_at or timezone.now()
+        seconds = (end - self.started_at).total_seconds()
+        return self.rows_processed / seconds if seconds > 0 else 0
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.get_mode_display()}, {self.get_status_display()})"
+
+
+class StagedClaim(models.Model):
+    """
+    Rows of an overwrite job, parked here until the whole file has been read so
+    the Claim table can be swapped in one transaction.
+    """
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='staged')
+    claim_id = models.PositiveIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
@@ -0,0 +1,114 @@
+"""
+Multi-process parsing for `import_claims --workers N` (and run_import_worker).
+
+The list and detail files are cut into byte ranges that end on line
+boundaries. Each range goes to a ProcessPoolExecutor worker together with
+the file's header line and the ListParser compiled from the start of the
+file (so every range reads dates the same way); the worker parses it (or
+runs detail_records) and sends the typed rows back.
+The parent takes the results in file order and feeds them through the detail
+join into a single writer, so "later rows win", the created/updated counts
+and overwrite mode's stage-then-swap all behave as in a sequential import.
+
+Workers never touch the database; all writes stay in the parent's writer
+(ClaimStat deltas and the ChangeLog serialize writers anyway). Ranges are
+cut on newlines, so quoted cells with line breaks inside aren't supported.
+"""
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .importer import (
+    CLAIM_FIELDS, DEFAULT_BATCH_SIZE, ListParser, detail_records, index_details, join_details,
+    parse_list, write_rows,
+)
+from .workers import init_worker
+
+CHUNK_BYTES = 4 * 1024 * 1024
+AHEAD = 2  # parsed chunks waiting per worker; bounds memory when the writer is the bottleneck
+
+
+def line_ranges(path, chunk_bytes=CHUNK_BYTES):
+    """(header line, [(start, end), ...]) covering the data lines of `path`."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        start, ranges = f.tell(), []
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            if f.tell() < size:
+                f.readline()  # move the cut to the next line start
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return header.decode("utf-8"), ranges
+
+
+def _lines(path, header, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        body = f.read(end - start).decode("utf-8")
+    return io.StringIO(header + body, newline="")  # same line splitting as open_lines()
+
+
+def parse_list_range(path, header, start, end, parser):
+    """Typed rows of one range, as (claim_id, CLAIM_FIELDS values) tuples (smaller to pickle than dicts)."""
+    return [
+        (claim_id, tuple(d[f] for f in CLAIM_FIELDS))
+        for claim_id, d in parse_list(_lines(path, header, start, end), parser=parser)
+    ]
+
+
+def parse_detail_range(path, header, start, end):
+    return list(detail_records(_lines(path, header, start, end)))
+
+
+def list_parser(path):
+    """The ListParser for a whole list file, from its header and first rows."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return ListParser.sampled(csv.reader(f, delimiter="|"))[0]
+
+
+def _in_order(pool, parse, path, workers, chunk_bytes, *args):
+    """Results of parse() over every range of `path`, in file order, at most AHEAD * workers in flight."""
+    header, ranges = line_ranges(path, chunk_bytes)
+    ranges = iter(ranges)
+    pending = deque()
+    for _ in range(AHEAD * workers):
+        r = next(ranges, None)
+        if r is None:
+            break
+        pending.append(pool.submit(parse, str(path), header, *r, *args))
+    while pending:
+        rows = pending.popleft().result()
+        r = next(ranges, None)
+        if r is not None:
+            pending.append(pool.submit(parse, str(path), header, *r, *args))
+        yield from rows
+
+
+def run_import(list_path, detail_path=None, workers=2, batch_size=DEFAULT_BATCH_SIZE,
+               join="auto", writer=None, chunk_bytes=CHUNK_BYTES):
+    """importer.run_import() over file paths, parsing in `workers` processes."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        try:
+            details = None
+            if detail_path is not None:
+                records = _in_order(pool, parse_detail_range, detail_path, workers, chunk_bytes)
+                details = index_details(records, Path(detail_path).stat().st_size, join)
+
+            def rows(details):
+                pairs = (
+                    (claim_id, dict(zip(CLAIM_FIELDS, values)))
+                    for claim_id, values in _in_order(pool, parse_list_range, list_path, workers, chunk_bytes,
+                                                      list_parser(list_path))
+                )
+                return join_details(pairs, details)
+
+            return write_rows(rows, details, batch_size, writer)
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
@@ -0,0 +1,164 @@
+"""
+Batch audit reports over many claims (manage.py generate_reports).
+
+The selected claim pks are split into chunks; each chunk is rendered (claim
+fields + underpayment, notes, CPT codes, per-code totals) by a worker in a
+ProcessPoolExecutor, and the chunks are stitched back together in order:
+
+- report.csv  one row per claim, notes and CPT codes inlined
+- report.zip  claims.csv, notes.csv, cpt_codes.csv and cpt_summary.csv
+
+Workers open their own database connections and only get pk lists, so the
+work spreads over as many cores as --workers allows.
+"""
+import csv
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.db import connections
+
+from .models import Claim, Note, split_cpt_codes
+from .workers import init_worker
+
+CHUNK_SIZE = 500
+SECTIONS = {
+    "claims": ["claim_id", "patient_name", "insurer", "status", "billed", "paid", "underpayment",
+               "discharge", "cpt_codes", "denial_reason", "note_count", "notes"],
+    "notes": ["claim_id", "kind", "created_by", "created_at", "body"],
+    "cpt_codes": ["claim_id", "position", "code"],
+}
+SUMMARY_HEADER = ["code", "claims", "denied", "billed", "paid", "underpaid_total"]
+CLAIM_COLUMNS = (
+    "pk", "claim_id", "patient_name", "insurer", "status", "billed_amount", "paid_amount",
+    "underpayment", "discharge_date", "cpt_codes", "denial_reason",
+)
+
+
+def select_pks(qs):
+    return list(qs.order_by("claim_id").values_list("pk", flat=True))
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _writer():
+    buf = io.StringIO()
+    return buf, csv.writer(buf)
+
+
+def render_chunk(pks):
+    """Render one chunk of claims; runs inside a worker process (or inline)."""
+    labels = dict(Claim.Status.choices)
+    kinds = dict(Note.Kind.choices)
+
+    notes = defaultdict(list)
+    note_rows = (
+        Note.objects.filter(claim_id__in=pks)
+        .order_by("claim_id", "created_at", "pk")
+        .values_list("claim_id", "kind", "created_by__username", "created_at", "body")
+    )
+    for row in note_rows:
+        notes[row[0]].append(row[1:])
+
+    claims_buf, claims_out = _writer()
+    notes_buf, notes_out = _writer()
+    cpt_buf, cpt_out = _writer()
+    summary = defaultdict(lambda: [0, 0, Decimal(0), Decimal(0), Decimal(0)])
+    count = 0
+    for (pk, claim_id, patient, insurer, status, billed, paid, under,
+         discharge, cpt_codes, denial) in Claim.objects.filter(pk__in=pks).order_by("claim_id").values_list(*CLAIM_COLUMNS):
+        claim_notes = notes.get(pk, [])
+        codes = split_cpt_codes(cpt_codes)
+        claims_out.writerow([
+            claim_id, patient, insurer, labels.get(status, status), billed, paid, under,
+            discharge, ",".join(codes), denial, len(claim_notes),
+            " | ".join(f"[{created:%Y-%m-%d} {kinds.get(kind, kind)}] {body}" for kind, _, created, body in claim_notes),
+        ])
+        for kind, author, created, body in claim_notes:
+            notes_out.writerow([claim_id, kinds.get(kind, kind), author or "", created.isoformat(), body])
+        for position, code in enumerate(codes):
+            cpt_out.writerow([claim_id, position, code])
+            totals = summary[code]
+            totals[0] += 1
+            totals[1] += status == Claim.Status.DENIED
+            totals[2] += billed
+            totals[3] += paid
+            totals[4] += max(under, 0)
+        count += 1
+    return {
+        "count": count,
+        "claims": claims_buf.getvalue(),
+        "notes": notes_buf.getvalue(),
+        "cpt_codes": cpt_buf.getvalue(),
+        "summary": dict(summary),
+    }
+
+
+def _results(chunks, workers):
+    if workers <= 1:
+        for chunk in chunks:
+            yield render_chunk(chunk)
+        return
+    # children must open their own connections, not share the parent's sockets
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        # map() keeps chunk order, so stitching is plain concatenation
+        yield from pool.map(render_chunk, chunks)
+
+
+def build_report(pks, output, workers=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Render the claims in `pks` into `output` (.zip for the multi-file archive,
+    anything else for the single CSV). `progress(done, total, elapsed)` is
+    called after every chunk. Returns the number of claims written.
+    """
+    workers = workers or os.cpu_count() or 1
+    as_zip = str(output).lower().endswith(".zip")
+    total, done = len(pks), 0
+    started = time.perf_counter()
+    summary = defaultdict(lambda: [0, 0, Decimal(0), Decimal(0), Decimal(0)])
+
+    tmpdir = tempfile.mkdtemp(prefix="claims-report-")
+    try:
+        sections = SECTIONS if as_zip else {"claims": SECTIONS["claims"]}
+        files = {}
+        for name, header in sections.items():
+            path = output if not as_zip else os.path.join(tmpdir, f"{name}.csv")
+            files[name] = open(path, "w", newline="", encoding="utf-8")
+            csv.writer(files[name]).writerow(header)
+        try:
+            for result in _results(list(chunked(pks, chunk_size)), workers):
+                for name, f in files.items():
+                    f.write(result[name])
+                for code, values in result["summary"].items():
+                    totals = summary[code]
+                    for i, v in enumerate(values):
+                        totals[i] += v
+                done += result["count"]
+                if progress:
+                    progress(done, total, time.perf_counter() - started)
+        finally:
+            for f in files.values():
+                f.close()
+
+        if as_zip:
+            with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for name in sections:
+                    archive.write(os.path.join(tmpdir, f"{name}.csv"), f"{name}.csv")
+                buf, out = _writer()
+                out.writerow(SUMMARY_HEADER)
+                for code, values in sorted(summary.items(), key=lambda kv: (-kv[1][4], kv[0])):
+                    out.writerow([code, *values])
+                archive.writestr("cpt_summary.csv", buf.getvalue())
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return done
@@ -0,0 +1,176 @@
+"""
+Claim search backends.
+
+- Numeric terms match claim_ids starting with them ("300" finds 300, 3001
+  and 30001), as one range per length, each a seek on the unique index.
+- Postgres: icontains on patient_name / insurer is served by pg_trgm GIN
+  indexes on UPPER(col::text), the exact expression Django's icontains emits.
+- SQLite: an FTS5 trigram table (claims_claim_fts, rowid = claim pk) kept in
+  sync by triggers, so bulk_create/upsert/update() imports stay indexed too.
+
+Anything the index can't answer (terms under 3 characters, SQLite builds
+without FTS5) falls back to the old icontains scan.
+"""
+import operator
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "claims_claim_fts"
+MIN_TRIGRAM = 3
+MAX_CLAIM_ID = 2147483647  # PositiveIntegerField upper bound
+
+SQLITE_SETUP = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(patient_name, insurer, tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS claims_claim_fts_ai AFTER INSERT ON claims_claim BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, patient_name, insurer) VALUES (new.id, new.patient_name, new.insurer);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS claims_claim_fts_ad AFTER DELETE ON claims_claim BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS claims_claim_fts_au AFTER UPDATE OF patient_name, insurer ON claims_claim BEGIN
+        UPDATE {FTS_TABLE} SET patient_name = new.patient_name, insurer = new.insurer WHERE rowid = old.id;
+    END""",
+]
+SQLITE_TEARDOWN = [
+    "DROP TRIGGER IF EXISTS claims_claim_fts_ai",
+    "DROP TRIGGER IF EXISTS claims_claim_fts_ad",
+    "DROP TRIGGER IF EXISTS claims_claim_fts_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS claims_claim_patient_trgm ON claims_claim USING gin (UPPER(patient_name::text) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS claims_claim_insurer_trgm ON claims_claim USING gin (UPPER(insurer::text) gin_trgm_ops)",
+]
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS claims_claim_patient_trgm",
+    "DROP INDEX IF EXISTS claims_claim_insurer_trgm",
+]
+
+_fts_available = {}
+
+
+def fts_available():
+    """True when the SQLite FTS table exists (missing on builds without FTS5/trigram)."""
+    alias = connection.alias
+    if alias not in _fts_available:
+        with connection.cursor() as cur:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+            _fts_available[alias] = cur.fetchone() is not None
+    return _fts_available[alias]
+
+
+async def afts_available():
+    """fts_available() for async views; only the first call per process hits the DB."""
+    if connection.alias in _fts_available:
+        return _fts_available[connection.alias]
+    return await sync_to_async(fts_available)()
+
+
+def _fts_phrase(term):
+    # a quoted FTS5 phrase matches the literal substring; quotes are escaped by doubling
+    return '"%s"' % term.replace('"', '""')
+
+
+def claim_id_ranges(term):
+    """
+    [(low, high), ...] covering the claim_ids that start with a numeric term
+    ("30" -> (30, 30), (300, 309), (3000, 3099), ...), else None. ASCII digits
+    only: int() rejects '²', which isdigit() allows.
+    """
+    if not (term.isascii() and term.isdigit()):
+        return None
+    if term[0] == "0":  # claim ids aren't zero-padded
+        return [(0, 0)] if term == "0" else []
+    ranges, low, high = [], int(term), int(term)
+    while low <= MAX_CLAIM_ID:
+        ranges.append((low, min(high, MAX_CLAIM_ID)))
+        low, high = low * 10, high * 10 + 9
+    return ranges
+
+
+def search_claims(qs, term):
+    """Filter a Claim queryset by a free-text term."""
+    term = term.strip()
+    if not term:
+        return qs
+    ranges = claim_id_ranges(term)
+    if ranges is not None:
+        if not ranges:
+            return qs.none()
+        return qs.filter(reduce(operator.or_, (Q(claim_id__range=r) for r in ranges)))
+    if connection.vendor == "sqlite" and len(term) >= MIN_TRIGRAM and fts_available():
+        return qs.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts_phrase(term)]
+        ))
+    return qs.filter(Q(patient_name__icontains=term) | Q(insurer__icontains=term))
+
+
+# ---------- schema management (used by the migration and rebuild_search_index) ----------
+def _run(schema_editor, statements, ignore_errors=False):
+    for sql in statements:
+        try:
+            schema_editor.execute(sql)
+        except Exception:
+            if not ignore_errors:
+                raise
+            return False
+    return True
+
+
+def install(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_SETUP)
+    elif vendor == "sqlite":
+        # FTS5/trigram needs SQLite >= 3.34; without it search keeps using icontains
+        if _run(schema_editor, SQLITE_SETUP, ignore_errors=True):
+            rebuild(schema_editor.connection)
+    _fts_available.clear()
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_TEARDOWN)
+    elif vendor == "sqlite":
+        _run(schema_editor, SQLITE_TEARDOWN)
+    _fts_available.clear()
+
+
+def ensure_installed(conn=connection):
+    """
+    Re-create the SQLite sync triggers if they are gone: any migration that
+    remakes claims_claim (AddField, AlterField...) drops the triggers with the
+    old table. Runs after every migrate; a no-op when everything is in place.
+    """
+    if conn.vendor != "sqlite":
+        return False
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'claims_claim' AND name LIKE %s",
+            [FTS_TABLE + "%"],
+        )
+        if cur.fetchone()[0] == 3:
+            return False
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'claims_claim'")
+        if cur.fetchone() is None:
+            return False
+    with conn.schema_editor() as schema_editor:
+        install(schema_editor)
+    return True
+
+
+def rebuild(conn=connection):
+    """Repopulate the SQLite FTS table from claims_claim (Postgres indexes maintain themselves)."""
+    if conn.vendor != "sqlite":
+        return False
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE}")
+        cur.execute(f"INSERT INTO {FTS_TABLE}(rowid, patient_name, insurer) SELECT id, patient_name, insurer FROM claims_claim")
+    return True
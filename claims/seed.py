@@ -0,0 +1,182 @@
+"""
+Fast loading of Django JSON fixtures of claims and notes (seed_claims).
+
+loaddata builds every object in memory, then saves them one at a time
+through save() and the signals. Each Claim save also writes stats, ClaimCPT
+and change-log rows. Here the top-level array is decoded one object at a
+time (json raw_decode over a buffer, so a large fixture is never one big
+list). Fields are converted the way the model would store them, and rows go
+in with executemany, BATCH at a time. Foreign keys are checked once at the
+end, as in loaddata. On SQLite the search triggers are dropped for the load.
+Afterwards, the derived tables (ClaimStat, ClaimCPT, the search index) are
+rebuilt in one pass each.
+
+Objects need explicit pks (notes point at claims by pk). Missing fields
+get the model default, or "now" for created_at. underpayment and
+content_hash are always computed, as Claim.save() would.
+"""
+import gzip
+import json
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from . import search, stats
+from .models import CONTENT_FIELDS, ChangeLog, Claim, ClaimCPT, Note, content_hash
+from .snapshot import clear_tables, insert_rows
+
+DEFAULT_FIXTURE = Path(__file__).resolve().parent / "fixtures" / "claims_seed.json"
+MODELS = (Claim, Note)
+BATCH = 5000
+CHUNK = 1 << 16  # characters read per refill
+_SPACE = re.compile(r"[ \t\n\r]*")
+
+
+def open_fixture(path):
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_objects(f, chunk_size=CHUNK):
+    """The objects of a top-level JSON array in text file `f`, decoded one at a time."""
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+
+    def fill():
+        nonlocal buf, pos
+        chunk = f.read(chunk_size)
+        buf, pos = buf[pos:] + chunk, 0
+        return bool(chunk)
+
+    def peek():
+        nonlocal pos
+        while True:
+            pos = _SPACE.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                return ""
+
+    if peek() != "[":
+        raise ValueError("A fixture is a JSON array of objects")
+    pos += 1
+    first = True
+    while True:
+        char = peek()
+        if char == "]":
+            return
+        if not first:
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' in the fixture, got {char or 'end of file'!r}")
+            pos += 1
+            char = peek()
+        if char != "{":
+            raise ValueError(f"Expected an object in the fixture, got {char or 'end of file'!r}")
+        while True:
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError:
+                if not fill():  # a truncated object only decodes once the rest is read
+                    raise
+        first = False
+        yield obj
+
+
+class _Table:
+    """Turns fixture objects of one model into db-prepped row tuples."""
+
+    def __init__(self, model, conn, now):
+        self.model, self.conn, self.now = model, conn, now
+        self.fields = list(model._meta.concrete_fields)
+        self.columns = [f.name for f in self.fields]
+        self.rows = []
+        self.count = 0
+
+    def value(self, field, data):
+        if field.name in data:
+            return field.to_python(data[field.name])
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            return self.now
+        return field.get_default()
+
+    def add(self, obj):
+        if obj.get("pk") is None:
+            raise ValueError(f"{obj['model']} objects need a pk")
+        data = obj.get("fields", {})
+        values = {f.name: obj["pk"] if f.primary_key else self.value(f, data) for f in self.fields}
+        if self.model is Claim:
+            values["underpayment"] = (values["billed_amount"] or 0) - (values["paid_amount"] or 0)
+            values["content_hash"] = content_hash([values[f] for f in CONTENT_FIELDS])
+        self.rows.append(values)
+
+    def flush(self):
+        if not self.rows:
+            return
+        insert_rows(self.model, self.columns,
+                [tuple(f.get_db_prep_save(row[f.name], self.conn) for f in self.fields) for row in self.rows])
+        if self.model is Claim:
+            ClaimCPT.replace({row["id"]: row["cpt_codes"] for row in self.rows})
+        self.count += len(self.rows)
+        self.rows = []
+
+
+@contextmanager
+def _search_triggers_dropped():
+    """SQLite: no per-row FTS trigger work during the load; the index is rebuilt in one statement after."""
+    if connection.vendor != "sqlite" or not search.fts_available():
+        yield
+        return
+    with connection.cursor() as cur:
+        for sql in search.SQLITE_TEARDOWN[:3]:
+            cur.execute(sql)
+    yield
+    with connection.cursor() as cur:
+        for sql in search.SQLITE_SETUP[1:]:
+            cur.execute(sql)
+
+
+def load(path=DEFAULT_FIXTURE, replace=False, batch_size=BATCH, progress=None):
+    """
+    Insert the claims and notes of fixture `path` in one transaction.
+    With replace, existing claims and notes are deleted first. Returns {model label: rows}.
+    """
+    with open_fixture(path) as f:
+        return load_objects(iter_objects(f), replace, batch_size, progress)
+
+
+def load_objects(objects, replace=False, batch_size=BATCH, progress=None):
+    """load() for fixture-shaped dicts from any iterable (tests generate theirs)."""
+    say = progress or (lambda msg: None)
+    conn = connections[connection.alias]
+    now = timezone.now()
+    tables = {model._meta.label_lower: _Table(model, conn, now) for model in MODELS}
+    with transaction.atomic(), _search_triggers_dropped():
+        if replace:
+            clear_tables()
+        with connection.constraint_checks_disabled():
+            for obj in objects:
+                table = tables.get(obj.get("model", "").lower())
+                if table is None:
+                    raise ValueError(f"seed_claims loads claims.claim and claims.note only, not {obj.get('model')!r}")
+                table.add(obj)
+                if len(table.rows) >= batch_size:
+                    table.flush()  # a note may reach its claim first: the FK check waits for commit
+                    say(f"{table.model._meta.verbose_name_plural}: {table.count:,}")
+            for table in tables.values():
+                table.flush()
+        connection.check_constraints(table_names=[model._meta.db_table for model in MODELS])
+
+        with connection.cursor() as cur:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(MODELS)):
+                cur.execute(sql)
+        ChangeLog.log(ChangeLog.Action.RESET)
+        stats.rebuild()
+        search.rebuild()
+    return {label: table.count for label, table in tables.items()}
@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import stats
+from .models import ChangeLog, Claim, ClaimCPT, Note
+
+CPT_SLOT = stats.STAT_FIELDS.index("cpt_codes")
+
+
+@receiver(pre_save, sender=Claim)
+def claim_pre_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_stat_snapshot", None)
+    if old is None and not instance._state.adding and instance.pk:
+        # saved without being loaded first (e.g. Claim(pk=..).save()): read the row being replaced
+        row = Claim.objects.filter(pk=instance.pk).values_list(*stats.STAT_FIELDS).first()
+        old = tuple(row) if row else None
+    instance._stat_old = old
+
+
+@receiver(post_save, sender=Claim)
+def claim_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_stat_old", None)
+    new = stats.snapshot(instance)
+    stats.record(old, new)
+    instance._stat_snapshot = new
+    if new is not None and (old is None or old[CPT_SLOT] != new[CPT_SLOT]):
+        ClaimCPT.replace({instance.pk: new[CPT_SLOT]})
+    ChangeLog.log(ChangeLog.Action.SAVE, [instance.pk])
+
+
+@receiver(post_delete, sender=Claim)
+def claim_post_delete(sender, instance, **kwargs):
+    stats.record(getattr(instance, "_stat_snapshot", None) or stats.snapshot(instance), None)
+    if not stats.deferring():  # mass deletes log a single RESET instead
+        ChangeLog.log(ChangeLog.Action.DELETE, [instance.pk])
+
+
+@receiver(post_save, sender=Note)
+def note_post_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ChangeLog.log(ChangeLog.Action.SAVE, [instance.pk], kind=ChangeLog.Kind.NOTE)
+
+
+@receiver(post_delete, sender=Note)
+def note_post_delete(sender, instance, **kwargs):
+    if not stats.deferring():  # an overwrite import's RESET covers its notes too
+        ChangeLog.log(ChangeLog.Action.DELETE, [instance.pk], kind=ChangeLog.Kind.NOTE)
@@ -0,0 +1,318 @@
+"""
+Columnar snapshots of the Claim and Note tables (manage.py dump_snapshot /
+restore_snapshot), for backups, seeding another environment and offline
+analysis.
+
+A snapshot is a zip of .npy arrays plus meta.json, so np.load() opens it as
+an .npz. Each table is written in row groups of up to ROW_GROUP rows, one
+array per column per group ("claim/00003/billed_amount.npy"), read from the
+database a group at a time, so neither side ever holds the whole table:
+
+    int        int64 (pks, claim ids)
+    cents      int64 amounts in cents
+    date       datetime64[D]
+    datetime   datetime64[us], UTC
+    category   int32 codes + the group's distinct values ("<name>.values")
+    text       UTF-8 bytes ("<name>.data") + int64 offsets ("<name>.offsets")
+
+Text arrays are deflated; the fixed-width ones are stored uncompressed unless
+compress_all is set, so Snapshot can memory-map them straight out of the zip
+for read-only analytics (see totals()).
+
+Needs NumPy (optional, like claims.columnar).
+"""
+import json
+import struct
+import zipfile
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from . import search, stats
+from .models import CONTENT_FIELDS, ChangeLog, Claim, ClaimCPT, Note, content_hash
+
+try:
+    import numpy as np
+except ImportError:  # optional; the commands refuse to run without it
+    np = None
+
+FORMAT_VERSION = 1
+ROW_GROUP = 65536
+INSERT_BATCH = 5000
+TABLES = {
+    "claim": (Claim, {
+        "id": "int", "claim_id": "int", "patient_name": "text", "billed_amount": "cents",
+        "paid_amount": "cents", "underpayment": "cents", "status": "category", "insurer": "category",
+        "discharge_date": "date", "cpt_codes": "text", "denial_reason": "text", "created_at": "datetime",
+    }),
+    # notes keep their author by username, so they map onto whatever users the target has
+    "note": (Note, {
+        "id": "int", "claim_id": "int", "kind": "category", "body": "text",
+        "created_by__username": "category", "created_at": "datetime",
+    }),
+}
+
+
+def available():
+    return np is not None
+
+
+# ---------- encoding ----------
+def _text(values):
+    encoded = [v.encode() for v in values]
+    offsets = np.zeros(len(encoded) + 1, np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), np.uint8), offsets
+
+
+def _encode(kind, values):
+    """{suffix: array} for one column of one row group."""
+    if kind == "int":
+        return {"": np.array(values, np.int64)}
+    if kind == "cents":
+        return {"": np.array([int(v.scaleb(2)) for v in values], np.int64)}
+    if kind == "date":
+        return {"": np.array(values, "datetime64[D]")}
+    if kind == "datetime":
+        return {"": np.array([v.astimezone(dt_timezone.utc).replace(tzinfo=None) for v in values], "datetime64[us]")}
+    if kind == "category":
+        ids = {}
+        codes = np.fromiter((ids.setdefault(v or "", len(ids)) for v in values), np.int32, len(values))
+        data, offsets = _text(list(ids))
+        return {"": codes, ".values.data": data, ".values.offsets": offsets}
+    data, offsets = _text([v or "" for v in values])
+    return {".data": data, ".offsets": offsets}
+
+
+def _strings(data, offsets):
+    blob = bytes(data)
+    return [blob[a:b].decode() for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+# ---------- writing ----------
+def _write_array(archive, name, array, compress):
+    info = zipfile.ZipInfo(f"{name}.npy", date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with archive.open(info, "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def _row_groups(qs, columns, size):
+    batch = []
+    for row in qs.values_list(*columns).iterator(chunk_size=min(size, 10000)):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def dump(path, row_group=ROW_GROUP, compress_all=False, progress=None):
+    """Write both tables to `path`; returns meta (row counts per table and group)."""
+    say = progress or (lambda msg: None)
+    meta = {"version": FORMAT_VERSION, "created": timezone.now().isoformat(), "tables": {}}
+    with zipfile.ZipFile(path, "w", allowZip64=True) as archive, transaction.atomic():
+        # one transaction: Postgres gives a consistent read of both tables (SQLite has one writer anyway)
+        meta["change_log_seq"] = ChangeLog.last_seq()
+        for table, (model, columns) in TABLES.items():
+            groups = []
+            for i, rows in enumerate(_row_groups(model.objects.order_by("pk"), list(columns), row_group)):
+                for position, (name, kind) in enumerate(columns.items()):
+                    values = [row[position] for row in rows]
+                    for suffix, array in _encode(kind, values).items():
+                        _write_array(archive, f"{table}/{i:05d}/{name}{suffix}", array,
+                                     compress_all or kind == "text" or suffix.startswith(".values"))
+                groups.append(len(rows))
+                say(f"{table}: {sum(groups):,} rows")
+            meta["tables"][table] = {"rows": sum(groups), "groups": groups, "columns": columns}
+        archive.writestr("meta.json", json.dumps(meta, indent=2))
+    return meta
+
+
+# ---------- reading ----------
+class RowGroup:
+    def __init__(self, snapshot, table, index, rows):
+        self.snapshot, self.table, self.index, self.rows = snapshot, table, index, rows
+        self.columns = snapshot.meta["tables"][table]["columns"]
+
+    def _name(self, column, suffix=""):
+        return f"{self.table}/{self.index:05d}/{column}{suffix}"
+
+    def array(self, column):
+        """The stored array: ints, cents, dates, datetimes or category codes (memory-mapped when uncompressed)."""
+        return self.snapshot.array(self._name(column))
+
+    def categories(self, column):
+        """The distinct values a category column's codes point into."""
+        return _strings(self.snapshot.array(self._name(column, ".values.data")),
+                        self.snapshot.array(self._name(column, ".values.offsets")))
+
+    def values(self, column):
+        """The column as Python values, the way the ORM would return them."""
+        kind = self.columns[column]
+        if kind == "text":
+            return _strings(self.snapshot.array(self._name(column, ".data")),
+                            self.snapshot.array(self._name(column, ".offsets")))
+        if kind == "category":
+            names = self.categories(column)
+            return [names[c] for c in self.array(column).tolist()]
+        array = self.array(column)
+        if kind == "cents":
+            return [Decimal(c).scaleb(-2) for c in array.tolist()]
+        if kind == "date":
+            return array.astype(object).tolist()
+        if kind == "datetime":
+            return [d.replace(tzinfo=dt_timezone.utc) for d in array.astype(object).tolist()]
+        return array.tolist()
+
+
+class Snapshot:
+    """A snapshot file opened read-only; arrays stored uncompressed are memory-mapped."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.zip = zipfile.ZipFile(self.path)
+        self.meta = json.loads(self.zip.read("meta.json"))
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {self.meta.get('version')!r}")
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def rows(self, table):
+        return self.meta["tables"][table]["rows"]
+
+    def groups(self, table):
+        for i, rows in enumerate(self.meta["tables"][table]["groups"]):
+            yield RowGroup(self, table, i, rows)
+
+    def array(self, name):
+        info = self.zip.getinfo(f"{name}.npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            return np.lib.format.read_array(BytesIO(self.zip.read(info)), allow_pickle=False)
+        with open(self.path, "rb") as f:
+            # member data starts after its local header (30 bytes + name + extra field)
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran, dtype = read_header(f)
+            offset = f.tell()
+        if not np.prod(shape):
+            return np.empty(shape, dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran else "C")
+
+
+def totals(snapshot, dimension="insurer"):
+    """
+    analytics.breakdown()-style rows (status, insurer or month) computed from
+    the snapshot's arrays alone, one row group at a time.
+    """
+    sums = defaultdict(lambda: np.zeros(6, np.int64))  # claims, denied, billed, paid, underpaid claims, underpaid
+    for group in snapshot.groups("claim"):
+        if dimension == "month":
+            months, codes = np.unique(group.array("discharge_date").astype("datetime64[M]"), return_inverse=True)
+            keys = [str(m) for m in months]
+        else:
+            keys, codes = group.categories(dimension), group.array(dimension)
+        statuses = group.categories("status")
+        denied = group.array("status") == (statuses.index("denied") if "denied" in statuses else -1)
+        under = np.asarray(group.array("underpayment"))
+        acc = np.zeros((len(keys), 6), np.int64)  # integer cents throughout, no float rounding
+        for i, values in enumerate((1, denied, group.array("billed_amount"), group.array("paid_amount"),
+                                    under > 0, np.maximum(under, 0))):
+            np.add.at(acc[:, i], codes, values)
+        for key, row in zip(keys, acc):
+            sums[key] += row
+    rows = []
+    for key, (claims, denied, billed, paid, underpaid_claims, underpaid) in sums.items():
+        billed, paid, underpaid = (Decimal(int(v)).scaleb(-2) for v in (billed, paid, underpaid))
+        rows.append({
+            "key": key, "claims": int(claims), "denied": int(denied), "billed": billed, "paid": paid,
+            "underpaid_claims": int(underpaid_claims), "underpaid": underpaid,
+            "denial_rate": round(int(denied) / int(claims), 4) if claims else 0.0,
+        })
+    rows.sort(key=lambda r: (-r["underpaid"], r["key"]))
+    return rows
+
+
+# ---------- restoring ----------
+def insert_rows(model, columns, rows):
+    """Plain executemany INSERT of already db-prepped rows (keeps pks and created_at as dumped)."""
+    q = connection.ops.quote_name
+    fields = [model._meta.get_field(c) for c in columns]
+    sql = (f"INSERT INTO {q(model._meta.db_table)} ({', '.join(q(f.column) for f in fields)}) "
+           f"VALUES ({', '.join(['%s'] * len(fields))})")
+    with connection.cursor() as cur:
+        for i in range(0, len(rows), INSERT_BATCH):
+            cur.executemany(sql, rows[i:i + INSERT_BATCH])
+
+
+def _prepped(model, columns, values):
+    """Column-wise get_db_prep_save, then transposed into row tuples."""
+    conn = connections[connection.alias]  # the real wrapper; the proxy costs a lookup per value
+    out = []
+    for name, column in zip(columns, values):
+        prep = model._meta.get_field(name).get_db_prep_save
+        out.append([prep(v, conn) for v in column])
+    return list(zip(*out))
+
+
+def clear_tables():
+    """Empty Note, ClaimCPT and Claim with plain DELETEs; the collector would load every pk to cascade by hand."""
+    with connection.cursor() as cur:
+        for model in (Note, ClaimCPT, Claim):
+            cur.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def restore(path, progress=None):
+    """
+    Replace every Claim and Note with the snapshot's rows in one transaction,
+    keeping pks and timestamps. Derived data (ClaimStat, ClaimCPT, content
+    hashes, the search index) is rebuilt; a RESET tells change-log readers.
+    Returns {table: rows restored}.
+    """
+    say = progress or (lambda msg: None)
+    users = dict(get_user_model().objects.values_list("username", "pk"))
+    counts = {}
+    with Snapshot(path) as snap, transaction.atomic():
+        clear_tables()  # no signals fire; stats and the search index are rebuilt below
+        ChangeLog.log(ChangeLog.Action.RESET)
+
+        for group in snap.groups("claim"):
+            v = {name: group.values(name) for name in TABLES["claim"][1]}
+            hashes = [content_hash(row) for row in zip(*(v[f] for f in CONTENT_FIELDS))]
+            columns = [*TABLES["claim"][1], "content_hash"]
+            insert_rows(Claim, columns, _prepped(Claim, columns, [*v.values(), hashes]))
+            ClaimCPT.replace(dict(zip(v["id"], v["cpt_codes"])))
+            counts["claim"] = counts.get("claim", 0) + group.rows
+            say(f"claim: {counts['claim']:,} rows")
+
+        for group in snap.groups("note"):
+            authors = [users.get(name) for name in group.values("created_by__username")]
+            columns = ["id", "claim_id", "kind", "body", "created_by", "created_at"]
+            values = [group.values(name) for name in ("id", "claim_id", "kind", "body")]
+            insert_rows(Note, columns, _prepped(Note, columns, [*values, authors, group.values("created_at")]))
+            counts["note"] = counts.get("note", 0) + group.rows
+            say(f"note: {counts['note']:,} rows")
+
+        with connection.cursor() as cur:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Claim, Note]):
+                cur.execute(sql)
+        stats.rebuild()
+        search.rebuild()
+    return counts
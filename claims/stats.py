@@ -0,0 +1,225 @@
+"""
+Pre-aggregated claim statistics (ClaimStat rows per status, insurer,
+discharge month and CPT code) so admin_dashboard and the unfiltered
+analytics breakdowns read a handful of rows instead of scanning the
+claims table.
+
+Writes keep the rows current incrementally:
+- Claim save/delete go through the signals in claims.signals
+- the bulk importer records a delta per batch (old values come from one
+  query per batch)
+- mass operations wrap themselves in `deferred()` and apply one combined delta
+
+`rebuild()` (manage.py rebuild_claim_stats) recomputes everything from scratch.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+# the Claim columns a stats row depends on, in snapshot order
+STAT_FIELDS = ("status", "insurer", "discharge_date", "billed_amount", "paid_amount", "cpt_codes")
+# ClaimStat counters, in StatDelta row order
+COUNTERS = ("claims", "denied_claims", "billed_total", "paid_total", "underpaid_claims", "underpaid_total")
+# Claim column each dimension is grouped on in SQL (months / single codes are rolled up in Python)
+GROUP_COLUMNS = {"status": "status", "insurer": "insurer", "month": "discharge_date", "cpt": "cpt_codes"}
+
+ZERO = Decimal("0.00")
+DENIED = "denied"
+
+_local = threading.local()
+_money = DecimalField(max_digits=18, decimal_places=2)
+AGGREGATES = {
+    "claims": Count("id"),
+    "denied_claims": Count("id", filter=Q(status=DENIED)),
+    "billed_total": Coalesce(Sum("billed_amount"), Value(ZERO), output_field=_money),
+    "paid_total": Coalesce(Sum("paid_amount"), Value(ZERO), output_field=_money),
+    "underpaid_claims": Count("id", filter=Q(underpayment__gt=0)),
+    "underpaid_total": Coalesce(Sum("underpayment", filter=Q(underpayment__gt=0)), Value(ZERO), output_field=_money),
+}
+
+
+def month_key(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def dimension_keys(dimension, value):
+    """The stat keys one grouped column value counts towards."""
+    if dimension == "month":
+        return (month_key(value),)
+    if dimension == "cpt":
+        return {c.strip() for c in value.split(",") if c.strip()}
+    return (value,)
+
+
+def snapshot(claim):
+    """The stats-relevant values of a Claim instance, or None if some are deferred."""
+    loaded = claim.__dict__
+    if any(f not in loaded for f in STAT_FIELDS):
+        return None
+    get_field = claim._meta.get_field
+    return tuple(get_field(f).to_python(loaded[f]) for f in STAT_FIELDS)
+
+
+def _empty():
+    return [0, 0, ZERO, ZERO, 0, ZERO]
+
+
+class StatDelta:
+    """Accumulated changes per (dimension, key), one slot per COUNTERS entry."""
+
+    def __init__(self):
+        self.rows = defaultdict(_empty)
+
+    def add(self, values, sign=1):
+        if values is None:
+            return
+        status, insurer, day, billed, paid, cpt_codes = values
+        under = billed - paid
+        underpaid = under > 0
+        denied = status == DENIED
+        keys = [("status", status), ("insurer", insurer), ("month", month_key(day))]
+        keys += [("cpt", code) for code in dimension_keys("cpt", cpt_codes)]
+        for key in keys:
+            row = self.rows[key]
+            row[0] += sign
+            row[2] += sign * billed
+            row[3] += sign * paid
+            if denied:
+                row[1] += sign
+            if underpaid:
+                row[4] += sign
+                row[5] += sign * under
+
+    def change(self, old, new):
+        if old != new:
+            self.add(old, -1)
+            self.add(new, 1)
+
+    def apply(self):
+        from .models import ClaimStat
+
+        rows = {k: v for k, v in self.rows.items() if any(v)}
+        if not rows:
+            return
+        conn = connections[ClaimStat.objects.db]
+        if conn.features.supports_update_conflicts_with_target:
+            # one INSERT ... ON CONFLICT DO UPDATE SET n = n + excluded.n for the whole delta
+            with conn.cursor() as cur:
+                cur.executemany(_increment_sql(conn, ClaimStat._meta.db_table),
+                                [(dim, key, *values) for (dim, key), values in rows.items()])
+        else:
+            with transaction.atomic():
+                ClaimStat.objects.bulk_create(
+                    [ClaimStat(dimension=dim, key=key) for dim, key in rows], ignore_conflicts=True
+                )
+                for (dim, key), values in rows.items():
+                    ClaimStat.objects.filter(dimension=dim, key=key).update(
+                        **{name: F(name) + v for name, v in zip(COUNTERS, values)}
+                    )
+        self.rows.clear()
+
+
+def _increment_sql(conn, table):
+    q = conn.ops.quote_name
+    columns = ("dimension", "key") + COUNTERS
+    return (
+        f"INSERT INTO {q(table)} ({', '.join(q(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({q('dimension')}, {q('key')}) DO UPDATE SET "
+        + ", ".join(f"{q(c)} = {q(table)}.{q(c)} + excluded.{q(c)}" for c in COUNTERS)
+    )
+
+
+def record(old, new):
+    """Apply one claim's old -> new change now, or fold it into the open deferred() block."""
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        pending.change(old, new)
+        return
+    delta = StatDelta()
+    delta.change(old, new)
+    delta.apply()
+
+
+def record_delta(delta):
+    """Apply a writer's per-batch delta, or merge it into the open deferred() block."""
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        delta.apply()
+        return
+    for key, values in delta.rows.items():
+        row = pending.rows[key]
+        for i, v in enumerate(values):
+            row[i] += v
+
+
+def deferring():
+    """True inside a deferred() block."""
+    return getattr(_local, "pending", None) is not None
+
+
+@contextmanager
+def deferred():
+    """Collect per-claim changes (e.g. a mass delete) and apply them as one delta at the end."""
+    outer = getattr(_local, "pending", None)
+    if outer is not None:
+        yield outer
+        return
+    _local.pending = StatDelta()
+    try:
+        yield _local.pending
+        _local.pending.apply()
+    finally:
+        _local.pending = None
+
+
+def grouped_totals(qs, dimension):
+    """
+    {key: counters} for one dimension: a GROUP BY on a column the database
+    groups natively, then a small Python roll-up into months / single CPT
+    codes. There are far fewer distinct dates and code combinations than
+    claims, and truncating to months in SQL would run a per-row Python
+    function on SQLite.
+    """
+    column = GROUP_COLUMNS[dimension]
+    totals = defaultdict(_empty)
+    for value, *sums in qs.order_by().values(column).annotate(**AGGREGATES).values_list(column, *COUNTERS):
+        for key in dimension_keys(dimension, value):
+            t = totals[key]
+            for i, v in enumerate(sums):
+                t[i] += v
+    return totals
+
+
+def rebuild():
+    """Recompute every ClaimStat row with one GROUP BY query per dimension."""
+    from .models import Claim, ClaimStat
+
+    rows = [
+        ClaimStat(dimension=dim, key=key, **dict(zip(COUNTERS, values)))
+        for dim in GROUP_COLUMNS
+        for key, values in grouped_totals(Claim.objects.all(), dim).items()
+    ]
+    with transaction.atomic():
+        ClaimStat.objects.all().delete()
+        ClaimStat.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def overview():
+    """Dashboard totals from the per-status rows."""
+    from .models import ClaimStat
+
+    by_status = {s.key: s for s in ClaimStat.objects.filter(dimension="status")}
+    underpaid_claims = sum(s.underpaid_claims for s in by_status.values())
+    underpaid_total = sum((s.underpaid_total for s in by_status.values()), ZERO)
+    return {
+        "total": sum(s.claims for s in by_status.values()),
+        "by_status": {k: s.claims for k, s in by_status.items()},
+        "avg_under": (underpaid_total / underpaid_claims).quantize(Decimal("0.01")) if underpaid_claims else 0,
+    }
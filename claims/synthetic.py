@@ -0,0 +1,92 @@
+"""
+Deterministic synthetic claim files in the same pipe-delimited layout as
+claim_list_data.csv / claim_detail_data.csv, for load tests and benchmarks.
+
+The same (rows, seed) always produces byte-identical files. Insurers and CPT
+codes follow a Zipf-like skew (a few payers / codes dominate, a long tail is
+rare), statuses roughly match the sample data's mix.
+"""
+import random
+from datetime import date, timedelta
+from itertools import accumulate
+
+LIST_HEADER = "id|patient_name|billed_amount|paid_amount|status|insurer_name|discharge_date"
+DETAIL_HEADER = "id|claim_id|denial_reason|cpt_codes"
+FIRST_CLAIM_ID = 30001
+
+INSURERS = [
+    "United Healthcare", "Blue Cross", "Aetna", "Cigna", "Self Funded Inc.", "Humana", "Kaiser Permanente",
+    "Anthem", "Centene", "Molina Healthcare", "WellCare", "Highmark", "Oscar Health", "Ambetter",
+    "Tricare", "Medicare Advantage", "Medicaid Managed Care", "Harvard Pilgrim", "Tufts Health Plan",
+    "EmblemHealth", "Geisinger", "Priority Health", "HealthPartners", "Medica", "CareSource",
+    "Premera Blue Cross", "Regence", "Excellus", "Independence Blue Cross", "Florida Blue",
+]
+CPT_CODES = [
+    "80053", "99213", "99203", "99204", "99214", "81002", "99215", "36415", "82270", "85025",
+    "99406", "82947", "90834", "90837", "93000", "71046", "73030", "97110", "97140", "96372",
+    "99395", "99396", "87880", "81003", "83036", "84443", "80061", "11102", "17110", "20610",
+    "29125", "45378", "43239", "66984", "27447", "64483", "77067", "76700", "74177", "70553",
+]
+STATUSES = [("Under Review", 64), ("Paid", 21), ("Denied", 15)]
+DENIAL_REASONS = [
+    "Policy terminated before service date", "Experimental/investigational procedure",
+    "Insufficient documentation", "Coding error / modifier missing", "Authorization not obtained",
+    "Duplicate claim submission", "Invalid patient information", "Out-of-network provider",
+    "Claim filed too late",
+]
+FIRST_NAMES = [
+    "Virginia", "Andrew", "Maria", "James", "Linda", "Robert", "Patricia", "Michael", "Barbara", "David",
+    "Susan", "William", "Jessica", "Richard", "Sarah", "Joseph", "Karen", "Thomas", "Nancy", "Daniel",
+    "Lisa", "Matthew", "Betty", "Anthony", "Sandra", "Mark", "Ashley", "Steven", "Kimberly", "Paul",
+]
+LAST_NAMES = [
+    "Rhodes", "Hunt", "Chen", "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+    "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas",
+    "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark",
+]
+FIRST_DAY = date(2019, 1, 1)
+DAYS = (date(2024, 12, 31) - FIRST_DAY).days
+
+
+def zipf_weights(n, s=1.1):
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def generate(rows, seed=0):
+    """Yield (list_line, detail_line) pairs, without headers or newlines."""
+    rnd = random.Random(seed)
+    insurer_weights = zipf_weights(len(INSURERS))
+    cpt_weights = zipf_weights(len(CPT_CODES))
+    statuses = [s for s, _ in STATUSES]
+    status_weights = list(accumulate(w for _, w in STATUSES))
+    for i in range(rows):
+        claim_id = FIRST_CLAIM_ID + i
+        status = rnd.choices(statuses, cum_weights=status_weights)[0]
+        billed = round(rnd.lognormvariate(9, 1.2), 2)
+        if status == "Paid":
+            paid = round(billed * rnd.uniform(0.6, 1.0), 2)
+        elif status == "Denied":
+            paid = 0.0 if rnd.random() < 0.7 else round(billed * rnd.uniform(0, 0.2), 2)
+        else:
+            paid = round(billed * rnd.uniform(0, 0.9), 2)
+        insurer = rnd.choices(INSURERS, cum_weights=insurer_weights)[0]
+        day = FIRST_DAY + timedelta(days=rnd.randrange(DAYS))
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        codes = dict.fromkeys(rnd.choices(CPT_CODES, cum_weights=cpt_weights, k=rnd.randint(1, 4)))
+        reason = "N/A" if status == "Paid" else rnd.choice(DENIAL_REASONS)
+        yield (
+            f"{claim_id}|{name}|{billed:.2f}|{paid:.2f}|{status}|{insurer}|{day.isoformat()}",
+            f"{i + 1}|{claim_id}|{reason}|{','.join(codes)}",
+        )
+
+
+def write_files(list_path, detail_path, rows, seed=0):
+    """Write both files; returns the number of claims written."""
+    with open(list_path, "w", encoding="utf-8", newline="\n") as list_out, \
+            open(detail_path, "w", encoding="utf-8", newline="\n") as detail_out:
+        list_out.write(LIST_HEADER + "\n")
+        detail_out.write(DETAIL_HEADER + "\n")
+        for list_line, detail_line in generate(rows, seed):
+            list_out.write(list_line + "\n")
+            detail_out.write(detail_line + "\n")
+    return rows
@@ -1,3 +1,1620 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import warnings
+import zipfile
+from collections import Counter
+from unittest import mock, skipUnless
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.cache import cache, caches
+from django.db import connection
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .importer import (
+    CLAIM_FIELDS, SAMPLE_ROWS, BulkClaimWriter, DiskDetailIndex, ListParser, MemoryDetailIndex, claim_rows, coerce,
+    detail_index, join_details, list_records, parse_list, read_rows,
+)
+from . import (
+    analytics, benchmarks, changefeed, columnar, exports, fragments, jobs, metrics, parallel_import, seed, snapshot,
+    stats, synthetic, views,
+)
+from .apps import check_numpy
+from .middleware import PerformanceMiddleware
+from .jobs import claim_next_job, enqueue_import, run_job
+from .models import ChangeLog, Claim, ClaimCPT, ClaimStat, ImportJob, Note, StagedClaim
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .search import claim_id_ranges, search_claims
+
+# plain HTTP test client, throwaway upload dir, no collectstatic manifest needed
+web_settings = override_settings(
+    SECURE_SSL_REDIRECT=False,
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage",
+)
+
+LIST_CSV = """id|patient_name|billed_amount|paid_amount|status|insurer|discharge_date
+30001|Virginia Rhodes|639787.37|16001.57|Denied|United Healthcare|2022-12-19
+30002|Andrew Hunt|223987.53|164960.37|Under Review|Self Funded Inc.|2022-01-30
+30003|Maria Chen|3400.00|3400.00|Paid|Aetna|07/15/2023
+"""
+
+DETAIL_CSV = """id|claim_id|denial_reason|cpt_codes
+1|30001|Policy terminated before service date|99204,82947,99406
+2|30002|Out-of-network provider|90834,90837
+"""
+
+
+class ImportTestMixin:
+    def write_files(self, list_text=LIST_CSV, detail_text=DETAIL_CSV):
+        tmp = Path(tempfile.mkdtemp())
+        list_path, detail_path = tmp / "list.csv", tmp / "detail.csv"
+        list_path.write_text(list_text, encoding="utf-8")
+        detail_path.write_text(detail_text, encoding="utf-8")
+        return list_path, detail_path
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command("import_claims", *args, stdout=out)
+        return out.getvalue()
+
+
+class ImportClaimsCommandTests(ImportTestMixin, TestCase):
+    def test_import_creates_then_updates(self):
+        list_path, detail_path = self.write_files()
+        out = self.run_import("--list", str(list_path), "--detail", str(detail_path), "--batch-size", "2")
+        self.assertIn("Created: 3, Updated: 0", out)
+        self.assertIn("rows/sec", out)
+
+        c = Claim.objects.get(claim_id=30001)
+        self.assertEqual(c.status, Claim.Status.DENIED)
+        self.assertEqual(c.billed_amount, Decimal("639787.37"))
+        self.assertEqual(c.cpt_list(), ["99204", "82947", "99406"])
+        self.assertEqual(Claim.objects.get(claim_id=30003).discharge_date.isoformat(), "2023-07-15")
+
+        out = self.run_import("--list", str(list_path), "--detail", str(detail_path), "--join", "disk")
+        self.assertIn("Created: 0, Updated: 0, Unchanged: 3", out)
+        self.assertEqual(Claim.objects.get(claim_id=30002).cpt_codes, "90834,90837")
+        self.assertEqual(Claim.objects.count(), 3)
+
+
+class ParallelImportTests(ImportTestMixin, TestCase):
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp())
+        self.list_path, self.detail_path = tmp / "list.csv", tmp / "detail.csv"
+        synthetic.write_files(self.list_path, self.detail_path, 300, seed=3)
+
+    def snapshot(self):
+        return list(Claim.objects.order_by("claim_id").values_list("claim_id", *CLAIM_FIELDS))
+
+    def test_ranges_cover_the_file_on_line_boundaries(self):
+        header, ranges = parallel_import.line_ranges(self.list_path, chunk_bytes=500)
+        data = self.list_path.read_bytes()
+        self.assertEqual(header.encode(), data[:ranges[0][0]])
+        self.assertEqual(ranges[-1][1], len(data))
+        self.assertGreater(len(ranges), 10)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[end - 1:end], b"\n")
+
+    def test_same_result_as_sequential_import(self):
+        self.run_import("--list", str(self.list_path), "--detail", str(self.detail_path))
+        expected = self.snapshot()
+        Claim.objects.all().delete()
+        writer = parallel_import.run_import(self.list_path, self.detail_path, workers=2, chunk_bytes=700)
+        self.assertEqual((writer.created, writer.updated), (300, 0))
+        self.assertEqual(self.snapshot(), expected)
+        out = self.run_import("--list", str(self.list_path), "--workers", "2")
+        self.assertIn("Created: 0, Updated: 300", out)
+
+    def test_parse_errors_reach_the_command(self):
+        list_path, _ = self.write_files(LIST_CSV + "30004|X|1|1|Paid|Aetna|someday\n")
+        with self.assertRaisesMessage(CommandError, "Unrecognized date"):
+            self.run_import("--list", str(list_path), "--workers", "2")
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_overwrite_job_stays_atomic(self):
+        make_claim(1)
+        job = enqueue_import(SimpleUploadedFile("list.csv", self.list_path.read_bytes()),
+                             SimpleUploadedFile("detail.csv", self.detail_path.read_bytes()),
+                             mode=ImportJob.Mode.OVERWRITE)
+        job = run_job(claim_next_job(), workers=2)
+        self.assertEqual(job.status, ImportJob.Status.DONE, job.error)
+        self.assertFalse(Claim.objects.filter(claim_id=1).exists())
+        self.assertEqual(Claim.objects.count(), 300)
+
+
+class BulkClaimWriterTests(TestCase):
+    def defaults(self, name):
+        return {
+            "patient_name": name, "billed_amount": Decimal("10"), "paid_amount": Decimal("5"),
+            "status": "paid", "insurer": "Aetna", "discharge_date": date(2023, 1, 1),
+            "cpt_codes": "", "denial_reason": "",
+        }
+
+    def test_counts_match_update_or_create(self):
+        Claim.objects.create(claim_id=1, **self.defaults("old"))
+        # (created, updated, unchanged): the second pass re-writes the same ids, and finds claim 1 exactly as stored
+        for upsert, expected in ((False, (2, 3, 0)), (True, (0, 4, 1))):
+            with self.subTest(upsert=upsert):
+                with BulkClaimWriter(batch_size=3, upsert=upsert) as w:
+                    w.add(1, self.defaults("one"))
+                    w.add(2, self.defaults("two"))
+                    w.add(2, self.defaults("two again"))  # duplicate inside one batch
+                    w.add(3, self.defaults("three"))
+                    w.add(3, self.defaults("three again"))  # duplicate across batches
+                self.assertEqual((w.created, w.updated, w.unchanged), expected)
+                self.assertEqual(Claim.objects.count(), 3)
+                self.assertEqual(Claim.objects.get(claim_id=2).patient_name, "two again")
+                self.assertEqual(Claim.objects.get(claim_id=3).patient_name, "three again")
+
+
+class DeltaImportTests(ImportTestMixin, TestCase):
+    def test_reimport_writes_nothing(self):
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        seq = ChangeLog.last_seq()
+        with CaptureQueriesContext(connection) as queries:
+            out = self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertIn("Created: 0, Updated: 0, Unchanged: 3", out)
+        writes = [q["sql"] for q in queries if not q["sql"].lstrip().upper().startswith(("SELECT", "SAVEPOINT", "RELEASE"))]
+        self.assertEqual(writes, [])
+        self.assertEqual(ChangeLog.last_seq(), seq)
+
+    def test_migration_backfills_existing_claims(self):
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        Claim.objects.update(content_hash=None)  # as rows stood before 0013
+        migration = importlib.import_module("claims.migrations.0013_claim_content_hash")
+        migration.backfill(django_apps, None)
+        for claim in Claim.objects.all():
+            self.assertEqual(claim.content_hash, claim.compute_content_hash())  # frozen copy == live hash
+        out = self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertIn("Created: 0, Updated: 0, Unchanged: 3", out)
+
+    def test_only_changed_rows_are_written(self):
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        changed, _ = self.write_files(LIST_CSV.replace("16001.57|Denied", "16001.57|Paid"))
+        seq = ChangeLog.last_seq()
+        out = self.run_import("--list", str(changed), "--detail", str(detail_path))
+        self.assertIn("Created: 0, Updated: 1, Unchanged: 2", out)
+        self.assertEqual(list(ChangeLog.objects.filter(seq__gt=seq).values_list("object_id", flat=True)),
+                         [Claim.objects.get(claim_id=30001).pk])
+        self.assertEqual(ClaimStat.objects.get(dimension="status", key="paid").claims, 2)
+
+    def test_hash_follows_edits(self):
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        claim = Claim.objects.get(claim_id=30001)
+        self.assertEqual(claim.content_hash, claim.compute_content_hash())
+        claim.status = Claim.Status.UNDER_REVIEW
+        claim.save(update_fields=["status"])  # like flag_for_review
+        out = self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertIn("Updated: 1, Unchanged: 2", out)  # the file puts it back
+        self.assertEqual(Claim.objects.get(claim_id=30001).status, Claim.Status.DENIED)
+
+    def test_rows_deleted_at_source(self):
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        Note.objects.create(claim=Claim.objects.get(claim_id=30002), body="gone soon")
+        shorter, _ = self.write_files("\n".join(l for l in LIST_CSV.splitlines() if not l.startswith("30002")))
+        out = self.run_import("--list", str(shorter))
+        self.assertIn("Not in the file: 1", out)
+        self.assertEqual(Claim.objects.count(), 3)
+        out = self.run_import("--list", str(shorter), "--delete-missing")
+        self.assertIn("Deleted at source: 1", out)
+        self.assertFalse(Claim.objects.filter(claim_id=30002).exists())
+        self.assertEqual(Note.objects.count(), 0)
+        self.assertEqual(ClaimStat.objects.get(dimension="status", key="review").claims, 0)
+        empty, _ = self.write_files(LIST_CSV.splitlines()[0] + "\n")
+        self.run_import("--list", str(empty), "--delete-missing")
+        self.assertEqual(Claim.objects.count(), 2)  # an empty file deletes nothing
+
+
+class PipelineTests(TestCase):
+    def test_stages_are_lazy(self):
+        consumed = []
+        header, *body = LIST_CSV.splitlines(keepends=True)
+
+        def lines(rows=len(body)):
+            for line in [header] + [body[i % len(body)] for i in range(rows)]:
+                consumed.append(line)
+                yield line
+
+        details = MemoryDetailIndex([(30001, "Late filing", "99204")])
+        rows = join_details(parse_list(lines(), parser=ListParser(header.strip().split("|"))), details)
+        self.assertEqual(consumed, [])
+        claim_id, defaults = next(rows)
+        self.assertEqual(len(consumed), 2)  # header + first row only
+        self.assertEqual(claim_id, 30001)
+        self.assertEqual(defaults["insurer"], "United Healthcare")
+        self.assertEqual((defaults["denial_reason"], defaults["cpt_codes"]), ("Late filing", "99204"))
+
+        # claim_rows() compiles its parser from the first SAMPLE_ROWS rows, and reads no further
+        consumed.clear()
+        rows = claim_rows(lines(rows=1000), details)
+        self.assertEqual(consumed, [])
+        self.assertEqual(next(rows)[0], 30001)
+        self.assertEqual(len(consumed), 1 + SAMPLE_ROWS)
+
+
+class ListParserTests(TestCase):
+    MESSY = (
+        "claim id|id|patient|billed|paid|status|payer|date\n"
+        "|7|Ann|$1,200.50|  |DENY|Aetna|2023-02-01\n"      # claim_id from the second alias
+        "8||Bob|12|3.5|paid|Cigna|02/03/2023\n"            # other layout: falls back to to_date
+        "9||Cy|abc|1e2||Humana|2023-03-04\n"                # junk amount, empty status
+        "x|||||||\n"                                       # no integer id: dropped
+        "10||Di|||||2023-05-06\n"
+        "11||Ed\n"                                          # short row, padded
+    )
+
+    def test_same_rows_as_the_reference_stages(self):
+        messy = self.MESSY.replace("11||Ed\n", "11||Ed|||||15/04/2023\n")
+        for text in (LIST_CSV, messy, self.MESSY, messy.replace("|2023-02-01", "|")):
+            lines = text.splitlines(keepends=True)
+            try:
+                expected = list(coerce(list_records(read_rows(lines))))
+            except ValueError as e:
+                with self.assertRaisesMessage(ValueError, str(e)):
+                    list(parse_list(lines))
+                continue
+            self.assertEqual(list(parse_list(lines)), expected)
+
+    def test_date_layout_comes_from_the_sample(self):
+        headers = ["id", "discharge_date"]
+        self.assertEqual(ListParser(headers, [["1", "2023-01-02"]]).date_format, "%Y-%m-%d")
+        self.assertEqual(ListParser(headers, [["1", "01/02/2023"]]).date_format, "%m/%d/%Y")
+        # a day-first file reads ambiguous dates day-first too
+        parser = ListParser(headers, [["1", "25/12/2023"], ["2", "03/04/2023"]])
+        self.assertEqual(parser.date_format, "%d/%m/%Y")
+        self.assertEqual([d["discharge_date"] for _, d in parser.parse([["2", "03/04/2023"]])], [date(2023, 4, 3)])
+
+
+@web_settings
+class CsvUploadViewTests(TestCase):
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def upload(self, mode="append", list_text=LIST_CSV, detail_text=DETAIL_CSV):
+        data = {"mode": mode, "list_file": SimpleUploadedFile("list.csv", list_text.encode("latin-1"))}
+        if detail_text:
+            data["detail_file"] = SimpleUploadedFile("detail.csv", detail_text.encode())
+        resp = self.client.post(reverse("claims:csv_upload"), data)
+        job = ImportJob.objects.latest("pk")
+        self.assertRedirects(resp, reverse("claims:import_job", args=[job.pk]), fetch_redirect_response=False)
+        return job
+
+    def run_worker(self):
+        call_command("run_import_worker", "--once", stdout=StringIO())
+
+    def test_upload_is_queued_then_processed_by_worker(self):
+        job = self.upload()
+        self.assertEqual(job.status, ImportJob.Status.QUEUED)
+        self.assertEqual(Claim.objects.count(), 0)
+
+        resp = self.client.get(reverse("claims:import_job_progress", args=[job.pk]))
+        self.assertContains(resp, 'hx-trigger="every 2s"')
+
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed, job.created_count), (ImportJob.Status.DONE, 3, 3))
+        self.assertEqual(Claim.objects.get(claim_id=30002).cpt_codes, "90834,90837")
+        self.assertEqual(Claim.objects.get(claim_id=30002).status, Claim.Status.UNDER_REVIEW)
+
+        resp = self.client.get(reverse("claims:import_job_progress", args=[job.pk]))
+        self.assertNotContains(resp, "hx-trigger")
+        self.assertContains(resp, "Created:</strong> 3")
+
+    def test_upload_takes_the_old_views_date_formats(self):
+        lines = LIST_CSV.splitlines(keepends=True)
+        lines[2] = lines[2].replace("2022-01-30", "30-01-2022")
+        lines[3] = lines[3].replace("07/15/2023", "2023-07-15T08:30:00")
+        self.upload(list_text="".join(lines), detail_text=None)
+        self.run_worker()
+        self.assertEqual(ImportJob.objects.latest("pk").status, ImportJob.Status.DONE)
+        dates = dict(Claim.objects.values_list("claim_id", "discharge_date"))
+        self.assertEqual((dates[30002], dates[30003]), (date(2022, 1, 30), date(2023, 7, 15)))
+
+    def test_worker_reports_a_job_that_ended_without_an_error(self):
+        self.upload()
+
+        def failed(job, workers):
+            ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.Status.FAILED)
+            job.refresh_from_db()
+            return job
+
+        out = StringIO()
+        with mock.patch("claims.management.commands.run_import_worker.run_job", failed):
+            call_command("run_import_worker", "--once", stdout=out)
+        self.assertIn(": Failed", out.getvalue())
+
+    def test_overwrite_swaps_table_only_on_success(self):
+        Claim.objects.create(claim_id=1, patient_name="Old", billed_amount=1, insurer="X", discharge_date="2020-01-01", cpt_codes="")
+
+        bad = self.upload("overwrite", LIST_CSV + "30009|Bad Date|1|1|Paid|Aetna|not-a-date\n")
+        with self.assertLogs("claims.jobs", "ERROR") as logs:
+            self.run_worker()
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, ImportJob.Status.FAILED)
+        self.assertIn("Unrecognized date", bad.error)
+        self.assertNotIn("Traceback", bad.error)  # shown on the job page; the traceback goes to the log
+        self.assertIn("Traceback", logs.output[0])
+        self.assertEqual(list(Claim.objects.values_list("claim_id", flat=True)), [1])
+        self.assertFalse(StagedClaim.objects.exists())
+        self.assertFalse(ChangeLog.objects.filter(action=ChangeLog.Action.RESET).exists())
+
+        job = self.upload("overwrite")
+        deleted = []
+        receiver = lambda sender, **kw: deleted.append(sender)
+        for model in (Claim, Note):
+            post_delete.connect(receiver, sender=model)
+        try:
+            self.run_worker()
+        finally:
+            for model in (Claim, Note):
+                post_delete.disconnect(receiver, sender=model)
+        self.assertEqual(deleted, [])  # the swap deletes in SQL, not row by row through the collector
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.DONE)
+        self.assertEqual(sorted(Claim.objects.values_list("claim_id", flat=True)), [30001, 30002, 30003])
+        swapped = sorted(ClaimStat.objects.values_list("dimension", "key", "claims"))
+        stats.rebuild()
+        self.assertEqual(sorted(ClaimStat.objects.values_list("dimension", "key", "claims")), swapped)
+        # one RESET for the swap instead of a DELETE per old row, then the new rows
+        log = list(ChangeLog.objects.filter(seq__gt=ChangeLog.objects.get(action="reset").seq - 1).values_list("action", flat=True))
+        self.assertEqual(log, ["reset", "save", "save", "save"])
+
+    def test_swap_is_rolled_back_if_the_job_was_taken_over(self):
+        make_claim(1)
+        job = self.upload("overwrite")
+        staged = jobs._import
+
+        def requeued_meanwhile(job, writer, workers):
+            staged(job, writer, workers)
+            # what another worker's requeue_stale_jobs() does once the heartbeat looks stale
+            ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.Status.QUEUED)
+
+        with mock.patch("claims.jobs._import", requeued_meanwhile), self.assertLogs("claims.jobs", "ERROR"):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (ImportJob.Status.QUEUED, ""))
+        self.assertEqual(list(Claim.objects.values_list("claim_id", flat=True)), [1])
+        self.assertTrue(StagedClaim.objects.filter(job=job).exists())  # the next run clears them first
+
+    def test_non_utf8_upload_fails_the_job(self):
+        job = self.upload(list_text="id|patient_name\n1|Jos\xe9\n", detail_text=None)
+        with self.assertLogs("claims.jobs", "ERROR"):
+            self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertIn("UnicodeDecodeError", job.error)
+
+    def test_jobs_of_dead_workers_are_requeued(self):
+        job = self.upload()
+        self.assertEqual(claim_next_job().pk, job.pk)  # ...and the worker dies here
+        self.assertIsNone(claim_next_job())  # still beating as far as anyone knows
+
+        stale = timezone.now() - timedelta(seconds=301)
+        ImportJob.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        with self.assertLogs("claims.jobs", "WARNING"):
+            self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.created_count), (ImportJob.Status.DONE, 2, 3))
+
+        for attempts, status in ((2, ImportJob.Status.QUEUED), (3, ImportJob.Status.FAILED)):
+            ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.Status.RUNNING, heartbeat_at=stale,
+                                                       attempts=attempts)
+            with self.assertLogs("claims.jobs", "WARNING"):
+                jobs.requeue_stale_jobs()
+            job.refresh_from_db()
+            self.assertEqual(job.status, status)
+        self.assertIn("stopped responding", job.error)
+
+
+class DetailIndexTests(TestCase):
+    def test_strategy_follows_file_size(self):
+        lines = DETAIL_CSV.splitlines(keepends=True)
+        with self.settings(CLAIMS_DETAIL_MEMORY_LIMIT=10):
+            self.assertIsInstance(detail_index(lines, size=5), MemoryDetailIndex)
+            idx = detail_index(lines, size=50)
+        self.assertIsInstance(idx, DiskDetailIndex)
+        self.assertEqual(len(idx), 2)
+        self.assertEqual(idx.get_many([30002, 99999]), {30002: ("Out-of-network provider", "90834,90837")})
+        idx.close()
+
+
+def claim_fields(claim_id, **kw):
+    fields = {
+        "claim_id": claim_id, "patient_name": f"Patient {claim_id}", "billed_amount": Decimal("100.00"),
+        "paid_amount": Decimal("40.00"), "status": Claim.Status.DENIED, "insurer": "Aetna",
+        "discharge_date": "2023-01-01", "cpt_codes": "99204",
+    }
+    fields.update(kw)
+    return fields
+
+
+def make_claim(claim_id, **kw):
+    return Claim.objects.create(**claim_fields(claim_id, **kw))
+
+
+def seed_claims(claims, notes=()):
+    """
+    Many rows at once through the seed_claims loader instead of a save() each.
+    `claims` are claim_fields() keyword dicts, given pks 1, 2, ... in order;
+    `notes` are Note field dicts ({"claim": pk, "body": ...}).
+    """
+    def objects():
+        for pk, fields in enumerate(claims, 1):
+            yield {"model": "claims.claim", "pk": pk, "fields": claim_fields(**fields)}
+        for pk, fields in enumerate(notes, 1):
+            yield {"model": "claims.note", "pk": pk, "fields": fields}
+    return seed.load_objects(objects())
+
+
+class SearchTests(ImportTestMixin, TestCase):
+    def ids(self, term):
+        return sorted(search_claims(Claim.objects.all(), term).values_list("claim_id", flat=True))
+
+    def test_numeric_terms_match_claim_id_prefixes(self):
+        for claim_id in (30001, 300, 3009, 1300, 31, 0):
+            make_claim(claim_id)
+        self.assertEqual(self.ids("300"), [300, 3009, 30001])
+        self.assertEqual(self.ids("30001"), [30001])
+        self.assertEqual(self.ids("3"), [31, 300, 3009, 30001])
+        self.assertEqual(self.ids("0"), [0])
+        self.assertEqual(self.ids("0300"), [])
+        self.assertEqual(self.ids("99999999999"), [])
+        self.assertEqual(claim_id_ranges("214748364"), [(214748364, 214748364), (2147483640, 2147483647)])
+        self.assertEqual(self.ids("\u00b2"), [])  # superscript two: isdigit() but not an int
+        self.assertEqual(self.ids("3\u0663"), [])  # Arabic-Indic digit
+        self.client.force_login(get_user_model().objects.create_user("u", password="pw"))
+        with web_settings:
+            self.assertEqual(self.client.get(reverse("claims:search"), {"q": "\u00b2"}).status_code, 200)
+
+    def test_substring_search_tracks_writes(self):
+        c = make_claim(1, patient_name="Virginia Rhodes", insurer="United Healthcare")
+        make_claim(2, patient_name="Andrew Hunt", insurer="Aetna")
+        self.assertEqual(self.ids("rhod"), [1])
+        self.assertEqual(self.ids("HEALTH"), [1])
+        self.assertEqual(self.ids("et"), [2])  # too short for trigrams: icontains fallback
+
+        c.patient_name = "Virginia Stone"
+        c.save()
+        self.assertEqual(self.ids("rhod"), [])
+        self.assertEqual(self.ids("stone"), [1])
+
+        # bulk/upsert imports bypass model signals but must stay searchable
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertEqual(self.ids("maria"), [30003])
+        c.delete()
+        self.assertEqual(self.ids("stone"), [])
+
+
+@web_settings
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # three claims per day so pages have to break ties on id
+        seed_claims(
+            {"claim_id": i, "patient_name": f"P{i}", "billed_amount": 1, "paid_amount": 0,
+             "status": Claim.Status.UNDER_REVIEW, "discharge_date": f"2023-01-{1 + i // 3:02d}", "cpt_codes": ""}
+            for i in range(75)
+        )
+
+    def setUp(self):
+        caches["fragments"].clear()
+
+    def test_pages_cover_everything_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(Claim.objects.all(), cursor, size=20)
+            seen += rows
+            if not cursor:
+                break
+        expected = list(Claim.objects.order_by("-discharge_date", "-id"))
+        self.assertEqual(seen, expected)
+
+    def test_garbled_cursor_means_first_page(self):
+        self.assertIsNone(decode_cursor("not-a-cursor"))
+        rows, _ = keyset_page(Claim.objects.all(), "not-a-cursor", size=5)
+        self.assertEqual(rows, list(Claim.objects.order_by("-discharge_date", "-id")[:5]))
+
+    def test_out_of_range_cursor_pk_means_first_page(self):
+        for pk in (10 ** 30, 2 ** 63, 0, -1):
+            cursor = encode_cursor(Claim(pk=pk, discharge_date=date(2023, 1, 5)))
+            self.assertIsNone(decode_cursor(cursor), pk)
+            resp = self.client.get(reverse("claims:search"), {"cursor": cursor})
+            self.assertContains(resp, "<tr>", count=50)
+
+    def test_search_partial_chains_revealed_sentinel(self):
+        resp = self.client.get(reverse("claims:search"), {"status": "review"})
+        self.assertContains(resp, "<tr>", count=50)
+        self.assertContains(resp, 'hx-trigger="revealed"')
+        next_url = resp.context["next_query"]
+        self.assertIn("status=review", next_url)
+
+        resp = self.client.get(reverse("claims:search") + "?" + next_url)
+        self.assertContains(resp, "<tr>", count=25)
+        self.assertNotContains(resp, 'hx-trigger="revealed"')
+
+
+@web_settings
+class ClaimStatsTests(ImportTestMixin, TestCase):
+    def stat_rows(self):
+        return sorted(ClaimStat.objects.filter(claims__gt=0).values_list(
+            "dimension", "key", "claims", "denied_claims", "billed_total", "paid_total", "underpaid_claims", "underpaid_total"))
+
+    def assertStatsConsistent(self):
+        incremental = self.stat_rows()
+        stats.rebuild()
+        self.assertEqual(incremental, self.stat_rows())
+
+    def test_incremental_updates_match_rebuild(self):
+        c = make_claim(1, billed_amount=Decimal("100.00"), paid_amount=Decimal("40.00"))
+        make_claim(2, status=Claim.Status.PAID, insurer="Cigna", discharge_date="2023-02-03")
+        self.assertEqual(c.underpayment, Decimal("60.00"))
+        self.assertStatsConsistent()
+
+        c = Claim.objects.get(claim_id=1)
+        c.paid_amount = Decimal("100.00")
+        c.save(update_fields=["paid_amount"])
+        self.assertEqual(Claim.objects.get(claim_id=1).underpayment, 0)
+        self.assertStatsConsistent()
+
+        staff = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        self.client.post(reverse("claims:flag", args=[Claim.objects.get(claim_id=2).pk]))
+        self.assertStatsConsistent()
+
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.run_import("--list", str(list_path))
+        self.assertStatsConsistent()
+
+        Claim.objects.filter(claim_id=30001).delete()
+        self.assertStatsConsistent()
+
+        self.client.post(reverse("claims:csv_upload"), {
+            "mode": "overwrite", "list_file": SimpleUploadedFile("list.csv", LIST_CSV.encode()),
+        })
+        call_command("run_import_worker", "--once", stdout=StringIO())
+        self.assertEqual(Claim.objects.count(), 3)
+        self.assertStatsConsistent()
+
+    def test_migration_builds_the_same_rows(self):
+        make_claim(1, billed_amount=Decimal("100.00"), paid_amount=Decimal("40.00"), cpt_codes="99204, 82947")
+        make_claim(2, status=Claim.Status.PAID, insurer="Cigna", discharge_date="2023-02-03", cpt_codes="99204")
+        expected = self.stat_rows()
+        migration = importlib.import_module("claims.migrations.0007_claim_stat_denied_cpt")
+        migration.rebuild_stats(django_apps, None)
+        self.assertEqual(self.stat_rows(), expected)
+
+    def test_dashboard_reads_stat_rows(self):
+        make_claim(1, billed_amount=Decimal("100.00"), paid_amount=Decimal("40.00"))
+        make_claim(2, billed_amount=Decimal("100.00"), paid_amount=Decimal("80.00"), status=Claim.Status.PAID)
+        make_claim(3, billed_amount=Decimal("10.00"), paid_amount=Decimal("10.00"), status=Claim.Status.UNDER_REVIEW)
+        staff = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(staff)
+
+        resp = self.client.get(reverse("claims:admin_dashboard"))
+        self.assertEqual((resp.context["total"], resp.context["paid"], resp.context["denied"], resp.context["review"]), (3, 1, 1, 1))
+        self.assertEqual(resp.context["avg_under"], Decimal("40.00"))
+        self.assertEqual([c.claim_id for c in resp.context["top_under"]], [1, 2])
+
+
+@web_settings
+class ClaimCPTTests(ImportTestMixin, TestCase):
+    def setUp(self):
+        caches["fragments"].clear()
+
+    def codes(self, claim_id):
+        return list(ClaimCPT.objects.filter(claim__claim_id=claim_id).values_list("code", flat=True))
+
+    def test_rows_follow_save_and_import(self):
+        c = make_claim(1, cpt_codes="99204, 82947,99204")
+        self.assertEqual(self.codes(1), ["99204", "82947"])
+        c.cpt_codes = "99406"
+        c.save()
+        self.assertEqual(self.codes(1), ["99406"])
+
+        list_path, detail_path = self.write_files()
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertEqual(self.codes(30001), ["99204", "82947", "99406"])
+        self.assertEqual(self.codes(30003), [])
+        detail_path.write_text(DETAIL_CSV.replace("90834,90837", "90837"), encoding="utf-8")
+        self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertEqual(self.codes(30002), ["90837"])
+        self.assertEqual(self.codes(30001), ["99204", "82947", "99406"])
+
+    def test_migration_fills_the_same_rows(self):
+        make_claim(1, cpt_codes="99204, 82947,99204")
+        make_claim(2, cpt_codes="")
+        expected = sorted(ClaimCPT.objects.values_list("claim_id", "code", "position"))
+        ClaimCPT.objects.all().delete()
+        importlib.import_module("claims.migrations.0008_claim_cpt").populate(django_apps, None)
+        self.assertEqual(sorted(ClaimCPT.objects.values_list("claim_id", "code", "position")), expected)
+
+    def test_cpt_filter_is_exact(self):
+        make_claim(1, cpt_codes="99204,82947")
+        make_claim(2, cpt_codes="99204")
+        make_claim(3, cpt_codes="992041", status=Claim.Status.PAID)
+        resp = self.client.get(reverse("claims:search"), {"cpt": "99204"})
+        self.assertEqual(sorted(c.claim_id for c in resp.context["claims"]), [1, 2])
+        resp = self.client.get(reverse("claims:search"), {"cpt": "82947", "status": "denied"})
+        self.assertEqual([c.claim_id for c in resp.context["claims"]], [1])
+
+    def test_cpt_list_reads_prefetched_rows(self):
+        make_claim(1, cpt_codes="99204,82947")
+        claim = Claim.objects.prefetch_related("cpts").get(claim_id=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(claim.cpt_list(), ["99204", "82947"])
+        resp = self.client.get(reverse("claims:detail", args=[claim.pk]))
+        self.assertContains(resp, '<span class="chip">82947</span>')
+
+
+@web_settings
+class FragmentCacheTests(ImportTestMixin, TestCase):
+    def setUp(self):
+        caches["fragments"].clear()
+        self.claim = make_claim(1, patient_name="Virginia Rhodes")
+
+    def search(self, **params):
+        resp = self.client.get(reverse("claims:search"), params)
+        return resp["X-Cache"], resp.content.decode()
+
+    def test_normalized_params_share_an_entry(self):
+        self.assertEqual(self.search(q="rhodes")[0], "MISS")
+        self.assertEqual(self.search(q="  Rhodes ", status="")[0], "HIT")
+        self.assertEqual(self.search(q="rhodes", status="paid")[0], "MISS")
+        self.assertEqual(fragments.normalize({"q": " A  b", "status": "", "cursor": "Xy"}), {"q": "a b", "cursor": "Xy"})
+
+    def test_writes_bump_the_generation(self):
+        self.search(q="rhodes")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(get_user_model().objects.create_user("u", password="pw"))
+            self.client.post(reverse("claims:flag", args=[self.claim.pk]))
+        self.assertEqual(self.search(q="rhodes")[0], "MISS")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.claim.patient_name = "Virginia Stone"
+            self.claim.save()
+        hit, html = self.search(q="rhodes")
+        self.assertEqual(hit, "MISS")
+        self.assertIn("No results", html)
+
+        self.search(q="maria")
+        list_path, detail_path = self.write_files()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import("--list", str(list_path), "--detail", str(detail_path))
+        self.assertIn("Maria Chen", self.search(q="maria")[1])
+
+    def test_writes_from_other_processes_retire_pages(self):
+        self.search(q="rhodes")
+        # another worker's write: its change-log row, and nothing in this process's cache
+        ChangeLog.log(ChangeLog.Action.SAVE, [self.claim.pk])
+        self.assertEqual(self.search(q="rhodes")[0], "MISS")
+        self.assertEqual(self.search(q="rhodes")[0], "HIT")
+
+    def test_counters(self):
+        self.search(q="rhodes")
+        self.search(q="rhodes")
+        self.client.force_login(get_user_model().objects.create_user("staff", password="pw", is_staff=True))
+        data = self.client.get(reverse("claims:search_cache")).json()
+        self.assertEqual((data["hits"], data["misses"], data["hit_rate"]), (1, 1, 0.5))
+
+
+@web_settings
+class NoteQueryCountTests(TestCase):
+    """Notes pages and the admin shouldn't run a query per note / per author."""
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.admin = get_user_model().objects.create_superuser("boss", password="pw")
+        self.client.force_login(self.admin)
+        self.claim = make_claim(1)
+
+    def add_notes(self, count):
+        User = get_user_model()
+        start = User.objects.count()
+        authors = [User.objects.create_user(f"author{start + i}") for i in range(count)]
+        Note.objects.bulk_create([
+            Note(claim=self.claim, body=f"note {i}", created_by=authors[i]) for i in range(count)
+        ])
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url, params or {}).status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_notes(self):
+        urls = [
+            reverse("claims:detail", args=[self.claim.pk]),
+            reverse("claims:notes", args=[self.claim.pk]),
+            reverse("admin:claims_note_changelist"),
+            reverse("admin:claims_claim_change", args=[self.claim.pk]),
+        ]
+        self.add_notes(3)
+        for url in urls:  # warm the ContentType cache first
+            self.count_queries(url)
+        few = [self.count_queries(url) for url in urls]
+        self.add_notes(30)
+        many = [self.count_queries(url) for url in urls]
+        self.assertEqual(few, many)
+
+    def test_notes_are_paged_with_a_revealed_sentinel(self):
+        self.add_notes(25)
+        resp = self.client.get(reverse("claims:detail", args=[self.claim.pk]))
+        self.assertContains(resp, 'class="note ', count=20)
+        self.assertContains(resp, 'hx-trigger="revealed"')
+        first = [n.pk for n in resp.context["notes"]]
+
+        resp = self.client.get(reverse("claims:notes", args=[self.claim.pk]),
+                               {"cursor": resp.context["next_notes_cursor"]})
+        self.assertContains(resp, 'class="note ', count=5)
+        self.assertNotContains(resp, 'hx-trigger="revealed"')
+        seen = first + [n.pk for n in resp.context["notes"]]
+        self.assertEqual(seen, list(self.claim.notes.order_by("-created_at", "-id").values_list("pk", flat=True)))
+
+    def test_add_note_query_count(self):
+        url = reverse("claims:add_note", args=[self.claim.pk])
+        # session + user, then the pk-only claim lookup, the insert and its change-log row
+        with self.assertNumQueries(5):
+            resp = self.client.post(url, {"body": "checked", "kind": "admin"})
+        self.assertContains(resp, "checked")
+
+
+@web_settings
+class ExportTests(TestCase):
+    def setUp(self):
+        make_claim(1, patient_name="Ann, Jr.", status=Claim.Status.PAID, discharge_date="2023-01-02")
+        make_claim(2, status=Claim.Status.DENIED, cpt_codes="82947")
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="pw"))
+
+    def rows(self, content):
+        return list(csv.reader(io.StringIO(content.decode())))
+
+    def test_filtered_export_streams_csv(self):
+        resp = self.client.get(reverse("claims:export"), {"status": "paid"})
+        self.assertTrue(resp.streaming)
+        rows = self.rows(b"".join(resp.streaming_content))
+        self.assertEqual(rows[0][:4], ["claim_id", "patient_name", "insurer", "status"])
+        self.assertEqual(rows[1][:4], ["1", "Ann, Jr.", "Aetna", "Paid"])
+        self.assertEqual(len(rows), 2)
+
+    def test_gzip_and_chunking(self):
+        resp = self.client.get(reverse("claims:export"), {"gzip": "1"})
+        self.assertEqual(resp["Content-Type"], "application/gzip")
+        rows = self.rows(gzip.decompress(b"".join(resp.streaming_content)))
+        self.assertEqual([r[0] for r in rows[1:]], ["1", "2"])  # newest discharge first
+        chunks = list(exports.csv_chunks(Claim.objects.order_by("claim_id"), chunk_size=1))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(self.rows("".join(chunks).encode()), rows)
+
+    async def test_async_serving_pulls_one_chunk_at_a_time(self):
+        await sync_to_async(self.async_client.force_login)(await get_user_model().objects.aget(username="admin"))
+        resp = await self.async_client.get(reverse("claims:export"), {"gzip": "1"})
+        body = b"".join([part async for part in resp])
+        self.assertEqual([r[0] for r in self.rows(gzip.decompress(body))], ["claim_id", "1", "2"])
+
+        resp = await sync_to_async(exports.export_response)(Claim.objects.order_by("claim_id"), chunk_size=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")  # Django warns when it has to list() a sync iterator
+            parts = [part async for part in resp]
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(len(self.rows(b"".join(parts))), 3)
+
+    def test_admin_action(self):
+        resp = self.client.post(reverse("admin:claims_claim_changelist"), {
+            "action": "export_selected", "_selected_action": [c.pk for c in Claim.objects.all()],
+        })
+        self.assertTrue(resp.streaming)
+        self.assertEqual(len(self.rows(b"".join(resp.streaming_content))), 3)
+
+
+class BatchReportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("auditor", password="pw")
+        a = make_claim(1, cpt_codes="99204,82947")
+        make_claim(2, status=Claim.Status.PAID, billed_amount=Decimal("50.00"), paid_amount=Decimal("50.00"))
+        make_claim(3, insurer="Cigna")
+        Note.objects.create(claim=a, body="Called payer", created_by=self.user)
+        Note.objects.create(claim=a, kind=Note.Kind.SYSTEM, body="Flagged")
+        self.out = Path(tempfile.mkdtemp())
+
+    def test_zip_report_across_chunks(self):
+        out = StringIO()
+        # one claim per chunk; --workers 1 renders inline (the test database isn't visible to child processes)
+        call_command("generate_reports", "--output", str(self.out / "r.zip"), "--insurer", "Aetna",
+                     "--workers", "1", "--chunk-size", "1", stdout=out)
+        self.assertIn("2/2 claims", out.getvalue())
+        with zipfile.ZipFile(self.out / "r.zip") as archive:
+            read = lambda name: list(csv.reader(io.StringIO(archive.read(name).decode())))
+            claims = read("claims.csv")
+            self.assertEqual([r[0] for r in claims[1:]], ["1", "2"])
+            self.assertEqual(claims[1][6], "60.00")
+            self.assertEqual(claims[1][10], "2")
+            self.assertEqual([r[4] for r in read("notes.csv")[1:]], ["Called payer", "Flagged"])
+            self.assertEqual(read("notes.csv")[1][2], "auditor")
+            self.assertEqual([r[2] for r in read("cpt_codes.csv")[1:]], ["99204", "82947", "99204"])
+            summary = {r[0]: r[1:] for r in read("cpt_summary.csv")[1:]}
+            self.assertEqual(summary["99204"], ["2", "1", "150.00", "90.00", "60.00"])
+
+    def test_bad_dates_are_rejected(self):
+        with self.assertRaisesMessage(CommandError, "Bad date (expected YYYY-MM-DD): '2023-13-01'"):
+            call_command("generate_reports", "--output", str(self.out / "r.csv"), "--date-from", "2023-13-01",
+                         stdout=StringIO())
+
+    def test_csv_report_for_ids(self):
+        call_command("generate_reports", "--output", str(self.out / "r.csv"), "--ids", "3,1",
+                     "--workers", "1", stdout=StringIO())
+        rows = list(csv.reader((self.out / "r.csv").open()))
+        self.assertEqual([r[0] for r in rows[1:]], ["1", "3"])
+        self.assertIn("Admin Note] Called payer", rows[1][11])
+
+
+class SyntheticDataTests(TestCase):
+    def test_generator_is_deterministic_and_skewed(self):
+        first = list(synthetic.generate(2000, seed=3))
+        self.assertEqual(first, list(synthetic.generate(2000, seed=3)))
+        self.assertNotEqual(first, list(synthetic.generate(2000, seed=4)))
+        insurers = Counter(line.split("|")[5] for line, _ in first)
+        top, tail = insurers[synthetic.INSURERS[0]], insurers[synthetic.INSURERS[-1]]
+        self.assertGreater(top, 5 * tail)
+
+    def test_files_import_cleanly(self):
+        tmp = Path(tempfile.mkdtemp())
+        out = StringIO()
+        call_command("generate_claims", "--rows", "0.3k", "--list", str(tmp / "l.csv"), "--detail", str(tmp / "d.csv"), stdout=out)
+        self.assertIn("Wrote 300 claims", out.getvalue())
+        call_command("import_claims", "--list", str(tmp / "l.csv"), "--detail", str(tmp / "d.csv"), stdout=out)
+        self.assertEqual(Claim.objects.count(), 300)
+        self.assertEqual(ClaimCPT.objects.values("claim").distinct().count(), 300)
+
+
+@web_settings
+class BenchmarkHarnessTests(TestCase):
+    def test_run_and_compare(self):
+        results = benchmarks.run_benchmarks(200, repeat=1)
+        self.assertEqual(results["meta"]["rows"], 200)
+        self.assertIn("claim_search[deep_page]", results["timings"])
+        self.assertIn("export_csv_gzip", results["timings"])
+        self.assertIn("parse_rows[us,after]", results["timings"])
+
+        baseline = json.loads(json.dumps(results))
+        baseline["timings"]["admin_dashboard"]["median"] = results["timings"]["admin_dashboard"]["median"] / 2
+        regressed = {name for name, *_, bad in benchmarks.compare(results, baseline, tolerance=0.5) if bad}
+        self.assertEqual(regressed, {"admin_dashboard"})
+
+
+@web_settings
+@override_settings(CLAIMS_METRICS_SAMPLE_RATE=1.0, CLAIMS_METRICS_N_PLUS_ONE=3, CLAIMS_METRICS_TOKEN="s3cret")
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.claim = make_claim(1)
+        self.staff = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+
+    def test_records_per_view_stats(self):
+        self.client.get(reverse("claims:search"), {"status": "denied"})
+        self.client.get(reverse("claims:detail", args=[self.claim.pk]))
+        views = metrics.snapshot()
+        search = views["claims:search"]
+        self.assertEqual(search.count, 1)
+        self.assertGreater(search.queries, 0)
+        self.assertGreater(search.render_seconds, 0)
+        self.assertGreater(search.bytes, 0)
+        self.assertEqual(sum(search.buckets), 1)
+        self.assertEqual(views["claims:detail"].n_plus_one, 0)
+
+    def test_flags_repeated_statements(self):
+        req = metrics.RequestStats()
+        run = lambda sql, params, many, context: None
+        for pk in range(3):
+            req(run, "SELECT * FROM auth_user WHERE id = %s", [pk], False, {})
+        req(run, "SELECT 1", [], False, {})
+        metrics.record("claims:detail", req, 10)
+        stats = metrics.snapshot()["claims:detail"]
+        self.assertEqual((stats.queries, stats.n_plus_one), (4, 1))
+        self.assertEqual(metrics.recent_n_plus_one[-1], ("claims:detail", 3, "SELECT * FROM auth_user WHERE id = %s"))
+
+    @override_settings(CLAIMS_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_cost_nothing(self):
+        self.client.get(reverse("claims:search"))
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_staff_page_and_prometheus_endpoint(self):
+        self.client.get(reverse("claims:search"))
+        self.assertEqual(self.client.get(reverse("claims:metrics")).status_code, 403)
+        text = self.client.get(reverse("claims:metrics"), HTTP_AUTHORIZATION="Bearer s3cret").content.decode()
+        self.assertIn('claims_request_duration_seconds_bucket{view="claims:search",le="+Inf"} 1', text)
+        self.assertIn('claims_db_queries_total{view="claims:search"}', text)
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse("claims:performance")), "claims:search")
+
+
+@web_settings
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        caches["fragments"].clear()
+        self.claim = make_claim(1, status=Claim.Status.DENIED)
+        self.user = get_user_model().objects.create_user("adjuster", password="pw")
+
+    def test_htmx_views_are_async(self):
+        for view in (views.claim_search, views.claim_detail, views.claim_notes, views.flag_for_review, views.add_note):
+            self.assertTrue(asyncio.iscoroutinefunction(view), view.__name__)
+
+    async def test_search_and_detail(self):
+        resp = await self.async_client.get(reverse("claims:search"), {"status": "denied"})
+        self.assertContains(resp, "Patient 1")
+        resp = await self.async_client.get(reverse("claims:detail", args=[self.claim.pk]))
+        self.assertContains(resp, "99204")
+        self.assertContains(resp, "Login")
+        resp = await self.async_client.get(reverse("claims:detail", args=[self.claim.pk + 1]))
+        self.assertEqual(resp.status_code, 404)
+
+    async def test_flag_for_review(self):
+        resp = await self.async_client.post(reverse("claims:flag", args=[self.claim.pk]))
+        self.assertContains(resp, "Under Review")
+        claim = await Claim.objects.aget(pk=self.claim.pk)
+        self.assertEqual(claim.status, Claim.Status.UNDER_REVIEW)
+        # the post_save signal still keeps the stats in step
+        stat = await ClaimStat.objects.aget(dimension="status", key=Claim.Status.UNDER_REVIEW)
+        self.assertEqual(stat.claims, 1)
+
+    async def test_add_note_needs_a_login(self):
+        url = reverse("claims:add_note", args=[self.claim.pk])
+        resp = await self.async_client.post(url, {"kind": "admin", "body": "hi"})
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn(reverse("login"), resp["Location"])
+        self.assertFalse(await Note.objects.aexists())
+
+    async def test_session_user_is_loaded_async(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        resp = await self.async_client.post(reverse("claims:add_note", args=[self.claim.pk]),
+                                            {"kind": "admin", "body": "checked"})
+        self.assertContains(resp, "by adjuster")
+        note = await Note.objects.select_related("created_by").aget()
+        self.assertEqual(note.created_by, self.user)
+        resp = await self.async_client.get(reverse("claims:detail", args=[self.claim.pk]))
+        self.assertContains(resp, "Signed in as <strong>adjuster</strong>")
+
+        # a password change invalidates the session hash: back to anonymous
+        self.user.set_password("new")
+        await self.user.asave()
+        resp = await self.async_client.get(reverse("claims:detail", args=[self.claim.pk]))
+        self.assertContains(resp, "Login")
+        self.assertNotContains(resp, "Signed in as")
+
+    @override_settings(CLAIMS_METRICS_SAMPLE_RATE=1.0)
+    async def test_performance_middleware_in_async_mode(self):
+        metrics.reset()
+
+        async def view(request):
+            await Claim.objects.acount()
+            return HttpResponse("ok")
+
+        middleware = PerformanceMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        # the ORM call runs on the thread-sensitive thread; hook its connection
+        # the way connection_created does for fresh ones
+        await sync_to_async(metrics.install)(connection)
+        await middleware(RequestFactory().get("/"))
+        stats = metrics.snapshot()["<unresolved>"]
+        self.assertEqual((stats.count, stats.queries), (1, 1))
+
+
+@web_settings
+class InsurerTypeaheadTests(TestCase):
+    def setUp(self):
+        for i, insurer in enumerate(["Aetna"] * 3 + ["Cigna"] * 2 + ["Blue Cross"]):
+            make_claim(i, insurer=insurer)
+
+    def options(self, **params):
+        resp = self.client.get(reverse("claims:insurers"), params)
+        self.assertEqual(resp.status_code, 200)
+        return re.findall(r'<option value="([^"]*)">', resp.content.decode())
+
+    def test_biggest_insurers_first(self):
+        self.assertEqual(self.options(), ["Aetna", "Cigna", "Blue Cross"])
+
+    def test_prefix_of_the_name_or_a_word(self):
+        self.assertEqual(self.options(insurer="  c"), ["Cigna", "Blue Cross"])
+        self.assertEqual(self.options(insurer="CROSS"), ["Blue Cross"])
+        self.assertEqual(self.options(insurer="etna"), [])
+
+    def test_follows_claim_writes(self):
+        Claim.objects.filter(insurer="Blue Cross").get().delete()
+        make_claim(100, insurer="Humana")
+        self.assertNotIn("Blue Cross", self.options())
+        self.assertIn("Humana", self.options(insurer="hu"))
+
+    def test_top_k_only(self):
+        for i in range(15):
+            make_claim(200 + i, insurer=f"Plan {i:02d}")
+        self.assertEqual(len(self.options(insurer="plan")), views.INSURER_SUGGESTIONS)
+
+    def test_list_page_loads_options_lazily(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("claims:list"))
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if "DISTINCT" in q["sql"]])
+        self.assertContains(resp, reverse("claims:insurers"))
+        self.assertNotContains(resp, '<option value="Cigna">')
+
+
+class ChangeLogTests(TestCase):
+    def log(self):
+        return list(ChangeLog.objects.values_list("action", "object_id"))
+
+    def test_saves_and_deletes_are_logged(self):
+        claim = make_claim(1)
+        claim.status = Claim.Status.PAID
+        claim.save(update_fields=["status"])
+        pk = claim.pk
+        claim.delete()
+        self.assertEqual(self.log(), [("save", pk), ("save", pk), ("delete", pk)])
+        seqs = list(ChangeLog.objects.values_list("seq", flat=True))
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(ChangeLog.last_seq(), seqs[-1])
+
+    def test_import_batches_log_every_row(self):
+        defaults = BulkClaimWriterTests().defaults
+        with BulkClaimWriter(batch_size=2, upsert=True) as w:
+            for claim_id in (1, 2, 3):
+                w.add(claim_id, defaults(f"P{claim_id}"))
+        pks = dict(Claim.objects.values_list("claim_id", "pk"))
+        self.assertEqual(self.log(), [("save", pks[1]), ("save", pks[2]), ("save", pks[3])])
+
+    def test_bulk_update_logs_a_reset(self):
+        make_claim(1)
+        call_command("rebuild_claim_stats", stdout=StringIO())
+        self.assertEqual(self.log()[-1], ("reset", None))
+
+    def test_notes_are_logged(self):
+        claim = make_claim(1)
+        note = Note.objects.create(claim=claim, body="hi")
+        pk, note_pk = claim.pk, note.pk
+        claim.delete()  # cascades to the note
+        log = list(ChangeLog.objects.values_list("action", "kind", "object_id"))
+        self.assertEqual(log, [("save", "claim", pk), ("save", "note", note_pk),
+                               ("delete", "note", note_pk), ("delete", "claim", pk)])
+
+    def test_log_rolls_back_with_the_write(self):
+        claim = make_claim(1)
+        claim.paid_amount = "not a number"
+        with self.assertRaises(Exception):
+            claim.save()
+        self.assertEqual(self.log(), [("save", claim.pk)])
+
+
+@web_settings
+@override_settings(CLAIMS_FEED_TOKEN="feed")
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.url = reverse("claims:changes")
+        self.claims = [make_claim(i) for i in range(3)]
+        self.note = Note.objects.create(claim=self.claims[0], body="first")
+        self.pks = [c.pk for c in self.claims]
+        self.claims[1].delete()
+
+    def feed(self, **params):
+        resp = self.client.get(self.url, params, HTTP_AUTHORIZATION="Bearer feed")
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_requires_staff_or_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user("staff", password="x", is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_pages_through_every_change_with_current_rows(self):
+        seen, since = [], 0
+        with self.assertNumQueries(3):
+            first = self.feed(since=since, limit=4)
+        while True:
+            page = self.feed(since=since, limit=4)
+            seen += page["changes"]
+            since = page["next"]
+            if not page["more"]:
+                break
+        self.assertEqual(first["changes"], seen[:4])
+        self.assertEqual([(c["action"], c["kind"], c["id"]) for c in seen], [
+            ("save", "claim", self.pks[0]), ("save", "claim", self.pks[1]),
+            ("save", "claim", self.pks[2]), ("save", "note", self.note.pk), ("delete", "claim", self.pks[1]),
+        ])
+        self.assertEqual(seen[0]["data"]["billed_amount"], "100.00")
+        self.assertIsNone(seen[1]["data"])  # deleted since
+        self.assertEqual(seen[3]["data"]["body"], "first")
+        self.assertEqual(self.feed(since=since), {"changes": [], "next": since, "more": False})
+
+    def test_waits_at_a_hole_in_seq(self):
+        seqs = list(ChangeLog.objects.values_list("seq", flat=True))
+        ChangeLog.objects.filter(seq=seqs[2]).delete()  # as if its transaction hadn't committed yet
+        page = self.feed(since=0)
+        self.assertEqual(([c["seq"] for c in page["changes"]], page["next"], page["more"]), (seqs[:2], seqs[1], False))
+        ChangeLog.objects.update(created_at=timezone.now() - changefeed.GAP_WAIT)  # rolled back after all
+        self.assertEqual([c["seq"] for c in self.feed(since=seqs[1])["changes"]], seqs[3:])
+
+    def test_bad_since(self):
+        resp = self.client.get(self.url, {"since": "x"}, HTTP_AUTHORIZATION="Bearer feed")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_compaction_keeps_latest_entry_per_object(self):
+        claim = self.claims[0]
+        claim.status = Claim.Status.PAID
+        claim.save(update_fields=["status"])
+        before = {(c["kind"], c["id"]): c["action"] for c in self.feed(limit=100)["changes"]}
+        # holes in seq right after recent entries are held back (see test_waits_at_a_hole_in_seq)
+        ChangeLog.objects.update(created_at=timezone.now() - changefeed.GAP_WAIT)
+        call_command("compact_change_log", before_seq=ChangeLog.last_seq(), stdout=StringIO())
+        log = list(ChangeLog.objects.values_list("action", "kind", "object_id"))
+        self.assertEqual(log, [("save", "claim", self.claims[2].pk), ("save", "note", self.note.pk),
+                               ("delete", "claim", self.pks[1]), ("save", "claim", claim.pk)])
+        after = {(c["kind"], c["id"]): c["action"] for c in self.feed(limit=100)["changes"]}
+        self.assertEqual(after, before)
+
+    def test_compaction_drops_everything_before_a_reset(self):
+        call_command("rebuild_claim_stats", stdout=StringIO())
+        make_claim(9)
+        reset = ChangeLog.objects.get(action="reset").seq
+        call_command("compact_change_log", before_seq=reset, stdout=StringIO())
+        self.assertEqual(list(ChangeLog.objects.values_list("action", flat=True)), ["reset", "save"])
+
+    def test_recent_entries_are_kept(self):
+        out = StringIO()
+        call_command("compact_change_log", stdout=out)
+        self.assertIn("Nothing to compact", out.getvalue())
+        self.assertEqual(ChangeLog.objects.count(), 5)
+
+
+@skipUnless(columnar.np is not None, "needs numpy")
+@override_settings(CLAIMS_COLUMNAR=True)
+class ColumnarTests(TestCase):
+    def setUp(self):
+        columnar._columns = columnar.ClaimColumns()
+        rnd = random.Random(7)
+        self.rnd = rnd
+
+        def claims():
+            for i in range(120):
+                billed = Decimal(rnd.randrange(100, 100000)) / 100
+                yield {"claim_id": i, "billed_amount": billed,
+                       "paid_amount": (billed * Decimal(rnd.random())).quantize(Decimal("0.01")),
+                       "status": rnd.choice(columnar.STATUSES), "insurer": rnd.choice(["Aetna", "Blue Cross", "Cigna"]),
+                       "discharge_date": date(2023, 1, 1 + rnd.randrange(10))}
+        seed_claims(claims())
+
+    def assertSameAsDatabase(self, **params):
+        cursor, db_cursor = None, None
+        while True:
+            rows, cursor = columnar.claims_page({**params, "cursor": cursor}, size=7)
+            qs = Claim.objects.all()
+            if params.get("q"):
+                qs = search_claims(qs, params["q"])
+            if params.get("status"):
+                qs = qs.filter(status=params["status"])
+            if params.get("insurer"):
+                qs = qs.filter(insurer__icontains=params["insurer"])
+            expected, db_cursor = keyset_page(qs, db_cursor, size=7)
+            self.assertEqual(rows, expected, params)
+            self.assertEqual(cursor, db_cursor)
+            if not cursor:
+                return
+
+    def check_filters(self):
+        for params in ({}, {"status": "denied"}, {"insurer": "CROSS"}, {"status": "paid", "insurer": "a"},
+                       {"q": "5"}, {"q": "1"}, {"q": "0"}, {"q": "05"}, {"status": "nope"}):
+            self.assertSameAsDatabase(**params)
+        expected = list(Claim.objects.filter(underpayment__gt=0).order_by("-underpayment", "-pk")[:10])
+        self.assertEqual(columnar.top_underpaid(10), expected)
+
+    def test_matches_the_database(self):
+        self.check_filters()
+        self.assertIsNone(columnar.claims_page({"q": "Patient"}))
+        self.assertIsNone(columnar.claims_page({"q": "\u00b2"}))  # a digit to isdigit(), not to int()
+        self.assertIsNone(columnar.claims_page({"cpt": "99204"}))
+
+    def test_follows_the_change_log_incrementally(self):
+        self.check_filters()
+        loaded = columnar._columns.seq
+        reloads = []
+        load = columnar._columns.load
+        columnar._columns.load = lambda: reloads.append(1) or load()
+
+        for claim in Claim.objects.order_by("?")[:20]:
+            claim.status = Claim.Status.DENIED
+            claim.paid_amount = Decimal("0.00")
+            claim.save()
+        Claim.objects.filter(claim_id__lt=10).delete()
+        make_claim(500, insurer="Humana", discharge_date=date(2023, 1, 20))
+        with BulkClaimWriter(upsert=True) as w:
+            w.add(501, BulkClaimWriterTests().defaults("bulk"))
+            w.add(20, {**BulkClaimWriterTests().defaults("moved"), "insurer": "Humana"})
+        self.check_filters()
+        self.assertSameAsDatabase(insurer="humana")
+        self.assertEqual(reloads, [])
+        self.assertGreater(columnar._columns.seq, loaded)
+
+        ChangeLog.log(ChangeLog.Action.RESET)
+        columnar.columns()
+        self.assertEqual(reloads, [1])
+
+    def test_seq_gaps_are_rechecked(self):
+        cols = columnar._columns
+        cols.seq = 5
+        cols._track_gaps([6, 9])
+        self.assertEqual((cols.seq, sorted(cols.gaps)), (9, [7, 8]))
+        cols._track_gaps([7])
+        self.assertEqual((cols.seq, sorted(cols.gaps)), (9, [8]))
+
+    def test_cursor_pk_past_32_bits(self):
+        last = Claim.objects.order_by("discharge_date", "id").last()
+        cursor = encode_cursor(Claim(pk=2 ** 40, discharge_date=last.discharge_date))
+        rows, _ = columnar.claims_page({"cursor": cursor}, size=7)
+        expected, _ = keyset_page(Claim.objects.all(), cursor, size=7)
+        self.assertEqual(rows, expected)
+
+    @web_settings
+    def test_search_view_uses_the_arrays(self):
+        caches["fragments"].clear()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("claims:search"), {"status": "denied"})
+        self.assertContains(resp, "<tr>", count=min(50, Claim.objects.filter(status="denied").count()))
+        claim_sql = [q["sql"] for q in ctx.captured_queries if 'FROM "claims_claim"' in q["sql"]]
+        # the initial load, then only the shown rows by pk
+        self.assertEqual(len(claim_sql), 2)
+        self.assertIn("IN (", claim_sql[-1])
+
+
+PLAN_TABLES = ("claims_claim", "claims_note", "claims_claimcpt", "claims_claimstat")
+
+
+@web_settings
+@skipUnless(connection.vendor == "sqlite", "plan assertions are written against SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the hot views run over a seeded, ANALYZEd table and
+    fail on a bare table scan of a claims table. Pages driven by the keyset
+    index must also come out in index order (no sort); pages driven by a
+    search/CPT match sort just the matched rows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(7)
+        seed_claims(
+            ({"claim_id": i, "billed_amount": Decimal(100), "paid_amount": Decimal(rnd.randint(0, 150)),
+              "status": rnd.choice(["paid", "denied", "review"]), "insurer": f"Insurer {i % 30}",
+              "discharge_date": date(2020 + i % 4, 1 + i % 12, 1 + i % 28)}
+             for i in range(1, 5001)),
+            ({"claim": pk, "body": "n"} for pk in range(1, 2001)),
+        )
+        with connection.cursor() as cur:
+            cur.execute("ANALYZE")
+        cls.staff = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.client.force_login(self.staff)
+
+    def plans(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url, params or {}).status_code, 200)
+        out = []
+        with connection.cursor() as cur:
+            for q in ctx.captured_queries:
+                sql = q["sql"]
+                if not sql.startswith("SELECT") or not any(t in sql for t in PLAN_TABLES):
+                    continue
+                cur.execute("EXPLAIN QUERY PLAN " + sql)
+                out.append((sql, [row[-1] for row in cur.fetchall()]))
+        return out
+
+    def assertIndexed(self, url, params=None, sorts=False):
+        plans = self.plans(url, params)
+        self.assertTrue(plans)
+        for sql, plan in plans:
+            for step in plan:
+                table = step.split()[1] if step.startswith("SCAN ") else None
+                self.assertFalse(table in PLAN_TABLES and "INDEX" not in step, f"table scan: {step}\n{sql}")
+                if not sorts:
+                    self.assertNotIn("TEMP B-TREE FOR ORDER BY", step, sql)
+
+    def test_claim_list(self):
+        self.assertIndexed(reverse("claims:list"))
+        self.assertIndexed(reverse("claims:list"), {"status": "denied", "insurer": "Insurer 3"})
+
+    def test_claim_search(self):
+        _, cursor = keyset_page(Claim.objects.all())
+        self.assertIndexed(reverse("claims:search"), {"status": "paid", "cursor": cursor})
+        self.assertIndexed(reverse("claims:search"), {"q": "Patient 12"}, sorts=True)
+        self.assertIndexed(reverse("claims:search"), {"q": "12"}, sorts=True)  # claim_id prefix ranges
+        self.assertIndexed(reverse("claims:search"), {"cpt": "99204", "cursor": cursor}, sorts=True)
+
+    def test_admin_dashboard(self):
+        self.assertIndexed(reverse("claims:admin_dashboard"))
+
+    def test_insurer_typeahead(self):
+        # seeks to the insurer rows of ClaimStat; sorting that handful by count is fine
+        self.assertIndexed(reverse("claims:insurers"), {"insurer": "ins"}, sorts=True)
+
+    def test_claim_detail(self):
+        Note.objects.create(claim=Claim.objects.get(claim_id=10), body="latest")
+        # sorts=True only for the few ClaimCPT rows of this claim (ordered by position)
+        self.assertIndexed(reverse("claims:detail", args=[Claim.objects.get(claim_id=10).pk]), sorts=True)
+        notes = [plan for sql, plan in self.plans(reverse("claims:detail", args=[Claim.objects.get(claim_id=10).pk]))
+                 if 'FROM "claims_note"' in sql]
+        self.assertEqual(len(notes), 1)
+        self.assertEqual(notes[0][0], "SEARCH claims_note USING INDEX claims_note_claim_created_idx (claim_id=?)")
+        self.assertFalse([step for step in notes[0] if "B-TREE" in step])
+
+
+@web_settings
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_claim(1, insurer="Aetna", status=Claim.Status.DENIED, billed_amount=Decimal("100.00"),
+                   paid_amount=Decimal("0.00"), discharge_date=date(2023, 1, 5), cpt_codes="99204,82947")
+        make_claim(2, insurer="Aetna", status=Claim.Status.PAID, billed_amount=Decimal("100.00"),
+                   paid_amount=Decimal("50.00"), discharge_date=date(2023, 2, 5), cpt_codes="99204")
+        make_claim(3, insurer="Cigna", status=Claim.Status.PAID, billed_amount=Decimal("10.00"),
+                   paid_amount=Decimal("20.00"), discharge_date=date(2023, 2, 9), cpt_codes="82947")
+
+    def test_breakdowns(self):
+        by_insurer = {r["key"]: r for r in analytics.breakdown("insurer")}
+        self.assertEqual(by_insurer["Aetna"]["claims"], 2)
+        self.assertEqual(by_insurer["Aetna"]["denial_rate"], 0.5)
+        self.assertEqual(by_insurer["Aetna"]["paid_ratio"], 0.25)
+        self.assertEqual(by_insurer["Aetna"]["underpaid"], Decimal("150.00"))
+        self.assertEqual(by_insurer["Cigna"]["underpaid"], 0)  # overpayment doesn't offset
+
+        by_month = {r["key"]: r["claims"] for r in analytics.breakdown("month")}
+        self.assertEqual(by_month, {"2023-01": 1, "2023-02": 2})
+
+        by_cpt = {r["key"]: (r["claims"], r["underpaid"]) for r in analytics.breakdown("cpt", {"insurer": "Aetna"})}
+        self.assertEqual(by_cpt, {"99204": (2, Decimal("150.00")), "82947": (1, Decimal("100.00"))})
+
+    def test_stat_rows_match_group_by(self):
+        # an empty-but-present filter set forces the GROUP BY path
+        everything = {"date_from": "2000-01-01"}
+        for dimension in analytics.DIMENSIONS:
+            with self.assertNumQueries(2):  # the generation (last change-log seq), then the stat rows
+                materialized = analytics.breakdown(dimension)
+            self.assertEqual(materialized, analytics.breakdown(dimension, everything), dimension)
+
+    def test_results_are_cached_per_filter_set(self):
+        analytics.breakdown("insurer", {"status": "paid"})
+        with self.assertNumQueries(1):  # only the generation
+            analytics.breakdown("insurer", {"status": "paid"})
+        with self.assertNumQueries(2):
+            analytics.breakdown("insurer", {"status": "denied"})
+
+    def test_writes_retire_cached_results(self):
+        caches["fragments"].clear()
+        self.assertEqual(len(analytics.breakdown("insurer")), 2)
+        self.assertEqual(len(analytics.breakdown("insurer", {"status": "paid"})), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Claim.objects.get(claim_id=3).delete()
+        self.assertEqual([r["key"] for r in analytics.breakdown("insurer")], ["Aetna"])
+        self.assertEqual([r["key"] for r in analytics.breakdown("insurer", {"status": "paid"})], ["Aetna"])
+
+        Claim.objects.filter(claim_id=2).update(paid_amount=Decimal("0.00"))  # bypasses save() and the stats
+        underpaid_at_reset = []
+        log = ChangeLog.log
+
+        def logged(*args, **kwargs):
+            underpaid_at_reset.append(ClaimStat.objects.get(dimension="insurer", key="Aetna").underpaid_total)
+            return log(*args, **kwargs)
+
+        with mock.patch.object(ChangeLog, "log", logged):
+            call_command("rebuild_claim_stats", stdout=StringIO())
+        # the RESET retires the cache, so the stat rows it commits with are already the new ones
+        self.assertEqual(underpaid_at_reset, [Decimal("200.00")])
+        self.assertEqual(analytics.breakdown("insurer")[0]["underpaid"], Decimal("200.00"))
+
+    def test_json_and_chart_endpoints(self):
+        self.client.force_login(get_user_model().objects.create_user("staff", password="pw", is_staff=True))
+        data = self.client.get(reverse("claims:analytics"), {"dimension": "month", "date_from": "2023-02-01"}).json()
+        self.assertEqual(data["filters"], {"date_from": "2023-02-01"})
+        self.assertEqual([r["key"] for r in data["rows"]], ["2023-02"])
+        self.assertEqual(self.client.get(reverse("claims:analytics"), {"dimension": "nope"}).status_code, 400)
+        self.assertContains(self.client.get(reverse("claims:analytics_chart"), {"dimension": "cpt"}), "99204")
+
+
+@skipUnless(snapshot.available(), "needs numpy")
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches["fragments"].clear()
+        self.path = Path(tempfile.mkdtemp()) / "claims.npz"
+        self.user = get_user_model().objects.create_user("ann", password="pw")
+        for i, insurer in enumerate(["Aetna", "Cigna", "Aetna", "Humana", "Cigna"]):
+            make_claim(i, insurer=insurer, billed_amount=Decimal(f"{100 + i}.35"), paid_amount=Decimal(f"{30 * i}.10"),
+                       status=[Claim.Status.DENIED, Claim.Status.PAID][i % 2], cpt_codes=f"99204,8294{i}",
+                       discharge_date=date(2023, 1 + i, 9), denial_reason="late" if i == 2 else "")
+        claim = Claim.objects.get(claim_id=1)
+        Note.objects.create(claim=claim, body="called the payer \u2013 twice", created_by=self.user)
+        Note.objects.create(claim=claim, kind=Note.Kind.SYSTEM, body="flagged")
+
+    def rows(self):
+        return (list(Claim.objects.order_by("pk").values_list()),
+                list(Note.objects.order_by("pk").values_list()),
+                sorted(ClaimCPT.objects.values_list("claim_id", "code")))
+
+    def test_round_trip(self):
+        before, breakdown = self.rows(), analytics.breakdown("insurer")
+        meta = snapshot.dump(self.path, row_group=2)
+        self.assertEqual(meta["tables"]["claim"]["rows"], 5)
+        self.assertEqual(len(meta["tables"]["claim"]["groups"]), 3)
+
+        Claim.objects.filter(claim_id=0).delete()
+        make_claim(77)
+        Note.objects.update(body="edited")
+        counts = snapshot.restore(self.path)
+
+        self.assertEqual(counts, {"claim": 5, "note": 2})
+        self.assertEqual(self.rows(), before)  # pks, created_at, content_hash and authors included
+        self.assertEqual(analytics.breakdown("insurer"), breakdown)
+        self.assertEqual(ChangeLog.objects.latest("seq").action, ChangeLog.Action.RESET)
+        self.assertGreater(make_claim(78).pk, max(row[0] for row in before[0]))
+
+    def test_numeric_columns_are_memory_mapped(self):
+        snapshot.dump(self.path, row_group=2)
+        with snapshot.Snapshot(self.path) as snap:
+            self.assertEqual(snap.rows("claim"), 5)
+            group = next(snap.groups("claim"))
+            self.assertIsInstance(group.array("billed_amount"), snapshot.np.memmap)
+            self.assertEqual(group.values("billed_amount"), [Decimal("100.35"), Decimal("101.35")])
+            self.assertEqual(group.values("insurer"), ["Aetna", "Cigna"])
+            self.assertEqual(group.values("discharge_date"), [date(2023, 1, 9), date(2023, 2, 9)])
+
+            for dimension in ("insurer", "month"):
+                expected = [(r["key"], r["claims"], r["denied"], r["billed"], r["underpaid"])
+                            for r in analytics.breakdown(dimension)]
+                self.assertEqual([(r["key"], r["claims"], r["denied"], r["billed"], r["underpaid"])
+                                  for r in snapshot.totals(snap, dimension)], expected, dimension)
+            by_status = {r["key"]: (r["claims"], r["denied"]) for r in snapshot.totals(snap, "status")}
+            self.assertEqual(by_status, {"denied": (3, 3), "paid": (2, 0)})
+
+    def test_commands(self):
+        out = StringIO()
+        call_command("dump_snapshot", str(self.path), stdout=out)
+        self.assertIn("Wrote 5 claims, 2 notes", out.getvalue())
+        with self.assertRaisesMessage(CommandError, "--replace"):
+            call_command("restore_snapshot", str(self.path), stdout=StringIO())
+        out = StringIO()
+        call_command("restore_snapshot", str(self.path), "--replace", stdout=out)
+        self.assertIn("Restored 5 claims and 2 notes", out.getvalue())
+        self.assertEqual(Note.objects.get(created_by__isnull=False).created_by, self.user)
+
+    def test_without_numpy(self):
+        with mock.patch.object(snapshot, "np", None):
+            for command in ("dump_snapshot", "restore_snapshot"):
+                with self.assertRaisesMessage(CommandError, f"{command} needs NumPy"):
+                    call_command(command, str(self.path), stdout=StringIO())
+        with mock.patch.object(columnar, "np", None), self.settings(CLAIMS_COLUMNAR=True):
+            self.assertEqual([w.id for w in check_numpy(None)], ["claims.W001"])
+        self.assertEqual(check_numpy(None), [])
+
+
+class SeedClaimsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_claims", stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        caches["fragments"].clear()
+
+    def fixture(self, objects):
+        path = Path(tempfile.mkdtemp()) / "fixture.json"
+        path.write_text(json.dumps(objects))
+        return str(path)
+
+    def test_seeds_the_bundled_fixture(self):
+        fixture = json.loads(seed.DEFAULT_FIXTURE.read_text())
+        claims = [o for o in fixture if o["model"] == "claims.claim"]
+        self.assertEqual(Claim.objects.count(), len(claims))
+        self.assertEqual(Note.objects.count(), len(fixture) - len(claims))
+        for claim in Claim.objects.all():
+            self.assertEqual(claim.underpayment, claim.billed_amount - claim.paid_amount)
+            self.assertEqual(claim.content_hash, claim.compute_content_hash())
+            self.assertEqual(claim.cpt_list(), [c.code for c in claim.cpts.all()])
+        self.assertIsNotNone(Note.objects.first().created_at)
+        self.assertEqual(list(search_claims(Claim.objects.all(), "Chen").values_list("claim_id", flat=True)), [30002])
+        seeded = {r["key"]: r for r in analytics.breakdown("insurer")}
+        stats.rebuild()
+        cache.clear()
+        self.assertEqual({r["key"]: r for r in analytics.breakdown("insurer")}, seeded)
+        self.assertEqual(make_claim(1).pk, len(claims) + 1)  # sequences were reset
+
+    def test_streaming_parser(self):
+        objects = [{"model": "claims.note", "pk": i, "fields": {"body": "x" * i + "]}"}} for i in range(50)]
+        text = json.dumps(objects, indent=1)
+        self.assertEqual(list(seed.iter_objects(StringIO(text), chunk_size=7)), objects)
+        self.assertEqual(list(seed.iter_objects(StringIO(" [ ] "))), [])
+        for bad in ('{"model": "claims.claim"}', '[{"pk": 1} {"pk": 2}]', '[{"pk": 1}, {"pk"'):
+            with self.assertRaises(ValueError, msg=bad):
+                list(seed.iter_objects(StringIO(bad), chunk_size=4))
+
+    def test_replace_and_errors(self):
+        with self.assertRaisesMessage(CommandError, "--replace"):
+            call_command("seed_claims", stdout=StringIO())
+        path = self.fixture([
+            {"model": "claims.claim", "pk": 9, "fields": {
+                "claim_id": 1, "patient_name": "A", "billed_amount": "5.00", "insurer": "Aetna",
+                "discharge_date": "2024-01-02", "cpt_codes": "99204"}},
+            {"model": "claims.note", "pk": 3, "fields": {"claim": 9, "body": "hi"}},
+        ])
+        out = StringIO()
+        call_command("seed_claims", path, "--replace", stdout=out)
+        self.assertIn("Loaded 1 claims and 1 notes", out.getvalue())
+        claim = Claim.objects.get()
+        self.assertEqual((claim.pk, claim.status, claim.paid_amount, claim.denial_reason),
+                         (9, Claim.Status.UNDER_REVIEW, 0, ""))
+        self.assertEqual(ChangeLog.objects.latest("seq").action, ChangeLog.Action.RESET)
+
+        for objects in ([{"model": "auth.user", "pk": 1, "fields": {}}],
+                        [{"model": "claims.note", "pk": 4, "fields": {"claim": 999, "body": "orphan"}}]):
+            with self.assertRaisesMessage(CommandError, "Problem loading"):
+                call_command("seed_claims", self.fixture(objects), "--replace", stdout=StringIO())
+        self.assertEqual(Claim.objects.get().pk, 9)  # failed loads roll back
+
+
+@skipUnless(os.environ.get("CLAIMS_BENCHMARK_ROWS"), "set CLAIMS_BENCHMARK_ROWS (e.g. 1000000) to run")
+class AnalyticsBenchmark(TestCase):
+    """Opt-in: every uncached breakdown must finish in under a second on N synthetic claims."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = int(os.environ["CLAIMS_BENCHMARK_ROWS"])
+        rnd = random.Random(42)
+        insurers = [f"Insurer {i}" for i in range(40)]
+        cpts = [str(99200 + i) for i in range(60)]
+        statuses = [s for s, _ in Claim.Status.choices]
+
+        def claims():
+            for i in range(rows):
+                billed = Decimal(rnd.randint(100, 500000)) / 100
+                yield {"claim_id": i + 1, "patient_name": f"Patient {i}", "billed_amount": billed,
+                       "paid_amount": (billed * Decimal(rnd.random())).quantize(Decimal("0.01")),
+                       "status": rnd.choice(statuses), "insurer": rnd.choice(insurers),
+                       "discharge_date": date(2015 + i % 9, 1 + i % 12, 1 + i % 28),
+                       "cpt_codes": ",".join(rnd.sample(cpts, rnd.randint(1, 3)))}
+        seed_claims(claims())  # streamed: stats and CPT rows are rebuilt once at the end
+
+    def test_breakdowns_under_one_second(self):
+        for filters in ({}, {"insurer": "Insurer 7"}, {"status": "denied", "date_from": "2022-01-01"}):
+            for dimension in analytics.DIMENSIONS:
+                cache.clear()
+                started = time.perf_counter()
+                analytics.breakdown(dimension, filters)
+                elapsed = time.perf_counter() - started
+                self.assertLess(elapsed, 1.0, (dimension, filters))
 
-# Create your tests here.
@@ -6,10 +6,21 @@ app_name = 'claims'
 urlpatterns = [
     path('', views.claim_list, name='list'),
     path('search/', views.claim_search, name='search'),              # HTMX partial table update
+    path('insurers/', views.insurer_typeahead, name='insurers'),     # HTMX datalist options
+    path('export/', views.claim_export, name='export'),             # streamed CSV of the current filter
+    path('performance/', views.performance, name='performance'),     # staff page
+    path('metrics/', views.prometheus_metrics, name='metrics'),      # Prometheus text
+    path('changes/', views.change_feed, name='changes'),             # JSON sync feed (?since=<seq>)
+    path('search/cache/', views.search_cache_stats, name='search_cache'),  # JSON hit/miss counters
     path('<int:pk>/', views.claim_detail, name='detail'),
+    path('<int:pk>/notes/', views.claim_notes, name='notes'),        # HTMX older-notes page
     path('<int:pk>/flag/', views.flag_for_review, name='flag'),      # HTMX action
     path('<int:pk>/add-note/', views.add_note, name='add_note'),     # HTMX action
     path('<int:pk>/report/', views.generate_report, name='report'),  # HTMX action (dummy)
 path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('analytics/', views.analytics_data, name='analytics'),                  # JSON
+    path('analytics/chart/', views.analytics_chart, name='analytics_chart'),     # HTMX partial
     path('upload-csv/', views.csv_upload, name='csv_upload'),
+    path('imports/<int:pk>/', views.import_job, name='import_job'),
+    path('imports/<int:pk>/progress/', views.import_job_progress, name='import_job_progress'),  # HTMX poll
 ]
@@ -1,31 +1,43 @@
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseBadRequest
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.utils import timezone
-from .models import Claim, Note
-from .forms import NoteForm
+from django.conf import settings
+from . import analytics, changefeed, columnar, fragments, metrics, stats
+from .models import Claim, ClaimCPT, ClaimStat, ImportJob
+from .forms import CsvUploadForm, NoteForm
+from .exports import export_response
+from .auth import aget_user, alogin_required
+from .jobs import enqueue_import
+from .pagination import ORDERING, akeyset_page, anotes_page, keyset_page
+from .search import afts_available, search_claims
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Avg, F, DecimalField, ExpressionWrapper
-from django.contrib import messages
-from .forms import CsvUploadForm
 import csv
-from decimal import Decimal, InvalidOperation
-from pathlib import Path
 
 
-@login_required
-def add_note(request, pk):
+# claim_search, insurer_typeahead, claim_detail, claim_notes, flag_for_review
+# and add_note are async: under ASGI they run on the event loop and use the async ORM.
+# Don't touch request.user in them directly (it's a lazy sync lookup): await
+# aget_user(request) first, or use alogin_required instead of login_required.
+async def _aget_or_404(qs, **lookup):
+    try:
+        return await qs.aget(**lookup)
+    except qs.model.DoesNotExist:
+        raise Http404(f"No {qs.model._meta.object_name} matches the given query.")
+
+@alogin_required
+async def add_note(request, pk):
     if request.method != 'POST':
         return HttpResponseBadRequest("POST only")
-    claim = get_object_or_404(Claim, pk=pk)
+    claim = await _aget_or_404(Claim.objects.only('pk'), pk=pk)
     form = NoteForm(request.POST)
     if form.is_valid():
         note = form.save(commit=False)
         note.claim = claim
         note.created_by = request.user  # <-- who wrote this note
-        note.save()
+        await note.asave()
         html = render_to_string('claims/partials/note_item.html', {'n': note})
         return HttpResponse(html)
     return HttpResponseBadRequest("Invalid")
@@ -34,78 +46,193 @@ def add_note(request, pk):
 
 @staff_member_required
 def admin_dashboard(request):
-    qs = Claim.objects.all()
-    under_expr = ExpressionWrapper(F('billed_amount') - F('paid_amount'),
-                                   output_field=DecimalField(max_digits=12, decimal_places=2))
-    total = qs.count()
-    paid = qs.filter(status=Claim.Status.PAID).count()
-    denied = qs.filter(status=Claim.Status.DENIED).count()
-    review = qs.filter(status=Claim.Status.UNDER_REVIEW).count()
-    avg_under = qs.annotate(u=under_expr).filter(u__gt=0).aggregate(Avg('u'))['u__avg'] or 0
+    # counts come from the pre-aggregated ClaimStat rows, top 10 from the underpayment index
+    overview = stats.overview()
+    by_status = overview['by_status']
 
     ctx = {
-        'total': total,
-        'paid': paid,
-        'denied': denied,
-        'review': review,         # flagged = under review
-        'avg_under': avg_under,
-        'top_under': qs.annotate(u=under_expr).filter(u__gt=0).order_by('-u')[:10],
+        'total': overview['total'],
+        'paid': by_status.get(Claim.Status.PAID, 0),
+        'denied': by_status.get(Claim.Status.DENIED, 0),
+        'review': by_status.get(Claim.Status.UNDER_REVIEW, 0),  # flagged = under review
+        'avg_under': overview['avg_under'],
+        'top_under': columnar.top_underpaid(10),
     }
+    if ctx['top_under'] is None:  # column store off
+        ctx['top_under'] = Claim.objects.filter(underpayment__gt=0).order_by('-underpayment')[:10]
     return render(request, 'claims/admin_dashboard.html', ctx)
 
-def claim_list(request):
-    qs = Claim.objects.all().order_by('-discharge_date')
+def _analytics_request(request):
+    dimension = request.GET.get('dimension', 'insurer')
+    if dimension not in analytics.DIMENSIONS:
+        return None, None, None
+    filters = analytics.clean_filters(request.GET)
+    return dimension, filters, analytics.breakdown(dimension, filters)
+
+@staff_member_required
+def analytics_data(request):
+    """JSON breakdown: ?dimension=insurer|month|cpt plus optional status/insurer/date_from/date_to."""
+    dimension, filters, rows = _analytics_request(request)
+    if dimension is None:
+        return HttpResponseBadRequest("dimension must be one of: " + ", ".join(analytics.DIMENSIONS))
+    return JsonResponse({'dimension': dimension, 'filters': filters, 'rows': rows})
+
+@staff_member_required
+def analytics_chart(request):
+    # HTMX partial for the dashboard: same data as analytics_data, drawn as bars
+    dimension, filters, rows = _analytics_request(request)
+    if dimension is None:
+        return HttpResponseBadRequest("Unknown dimension")
+    html = render_to_string('claims/partials/analytics_chart.html', {
+        'dimension': dimension, 'rows': analytics.chart_rows(rows),
+    })
+    return HttpResponse(html)
+
+def _filter_claims(request):
+    """Shared filtering for the list page and its HTMX partial."""
+    qs = Claim.objects.all()
     term = request.GET.get('q', '').strip()
     status = request.GET.get('status', '')
     insurer = request.GET.get('insurer', '')
+    cpt = request.GET.get('cpt', '').strip()
 
     if term:
-        qs = qs.filter(
-            Q(claim_id__icontains=term) |
-            Q(patient_name__icontains=term) |
-            Q(insurer__icontains=term)
-        )
+        qs = search_claims(qs, term)
     if status:
         qs = qs.filter(status=status)
     if insurer:
         qs = qs.filter(insurer__icontains=insurer)
+    if cpt:
+        # exact code match through the ClaimCPT index (no "9920" matching "99204")
+        qs = qs.filter(pk__in=ClaimCPT.objects.filter(code=cpt).values('claim_id'))
+    return qs, term, status, insurer
+
+def _page_context(request, qs):
+    """One keyset page plus the query string the infinite-scroll sentinel fetches next."""
+    page = columnar.claims_page(request.GET)
+    claims, next_cursor = page if page is not None else keyset_page(qs, request.GET.get('cursor'))
+    return _next_page(request, claims, next_cursor)
 
-    insurers = Claim.objects.order_by().values_list('insurer', flat=True).distinct()
-    ctx = {'claims': qs[:50], 'insurers': insurers, 'term': term, 'status': status, 'insurer_val': insurer}
+def _next_page(request, claims, next_cursor):
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+    return {'claims': claims, 'next_cursor': next_cursor, 'next_query': next_query}
+
+def claim_list(request):
+    qs, term, status, insurer = _filter_claims(request)
+    # the insurer <datalist> is filled lazily by insurer_typeahead
+    ctx = {'term': term, 'status': status, 'insurer_val': insurer,
+           'cpt_val': request.GET.get('cpt', '').strip()}
+    ctx.update(_page_context(request, qs))
     return render(request, 'claims/claim_list.html', ctx)
 
-def claim_search(request):
-    # returns ONLY the <tbody> rows (HTMX swap)
-    qs = Claim.objects.all().order_by('-discharge_date')
-    term = request.GET.get('q', '').strip()
-    status = request.GET.get('status', '')
-    insurer = request.GET.get('insurer', '')
+async def claim_search(request):
+    # returns ONLY the <tbody> rows (HTMX swap); pass ?cursor= for the next page
+    async def render_rows():
+        page = await columnar.aclaims_page(request.GET)
+        if page is None:
+            await afts_available()  # search_claims() checks for the FTS table (cached after the first time)
+            qs, *_ = _filter_claims(request)
+            page = await akeyset_page(qs, request.GET.get('cursor'))
+        claims, next_cursor = page
+        return render_to_string('claims/partials/claim_rows.html', _next_page(request, claims, next_cursor))
 
-    if term:
-        qs = qs.filter(
-            Q(claim_id__icontains=term) |
-            Q(patient_name__icontains=term) |
-            Q(insurer__icontains=term)
-        )
-    if status:
-        qs = qs.filter(status=status)
-    if insurer:
-        qs = qs.filter(insurer__icontains=insurer)
+    html, hit = await fragments.aget_or_render(request.GET, render_rows)
+    response = HttpResponse(html)
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
 
-    html = render_to_string('claims/partials/claim_rows.html', {'claims': qs[:50]})
+INSURER_SUGGESTIONS = 10
+
+async def insurer_typeahead(request):
+    """<option>s for the insurer datalist: the biggest insurers whose name (or a word in it) starts with ?insurer=."""
+    # the per-insurer ClaimStat rows are the distinct insurer set, kept up to date on every claim write
+    prefix = ' '.join(request.GET.get('insurer', '').split())
+    qs = ClaimStat.objects.filter(dimension=ClaimStat.Dimension.INSURER, claims__gt=0)
+    if prefix:
+        qs = qs.filter(Q(key__istartswith=prefix) | Q(key__icontains=' ' + prefix))
+    names = qs.order_by('-claims', 'key').values_list('key', flat=True)[:INSURER_SUGGESTIONS]
+    html = render_to_string('claims/partials/insurer_options.html', {'insurers': [n async for n in names]})
     return HttpResponse(html)
 
-def claim_detail(request, pk):
-    claim = get_object_or_404(Claim, pk=pk)
-    form = NoteForm()
-    return render(request, 'claims/claim_detail.html', {'claim': claim, 'form': form})
+@staff_member_required
+def performance(request):
+    """Per-view latency / query / render numbers from PerformanceMiddleware."""
+    rows = []
+    for view, s in metrics.snapshot().items():
+        rows.append({
+            'view': view, 'count': s.count, 'avg_ms': s.seconds * 1000 / s.count,
+            'p50': s.percentile(0.5), 'p95': s.percentile(0.95),
+            'avg_queries': s.queries / s.count, 'max_queries': s.max_queries,
+            'db_ms': s.query_seconds * 1000 / s.count, 'render_ms': s.render_seconds * 1000 / s.count,
+            'avg_kb': s.bytes / 1024 / s.count, 'n_plus_one': s.n_plus_one,
+        })
+    rows.sort(key=lambda r: -r['avg_ms'] * r['count'])  # most total time first
+    return render(request, 'claims/performance.html', {
+        'rows': rows, 'n_plus_one': list(reversed(metrics.recent_n_plus_one)),
+        'sample_pct': round(metrics.sample_rate() * 100, 2),
+    })
 
-def flag_for_review(request, pk):
+def _staff_or_bearer(request, setting):
+    # staff session, or "Authorization: Bearer <settings.<setting>>" for a machine client
+    token = getattr(settings, setting, '')
+    bearer = request.headers.get('Authorization', '') == f'Bearer {token}'
+    return request.user.is_staff or bool(token and bearer)
+
+def prometheus_metrics(request):
+    if not _staff_or_bearer(request, 'CLAIMS_METRICS_TOKEN'):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4')
+
+def change_feed(request):
+    """ChangeLog entries after ?since=<seq> (JSON, ?limit= per page); see claims.changefeed."""
+    if not _staff_or_bearer(request, 'CLAIMS_FEED_TOKEN'):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        since = int(request.GET.get('since') or 0)
+        limit = int(request.GET.get('limit') or changefeed.DEFAULT_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+    return JsonResponse(changefeed.page(since, limit))
+
+@login_required
+def claim_export(request):
+    """The current claim_list filter as a streamed CSV download (?gzip=1 to compress)."""
+    qs, *_ = _filter_claims(request)
+    return export_response(qs.order_by(*ORDERING), compress=request.GET.get('gzip') == '1')
+
+@staff_member_required
+def search_cache_stats(request):
+    """Hit/miss counters of the claim_search fragment cache."""
+    return JsonResponse(fragments.counters())
+
+async def _notes_context(request, claim):
+    # one page of notes with their authors joined in, newest first
+    notes, next_cursor = await anotes_page(claim.notes.select_related('created_by'), request.GET.get('cursor'))
+    return {'claim': claim, 'notes': notes, 'next_notes_cursor': next_cursor}
+
+async def claim_detail(request, pk):
+    claim = await _aget_or_404(Claim.objects.prefetch_related('cpts'), pk=pk)
+    ctx = await _notes_context(request, claim)
+    ctx['form'] = NoteForm()
+    await aget_user(request)  # base.html shows who's signed in
+    return render(request, 'claims/claim_detail.html', ctx)
+
+async def claim_notes(request, pk):
+    # older notes for the HTMX "revealed" sentinel at the bottom of the notes panel
+    claim = await _aget_or_404(Claim.objects.only('pk'), pk=pk)
+    html = render_to_string('claims/partials/notes_page.html', await _notes_context(request, claim))
+    return HttpResponse(html)
+
+async def flag_for_review(request, pk):
     if request.method != 'POST':
         return HttpResponseBadRequest("POST only")
-    claim = get_object_or_404(Claim, pk=pk)
+    claim = await _aget_or_404(Claim.objects.all(), pk=pk)
     claim.status = Claim.Status.UNDER_REVIEW
-    claim.save(update_fields=['status'])
+    await claim.asave(update_fields=['status'])
     # return the updated badge snippet
     html = render_to_string('claims/partials/status_badge.html', {'claim': claim})
     return HttpResponse(html)
@@ -124,79 +251,33 @@ def generate_report(request, pk):
     return response
 
 
-from django.shortcuts import render, redirect
-from django.http import HttpResponseBadRequest
-from django.contrib.admin.views.decorators import staff_member_required
-from django.contrib import messages
-from .forms import CsvUploadForm
-from .models import Claim
-import csv
-from decimal import Decimal
-from datetime import datetime
-
-
-def _to_decimal(val):
-    from decimal import Decimal, InvalidOperation
-    try:
-        return Decimal(str(val).strip() or "0")
-    except (InvalidOperation, AttributeError):
-        return Decimal("0")
-
-def _to_date(val):
-    s = (val or "").strip()
-    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%d-%m-%Y"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except ValueError:
-            pass
-    try:
-        return datetime.fromisoformat(s).date()
-    except Exception:
-        return None
-
 @staff_member_required
 def csv_upload(request):
-    """Upload claims from a pipe-delimited CSV file."""
+    """Save the uploaded pipe-delimited files and queue them for run_import_worker."""
     form = CsvUploadForm(request.POST or None, request.FILES or None)
 
     if request.method == "POST":
         if form.is_valid():
-            mode = form.cleaned_data["mode"]
-            list_file = form.cleaned_data["list_file"]
-
-            # Read as UTF-8 text
-            try:
-                text = list_file.read().decode("utf-8")
-            except Exception:
-                return HttpResponseBadRequest("Could not decode file as UTF-8")
-
-            reader = csv.DictReader(text.splitlines(), delimiter="|")
-
-            if mode == "overwrite":
-                Claim.objects.all().delete()
-
-            created, updated = 0, 0
-            for row in reader:
-                claim_id = int(row.get("claim_id", 0))
-                defaults = {
-                    "patient_name": row.get("patient_name", ""),
-                    "billed_amount": Decimal(row.get("billed_amount") or 0),
-                    "paid_amount": Decimal(row.get("paid_amount") or 0),
-                    "status": row.get("status") or Claim.Status.UNDER_REVIEW,
-                    "insurer": row.get("insurer", ""),
-                    "discharge_date": datetime.strptime(row.get("discharge_date"), "%Y-%m-%d").date(),
-                    "cpt_codes": row.get("cpt_codes", ""),
-                    "denial_reason": row.get("denial_reason", ""),
-                }
-                obj, created_flag = Claim.objects.update_or_create(
-                    claim_id=claim_id, defaults=defaults
-                )
-                if created_flag:
-                    created += 1
-                else:
-                    updated += 1
-
-            messages.success(request, f"Upload complete. Created {created}, Updated {updated}.")
-            return redirect("claims:list")
-
-    return render(request, "claims/csv_upload.html", {"form": form})
\ No newline at end of file
+            job = enqueue_import(
+                form.cleaned_data["list_file"],
+                form.cleaned_data.get("detail_file"),
+                mode=form.cleaned_data["mode"],
+                user=request.user,
+            )
+            return redirect("claims:import_job", pk=job.pk)
+
+    return render(request, "claims/csv_upload.html", {"form": form})
+
+
+@staff_member_required
+def import_job(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    return render(request, "claims/import_job.html", {"job": job})
+
+
+@staff_member_required
+def import_job_progress(request, pk):
+    # polled by HTMX every 2s while the job is queued/running
+    job = get_object_or_404(ImportJob, pk=pk)
+    html = render_to_string('claims/partials/import_job_progress.html', {'job': job})
+    return HttpResponse(html)
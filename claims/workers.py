@@ -0,0 +1,12 @@
+"""
+Process pool setup shared by the multi-process report builder
+(claims.reports) and import parser (claims.parallel_import).
+"""
+
+
+def init_worker():
+    """ProcessPoolExecutor initializer: forked workers inherit a configured Django; spawned ones start from scratch."""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
@@ -33,7 +33,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # <- add WhiteNoise
+    "claims.middleware.StaticFilesMiddleware",  # <- WhiteNoise (async-capable wrapper, see claims/middleware.py)
+    "claims.middleware.PerformanceMiddleware",  # sampled per-view timings, see /claims/performance/
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -45,7 +46,7 @@ MIDDLEWARE = [
 ROOT_URLCONF = "erisa_challenge.urls"
 
 TEMPLATES = [{
-    "BACKEND": "django.template.backends.django.DjangoTemplates",
+    "BACKEND": "claims.metrics.TimedDjangoTemplates",  # DjangoTemplates + render timings for PerformanceMiddleware
     "DIRS": [BASE_DIR / "templates"],
     "APP_DIRS": True,
     "OPTIONS": {
@@ -69,6 +70,41 @@ DATABASES = {
     )
 }
 
+# --- Caches ---
+# "fragments" holds rendered claim_search rows (see claims.fragments). LocMem
+# evicts least-recently-used entries but is per process; set FRAGMENT_CACHE_DIR
+# to a shared directory so every web/worker process sees the same invalidations.
+FRAGMENT_CACHE_DIR = os.environ.get("FRAGMENT_CACHE_DIR")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "fragments": {
+        "BACKEND": (
+            "django.core.cache.backends.filebased.FileBasedCache" if FRAGMENT_CACHE_DIR
+            else "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": FRAGMENT_CACHE_DIR or "claims-fragments",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("FRAGMENT_CACHE_ENTRIES", "1000"))},
+    },
+}
+
+# --- Request metrics (claims.middleware.PerformanceMiddleware) ---
+CLAIMS_METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "0.1"))
+CLAIMS_METRICS_N_PLUS_ONE = 10  # same SQL this many times in one request = N+1 suspect
+CLAIMS_METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # lets a Prometheus scraper in without a session
+
+# --- Import worker (run_import_worker) ---
+CLAIMS_IMPORT_HEARTBEAT = 30  # seconds between a running job's heartbeats
+CLAIMS_IMPORT_STALE_AFTER = 300  # a RUNNING job this long without a heartbeat is requeued
+CLAIMS_IMPORT_MAX_ATTEMPTS = 3  # ...until it has been started this many times; then it fails
+
+# --- Change feed (/claims/changes/) ---
+CLAIMS_FEED_TOKEN = os.environ.get("FEED_TOKEN", "")  # bearer token for sync consumers without a session
+CLAIMS_CHANGE_LOG_KEEP_DAYS = 7  # compact_change_log leaves newer entries alone
+
+# --- In-memory claim columns for list/search (claims.columnar); needs numpy ---
+CLAIMS_COLUMNAR = os.environ.get("CLAIMS_COLUMNAR", "0") == "1"
+
 # --- Internationalization ---
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "UTC"
@@ -83,6 +119,10 @@ if (BASE_DIR / "static").exists():      # keep dev assets if the folder exists
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# --- Uploaded files (CSV import jobs wait here for run_import_worker) ---
+MEDIA_URL = "/media/"
+MEDIA_ROOT = Path(os.environ.get("MEDIA_ROOT", BASE_DIR / "media"))
+
 # --- SSL/proxy (safe for Render; still OK locally with DEBUG=1) ---
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 SESSION_COOKIE_SECURE = not DEBUG